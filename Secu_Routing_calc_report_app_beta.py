@@ -44,29 +44,34 @@ def process_data(csv_file_path, excel_path, date_option):
     else:
         raise ValueError("Invalid date option selected")
 
+    # Days between first and last signal, only where both dates are known
+    first = df_copy['FirstSignalDate'].to_numpy()
+    last = df_copy['LastSignalDate'].to_numpy()
+    known = ~(np.isnat(first) | np.isnat(last))
+    signal_days = np.zeros(len(df_copy), dtype=np.int64)
+    signal_days[known] = (last[known] - first[known]) // np.timedelta64(1, 'D')
+
     # Create 'DeviceActive' column
-    df_copy['DeviceActive'] = 'Inactive'
-    df_copy.loc[
-        (df_copy['LastSignalDate'] > start_date) &
-        (df_copy['LastSignalDate'] < end_date) &
-        ((df_copy['LastSignalDate'] - df_copy['FirstSignalDate']).dt.days > 10) &
-        (df_copy['ItemCode'].isin(['17300', '15300'])),
-        'DeviceActive'
-    ] = 'Active'
-
-    # Create 'DaysActive' column
-    df_copy['DaysActive'] = 0
-    df_copy.loc[
-        df_copy['DeviceActive'] == 'Active',
-        'DaysActive'
-    ] = df_copy.apply(
-        lambda row: (row['LastSignalDate'] - row['FirstSignalDate']).days 
-        if row['FirstSignalDate'] > pd.Timestamp(f'{current_year}-03-30') 
-        else (row['LastSignalDate'] - start_date).days, axis=1
+    active = (
+        known &
+        (last > start_date.to_datetime64()) &
+        (last < end_date.to_datetime64()) &
+        (signal_days > 10) &
+        df_copy['ItemCode'].isin(['17300', '15300']).to_numpy()
+    )
+    df_copy['DeviceActive'] = np.where(active, 'Active', 'Inactive')
+
+    # Create 'DaysActive' column, measured only over the active rows
+    days_active = np.zeros(len(df_copy), dtype=np.int64)
+    days_active[active] = np.where(
+        first[active] > pd.Timestamp(f'{current_year}-03-30').to_datetime64(),
+        signal_days[active],
+        (last[active] - start_date.to_datetime64()) // np.timedelta64(1, 'D')
     )
+    df_copy['DaysActive'] = days_active
 
-    # Create 'MonthsActive' column
-    df_copy['MonthsActive'] = (df_copy['DaysActive'] / 30).apply(lambda x: -(-x // 1))  # Ceiling division
+    # Create 'MonthsActive' column (ceiling division)
+    df_copy['MonthsActive'] = np.ceil(days_active / 30)
 
     # Create 'Fee ex VAT' column
     df_copy['Fee ex VAT'] = df_copy['MonthsActive'] * df_copy['Amount']
@@ -0,0 +1,94 @@
+"""Time the reconciliation of two billing runs on synthetic extracts and save the results as JSON.
+
+Usage: python benchmarks/bench_reconcile.py [--sizes 1m 5m] [--output results.json]
+
+Each extract is billed for both half-year periods, which changes the status of most devices, and
+the two runs are reconciled. Billing happens before the clock starts; the join and diff
+(reconcile) and the sheet (write_reconciliation) are timed separately.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from bench_report import extract_path, git_revision, peak_rss_mb  # noqa: E402
+from billing_engine import DATE_OPTIONS  # noqa: E402
+from extract_generator import EXTRACT_SIZES, default_sabre_codes, parse_size  # noqa: E402
+from reconcile import load_run, reconcile, write_reconciliation  # noqa: E402
+
+DEFAULT_SIZES = ['100k', '1m']
+
+
+def run_reconcile(csv_file_path, excel_path, previous_option, current_option):
+    """Bill the extract for both periods, then reconcile the runs and return the measurements."""
+    previous = load_run(csv_file_path, previous_option)
+    current = load_run(csv_file_path, current_option)
+
+    start = time.perf_counter()
+    result = reconcile(previous, current)
+    reconcile_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    write_reconciliation(excel_path, result)
+    write_seconds = time.perf_counter() - start
+    return {
+        'billable_rows': len(current),
+        'device_changes': len(result.device_changes),
+        'sabre_codes_changed': len(result.sabre_deltas) - 1,
+        'reconcile_seconds': round(reconcile_seconds, 4),
+        'write_seconds': round(write_seconds, 4),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the reconciliation of two billing runs.')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                        help=f"row counts or names ({', '.join(EXTRACT_SIZES)}); default: %(default)s")
+    parser.add_argument('--sabre-codes', type=int, default=None,
+                        help='distinct SabreCodes per extract (default: one per 100 rows)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'secu_arrears_bench'),
+                        help='directory for the generated extracts (default: %(default)s)')
+    parser.add_argument('--output', default='bench_reconcile.json', help='JSON results file (default: %(default)s)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.data_dir, exist_ok=True)
+    previous_option, current_option = DATE_OPTIONS
+    runs = []
+    for size in args.sizes:
+        n_rows = parse_size(size)
+        n_sabre_codes = args.sabre_codes or default_sabre_codes(n_rows)
+        csv_file_path = extract_path(args.data_dir, n_rows, n_sabre_codes, args.seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run_reconcile(csv_file_path, os.path.join(tmp, 'reconciliation.xlsx'), previous_option,
+                                   current_option)
+        runs.append(dict(size=size, seed=args.seed, **result))
+        print(f"{size:>5} rows: reconcile {result['reconcile_seconds']:.2f}s, write {result['write_seconds']:.2f}s, "
+              f"{result['device_changes']} device changes")
+
+    results = {
+        'git_revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'previous_period': previous_option,
+        'current_period': current_option,
+        'runs': runs
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
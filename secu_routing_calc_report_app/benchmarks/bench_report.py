@@ -0,0 +1,190 @@
+"""Time every stage of report generation on synthetic extracts and save the results as JSON.
+
+Usage: python benchmarks/bench_report.py [--sizes 10k 100k 1m] [--sabre-codes N] [--output results.json]
+
+Each size runs in a fresh Python process, so the peak memory reported is that run's alone.
+Generated extracts are kept in --data-dir and reused by later runs with the same arguments.
+5m rows is more than an Excel sheet can hold; its 'Updated Data' sheet is still written for timing.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+import pandas as pd  # noqa: E402
+from openpyxl import Workbook  # noqa: E402
+
+from arrears_report import billing_dates  # noqa: E402
+from billing_engine import BILLABLE_ITEM_CODES, SummaryAccumulator, classify_devices, finish_summary  # noqa: E402
+from extract_generator import EXTRACT_SIZES, default_sabre_codes, generate_extract, parse_size  # noqa: E402
+from extract_reader import read_extract  # noqa: E402
+from report_writer import REPORT_TITLE, create_named_styles, write_detail_sheet, write_summary_sheet  # noqa: E402
+
+DEFAULT_SIZES = ['10k', '100k', '1m']
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB, or None if it cannot be read."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 2 ** 20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+class StageTimer:
+    """Collect the wall time, and optionally the tracemalloc peak, of named stages."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        yield
+        result = {'seconds': round(time.perf_counter() - start, 4)}
+        if self.trace_memory:
+            result['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        self.stages[name] = result
+
+
+def run_stages(csv_file_path, excel_path, date_option, trace_memory=False):
+    """Generate one report stage by stage, as process_data does, and return the measurements."""
+    if trace_memory:
+        tracemalloc.start()
+    timer = StageTimer(trace_memory)
+    start_date, end_date, cutoff_date = billing_dates(date_option)
+
+    with timer.stage('read'):
+        df = read_extract(csv_file_path)
+    # DeviceActive, DaysActive, MonthsActive and Fee ex VAT are computed together in one vectorized step
+    with timer.stage('classification'):
+        classify_devices(df, start_date, end_date, cutoff_date)
+    with timer.stage('filter'):
+        df_filtered = df[df['ItemCode'].isin(BILLABLE_ITEM_CODES)].copy()
+    with timer.stage('groupby'):
+        accumulator = SummaryAccumulator()
+        accumulator.add(df_filtered)
+        totals = accumulator.totals()
+    with timer.stage('summary columns'):
+        summary_df = finish_summary(totals)
+
+    wb = Workbook(write_only=True)
+    currency_format, number_format = create_named_styles()
+    with timer.stage('summary styling'):
+        write_summary_sheet(wb.create_sheet(title='Summary'), summary_df, REPORT_TITLE, currency_format)
+    with timer.stage('detail write'):
+        write_detail_sheet(wb.create_sheet(title='Updated Data'), df_filtered, currency_format, number_format)
+    with timer.stage('save'):
+        wb.save(excel_path)
+
+    return {
+        'rows': len(df),
+        'billable_rows': len(df_filtered),
+        'active_rows': int((df_filtered['DeviceActive'] == 'Active').sum()),
+        'sabre_codes': len(summary_df) - 2,
+        'stages': timer.stages,
+        'total_seconds': round(sum(stage['seconds'] for stage in timer.stages.values()), 4),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def extract_path(data_dir, n_rows, n_sabre_codes, seed):
+    """Return the cached synthetic extract for the arguments, generating it first if needed."""
+    csv_file_path = os.path.join(data_dir, f'extract_{n_rows}_{n_sabre_codes}_{seed}.csv')
+    if not os.path.exists(csv_file_path):
+        generate_extract(csv_file_path, n_rows, n_sabre_codes, seed)
+    return csv_file_path
+
+
+def run_in_subprocess(csv_file_path, date_option, trace_memory):
+    """Run run_stages in a fresh interpreter and return its measurements."""
+    with tempfile.TemporaryDirectory() as tmp:
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', csv_file_path,
+                   '--excel', os.path.join(tmp, 'report.xlsx'), '--period', date_option]
+        if trace_memory:
+            command.append('--tracemalloc')
+        completed = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(completed.stdout)
+
+
+def git_revision():
+    """Return the current git commit of the repository, or None outside a git checkout."""
+    try:
+        completed = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__),
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return completed.stdout.strip() or None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark report generation on synthetic extracts.')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                        help=f"row counts or names ({', '.join(EXTRACT_SIZES)}); default: %(default)s")
+    parser.add_argument('--sabre-codes', type=int, default=None,
+                        help='distinct SabreCodes per extract (default: one per 100 rows)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--period', default='April - September')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'secu_arrears_bench'),
+                        help='directory for the generated extracts (default: %(default)s)')
+    parser.add_argument('--output', default='bench_report.json', help='JSON results file (default: %(default)s)')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='also record the traced memory peak of every stage (slows the run down)')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    parser.add_argument('--excel', help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.run_one:
+        json.dump(run_stages(args.run_one, args.excel, args.period, args.tracemalloc), sys.stdout)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    runs = []
+    for size in args.sizes:
+        n_rows = parse_size(size)
+        n_sabre_codes = args.sabre_codes or default_sabre_codes(n_rows)
+        csv_file_path = extract_path(args.data_dir, n_rows, n_sabre_codes, args.seed)
+        result = run_in_subprocess(csv_file_path, args.period, args.tracemalloc)
+        runs.append(dict(size=size, seed=args.seed, **result))
+        stages = '  '.join(f"{name} {stage['seconds']:.2f}s" for name, stage in result['stages'].items())
+        print(f"{size:>5} rows, {n_sabre_codes} SabreCodes: {result['total_seconds']:.2f}s, "
+              f"peak {result['peak_rss_mb']:.0f} MB | {stages}")
+
+    results = {
+        'git_revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'period': args.period,
+        'runs': runs
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
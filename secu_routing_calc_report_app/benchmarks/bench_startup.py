@@ -0,0 +1,98 @@
+"""Measure the cold import time of the GUI module with python -X importtime and save the results as JSON.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--max-ms 250] [--output results.json]
+
+Every run imports the module in a fresh interpreter, so nothing is cached in sys.modules. The run
+fails, with exit status 1, when the median import time exceeds --max-ms. Heavy modules imported at
+startup are listed in the report; tests/test_startup.py is the check that the GUI loads none of them.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from bench_report import git_revision  # noqa: E402
+
+GUI_MODULE = 'Secu_Routing_calc_report_app'
+
+# Modules listed in the report when the module imports them at startup
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'PIL', 'pyarrow', 'xlsxwriter']
+
+DEFAULT_MAX_MS = 250
+
+
+def import_times(module):
+    """Import module in a fresh interpreter and return {imported module: cumulative microseconds}."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get('PYTHONPATH')])))
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               check=True, stderr=subprocess.PIPE, text=True, env=env)
+    times = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Measure the cold import time of the GUI module.')
+    parser.add_argument('--module', default=GUI_MODULE, help='module to import (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to time (default: %(default)s)')
+    parser.add_argument('--max-ms', type=float, default=DEFAULT_MAX_MS,
+                        help='fail when the median import time exceeds this (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list (default: %(default)s)')
+    parser.add_argument('--output', default='bench_startup.json', help='JSON results file (default: %(default)s)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    totals_ms = [times[args.module] / 1000 for times in runs]
+    median_ms = statistics.median(totals_ms)
+
+    # Nested imports are listed under their own names, so the slowest entries show what startup waits for
+    last = runs[-1]
+    slowest = sorted((name for name in last if name != args.module), key=last.get, reverse=True)[:args.top]
+    heavy = sorted({name.split('.')[0] for name in last} & set(HEAVY_MODULES))
+
+    print(f"{args.module}: median {median_ms:.1f} ms over {args.runs} runs "
+          f"(min {min(totals_ms):.1f}, max {max(totals_ms):.1f})")
+    for name in slowest:
+        print(f"  {last[name] / 1000:8.1f} ms  {name}")
+    if heavy:
+        print(f"Heavy modules imported at startup: {', '.join(heavy)}")
+
+    results = {
+        'git_revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'module': args.module,
+        'import_ms': [round(total, 2) for total in totals_ms],
+        'median_ms': round(median_ms, 2),
+        'max_ms': args.max_ms,
+        'heavy_modules': heavy,
+        'slowest': {name: round(last[name] / 1000, 2) for name in slowest}
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if median_ms > args.max_ms:
+        print(f"FAILED: startup must take at most {args.max_ms:g} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Compare the single-pass SummaryAccumulator against the previous lambda groupby aggregation.
+
+Usage: python benchmarks/bench_summary_groupby.py [number of SabreCodes ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from billing_engine import SummaryAccumulator  # noqa: E402
+
+ROWS_PER_CODE = 20
+
+
+def make_filtered(n_codes, rows_per_code=ROWS_PER_CODE, seed=0):
+    """Return a synthetic classified, billable df_filtered with n_codes SabreCodes."""
+    rng = np.random.default_rng(seed)
+    n_rows = n_codes * rows_per_code
+    codes = rng.integers(0, n_codes, n_rows)
+    return pd.DataFrame({
+        'SabreCode': pd.Categorical([f'S{code:06d}' for code in codes]),
+        'Branch': pd.Categorical([f'Branch {code % 50}' for code in codes]),
+        'ItemCode': pd.Categorical(rng.choice(['17300', '15300'], n_rows)),
+        'DeviceActive': np.where(rng.random(n_rows) < 0.6, 'Active', 'Inactive'),
+        'Fee ex VAT': rng.choice([0.0, 99.0, 120.5, 297.0, 594.0], n_rows),
+    })
+
+
+def lambda_groupby(df_filtered):
+    """Aggregate df_filtered with the per-group lambdas process_data used to use."""
+    return df_filtered.groupby('SabreCode', observed=True).agg(
+        Branch=('Branch', 'first'),
+        ItemCode_17300=('Fee ex VAT', lambda x: x[df_filtered['ItemCode'] == '17300'].sum()),
+        ItemCode_15300=('Fee ex VAT', lambda x: x[df_filtered['ItemCode'] == '15300'].sum()),
+        TotalActive=('DeviceActive', lambda x: (x == 'Active').sum()),
+        Total_ex_VAT=('Fee ex VAT', 'sum')
+    ).reset_index()
+
+
+def accumulate(df_filtered):
+    """Aggregate df_filtered in one vectorized pass through SummaryAccumulator."""
+    accumulator = SummaryAccumulator()
+    accumulator.add(df_filtered)
+    return accumulator.totals()
+
+
+def timed(func, df_filtered):
+    """Return (seconds, result) for one call of func."""
+    start = time.perf_counter()
+    result = func(df_filtered)
+    return time.perf_counter() - start, result
+
+
+def main(sizes):
+    print(f"{'SabreCodes':>10} {'rows':>9} {'lambdas (s)':>12} {'single pass (s)':>16} {'speed-up':>9}")
+    for n_codes in sizes:
+        df_filtered = make_filtered(n_codes)
+        lambdas, expected = timed(lambda_groupby, df_filtered)
+        single, result = timed(accumulate, df_filtered)
+        columns = ['ItemCode_17300', 'ItemCode_15300', 'TotalActive', 'Total_ex_VAT']
+        assert np.allclose(result[columns].to_numpy(dtype=float), expected[columns].to_numpy(dtype=float))
+        print(f"{n_codes:>10} {len(df_filtered):>9} {lambdas:>12.2f} {single:>16.3f} {lambdas / single:>8.0f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 2500, 5000, 10000])
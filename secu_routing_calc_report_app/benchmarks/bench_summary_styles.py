@@ -0,0 +1,148 @@
+"""Compare the Summary style plan against the previous per-concern iter_rows sweeps.
+
+Usage: python benchmarks/bench_summary_styles.py [number of SabreCodes ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.styles import Font, Border
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from report_writer import (BOLD_FONT, BORDER_STYLE, HEADER_ALIGNMENT, HEADER_FILL, HEADER_FONT, RED_FONT,  # noqa: E402
+                           SUMMARY_CURRENCY_COLS, THICK_SIDE, TITLE_FONT, TOTAL_EX_VAT_BORDER,
+                           create_named_styles, summary_display_values, write_summary_sheet)
+
+
+def make_summary(n_codes, seed=0):
+    """Return a synthetic summary_df with n_codes SabreCodes plus the blank and 'Total' rows."""
+    rng = np.random.default_rng(seed)
+    fee_17300 = rng.choice([0.0, 99.0, 297.0, 594.0], n_codes)
+    fee_15300 = rng.choice([0.0, 120.5, 241.0], n_codes)
+    active = rng.integers(0, 40, n_codes)
+    total = fee_17300 + fee_15300
+    split = np.divide(fee_15300, fee_17300, out=np.zeros(n_codes), where=fee_17300 != 0)
+    summary_df = pd.DataFrame({
+        'SabreCode': [f'S{i:06d}' for i in range(n_codes)],
+        'Branch': [f'Branch {i % 50}' for i in range(n_codes)],
+        '17300': fee_17300,
+        '15300': fee_15300,
+        'TotalActive': active,
+        'Total_ex_VAT': total,
+        'Price Per Unit': np.where(active > 0, total / np.maximum(active, 1), np.nan),
+        '% Split': split,
+        '% 15300': np.round(active * split),
+        '% 17300': active - np.round(active * split),
+    })
+    tail = pd.DataFrame({'SabreCode': [None, 'Total'], 'Total_ex_VAT': [None, total.sum()]})
+    return pd.concat([summary_df, tail], ignore_index=True)
+
+
+def sweep_summary_sheet(ws, summary_df, title, currency_format):
+    """Format the Summary sheet with one iter_rows sweep per concern, as process_data used to."""
+    summary_df = summary_display_values(summary_df)
+    for c_idx, col_name in enumerate(summary_df.columns, 3):
+        ws.cell(row=3, column=c_idx, value=col_name)
+    values = summary_df.astype(object).where(summary_df.notna(), None)
+    for r_idx, row in enumerate(values.itertuples(index=False, name=None), 5):
+        for c_idx, value in enumerate(row, 3):
+            if value is not None:
+                ws.cell(row=r_idx, column=c_idx, value=value)
+    ws.row_dimensions[4].height = 7.5
+    ws.merge_cells('D1:H1')
+    ws['D1'].value = title
+    ws['D1'].font = TITLE_FONT
+
+    for col in SUMMARY_CURRENCY_COLS:
+        if col in summary_df.columns:
+            col_letter = chr(ord('A') + summary_df.columns.get_loc(col) + 2)
+            for cell in ws[col_letter][4:]:
+                cell.style = currency_format
+    col_letter = chr(ord('A') + summary_df.columns.get_loc('% Split') + 2)
+    for cell in ws[col_letter][4:]:
+        if cell.value == 0:
+            cell.value = '-'
+        else:
+            cell.number_format = '0%'
+    split_index = summary_df.columns.get_loc('% Split')
+    for name in ('% 17300', '% 15300'):
+        index = summary_df.columns.get_loc(name)
+        for row in ws.iter_rows(min_row=5, max_row=ws.max_row, min_col=3, max_col=ws.max_column):
+            if row[split_index].value == '-' or row[index].value == 0:
+                row[index].value = '-'
+    for cell in ws[3][2:]:
+        cell.fill = HEADER_FILL
+        cell.font = HEADER_FONT
+        cell.alignment = HEADER_ALIGNMENT
+        cell.border = BORDER_STYLE
+    total_index = summary_df.columns.get_loc('Total_ex_VAT')
+    for row in ws.iter_rows(min_row=5, max_row=ws.max_row, min_col=3, max_col=ws.max_column):
+        if row[total_index].value is not None and row[total_index].value == 0:
+            for cell in row:
+                cell.font = RED_FONT
+    for row in ws.iter_rows(min_row=5, max_row=ws.max_row, min_col=total_index + 3, max_col=total_index + 3):
+        if row[0].value is not None and row[0].value > 0:
+            row[0].font = BOLD_FONT
+    for cell in ws[ws.max_row]:
+        cell.font = Font(bold=True)
+    ws.cell(row=ws.max_row, column=total_index + 3).border = TOTAL_EX_VAT_BORDER
+    ws.sheet_view.showGridLines = False
+    for row in ws.iter_rows(min_row=5, max_row=ws.max_row - 2, min_col=3, max_col=ws.max_column):
+        for cell in row:
+            cell.border = BORDER_STYLE
+    ws.row_dimensions[ws.max_row - 1].height = 7.5
+    for row in ws.iter_rows(min_row=5, max_row=ws.max_row - 2, min_col=3, max_col=ws.max_column):
+        for cell in row:
+            if cell.row == 5:
+                cell.border = Border(top=THICK_SIDE, left=cell.border.left, right=cell.border.right,
+                                     bottom=cell.border.bottom)
+            if cell.row == ws.max_row - 2:
+                cell.border = Border(bottom=THICK_SIDE, left=cell.border.left, right=cell.border.right,
+                                     top=cell.border.top)
+            if cell.column == 3:
+                cell.border = Border(left=THICK_SIDE, top=cell.border.top, right=cell.border.right,
+                                     bottom=cell.border.bottom)
+            if cell.column == ws.max_column:
+                cell.border = Border(right=THICK_SIDE, top=cell.border.top, left=cell.border.left,
+                                     bottom=cell.border.bottom)
+
+
+def time_sweeps(summary_df, path):
+    """Return the seconds taken to build and save the Summary with the per-concern sweeps."""
+    start = time.perf_counter()
+    wb = Workbook()
+    currency_format, _ = create_named_styles()
+    sweep_summary_sheet(wb.active, summary_df, "SECU 6 month Active billing", currency_format)
+    wb.save(path)
+    return time.perf_counter() - start
+
+
+def time_style_plan(summary_df, path):
+    """Return the seconds taken to build and save the Summary from the style plan."""
+    start = time.perf_counter()
+    wb = Workbook(write_only=True)
+    currency_format, _ = create_named_styles()
+    write_summary_sheet(wb.create_sheet(title='Summary'), summary_df, "SECU 6 month Active billing",
+                        currency_format)
+    wb.save(path)
+    return time.perf_counter() - start
+
+
+def main(sizes):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'summary.xlsx')
+        print(f"{'SabreCodes':>10} {'sweeps (s)':>11} {'style plan (s)':>15} {'speed-up':>9}")
+        for n_codes in sizes:
+            summary_df = make_summary(n_codes)
+            sweeps = time_sweeps(summary_df, path)
+            plan = time_style_plan(summary_df, path)
+            print(f"{n_codes:>10} {sweeps:>11.2f} {plan:>15.2f} {sweeps / plan:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [250, 500, 1000, 2000])
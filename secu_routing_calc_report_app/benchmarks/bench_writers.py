@@ -0,0 +1,107 @@
+"""Compare the openpyxl and XlsxWriter workbook backends on synthetic extracts and save the results as JSON.
+
+Usage: python benchmarks/bench_writers.py [--sizes 100k 1m] [--writers openpyxl xlsxwriter] [--output results.json]
+
+Every (size, writer) pair runs in a fresh Python process, so the peak memory reported is that run's
+alone. The extract is read and billed before the clock starts; only write_report is timed.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from arrears_report import build_report  # noqa: E402
+from bench_report import extract_path, git_revision, peak_rss_mb  # noqa: E402
+from extract_generator import EXTRACT_SIZES, default_sabre_codes, parse_size  # noqa: E402
+from report_metrics import ReportMetrics  # noqa: E402
+from report_writer import WRITER_BACKENDS, write_report  # noqa: E402
+
+DEFAULT_SIZES = ['100k', '1m']
+
+
+def run_writer(csv_file_path, excel_path, date_option, writer):
+    """Bill the extract, then write its report with one backend and return the measurements."""
+    summary_df, df_filtered = build_report(csv_file_path, date_option)
+    rss_before_write = peak_rss_mb()
+
+    metrics = ReportMetrics(sidecar=False)
+    metrics.start()
+    write_report(excel_path, summary_df, df_filtered, metrics=metrics, writer=writer)
+    metrics.stop()
+    return {
+        'billable_rows': len(df_filtered),
+        'stages': {name: round(stage['wall_seconds'], 4) for name, stage in metrics.stages.items()},
+        'write_seconds': round(metrics.total_seconds, 4),
+        'file_mb': round(os.path.getsize(excel_path) / 2 ** 20, 1),
+        'peak_rss_mb_before_write': rss_before_write,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def run_in_subprocess(csv_file_path, date_option, writer):
+    """Run run_writer in a fresh interpreter and return its measurements."""
+    with tempfile.TemporaryDirectory() as tmp:
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', csv_file_path,
+                   '--excel', os.path.join(tmp, 'report.xlsx'), '--period', date_option, '--writers', writer]
+        completed = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(completed.stdout)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the workbook writer backends on synthetic extracts.')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                        help=f"row counts or names ({', '.join(EXTRACT_SIZES)}); default: %(default)s")
+    parser.add_argument('--writers', nargs='+', choices=WRITER_BACKENDS, default=WRITER_BACKENDS)
+    parser.add_argument('--sabre-codes', type=int, default=None,
+                        help='distinct SabreCodes per extract (default: one per 100 rows)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--period', default='April - September')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'secu_arrears_bench'),
+                        help='directory for the generated extracts (default: %(default)s)')
+    parser.add_argument('--output', default='bench_writers.json', help='JSON results file (default: %(default)s)')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    parser.add_argument('--excel', help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.run_one:
+        json.dump(run_writer(args.run_one, args.excel, args.period, args.writers[0]), sys.stdout)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    runs = []
+    for size in args.sizes:
+        n_rows = parse_size(size)
+        n_sabre_codes = args.sabre_codes or default_sabre_codes(n_rows)
+        csv_file_path = extract_path(args.data_dir, n_rows, n_sabre_codes, args.seed)
+        for writer in args.writers:
+            result = run_in_subprocess(csv_file_path, args.period, writer)
+            runs.append(dict(size=size, writer=writer, seed=args.seed, **result))
+            print(f"{size:>5} rows, {writer:>10}: write {result['write_seconds']:.2f}s, "
+                  f"{result['file_mb']:.0f} MB file, peak {result['peak_rss_mb']:.0f} MB "
+                  f"({result['peak_rss_mb_before_write']:.0f} MB before writing)")
+
+    results = {
+        'git_revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'period': args.period,
+        'runs': runs
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Seeded generator for synthetic SECU device extracts.
+
+Usage: python benchmarks/extract_generator.py out.csv --rows 1m --sabre-codes 5000 [--seed 0]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Named extract sizes used by the benchmarks
+EXTRACT_SIZES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '5m': 5_000_000
+}
+
+# Item codes with their share of rows and the monthly amounts billed for them
+ITEM_CODES = ['17300', '15300', '17400', '16300', '99000']
+ITEM_CODE_SHARES = [0.45, 0.30, 0.10, 0.10, 0.05]
+ITEM_AMOUNTS = {
+    '17300': [99.0, 120.5, 150.0],
+    '15300': [85.0, 99.0],
+    '17400': [180.0],
+    '16300': [45.0, 60.0],
+    '99000': [0.0]
+}
+
+# Share of rows with a missing signal date or Branch, as seen in production extracts
+MISSING_DATE_SHARE = 0.02
+MISSING_BRANCH_SHARE = 0.01
+
+# Devices first signal at some point in the two years before this date
+LATEST_SIGNAL_DATE = np.datetime64('2026-12-31')
+FIRST_SIGNAL_SPAN_DAYS = 730
+
+BLOCK_ROWS = 500_000
+
+
+def parse_size(value):
+    """Return the row count for a named size such as '100k' or a plain number."""
+    return EXTRACT_SIZES[value.lower()] if value.lower() in EXTRACT_SIZES else int(value)
+
+
+def default_sabre_codes(n_rows):
+    """Return the SabreCode cardinality used when none is given: one per 100 rows, at least 10."""
+    return max(10, n_rows // 100)
+
+
+def extract_block(rng, first_device_id, n_rows, n_sabre_codes, n_branches):
+    """Return one block of n_rows synthetic extract rows."""
+    sabre_index = rng.integers(0, n_sabre_codes, n_rows)
+    item_codes = rng.choice(ITEM_CODES, n_rows, p=ITEM_CODE_SHARES)
+    amounts = np.empty(n_rows)
+    for item_code, choices in ITEM_AMOUNTS.items():
+        is_code = item_codes == item_code
+        amounts[is_code] = rng.choice(choices, is_code.sum())
+
+    # Most devices signal for weeks or months; a few only for a handful of days
+    first = LATEST_SIGNAL_DATE - rng.integers(0, FIRST_SIGNAL_SPAN_DAYS, n_rows).astype('timedelta64[D]')
+    duration = np.where(rng.random(n_rows) < 0.15, rng.integers(0, 15, n_rows), rng.integers(15, 400, n_rows))
+    last = np.minimum(first + duration.astype('timedelta64[D]'), LATEST_SIGNAL_DATE)
+    first_text = np.datetime_as_string(first, unit='D').astype(object)
+    last_text = np.datetime_as_string(last, unit='D').astype(object)
+    first_text[rng.random(n_rows) < MISSING_DATE_SHARE] = ''
+    last_text[rng.random(n_rows) < MISSING_DATE_SHARE] = ''
+
+    # Every SabreCode belongs to one Branch
+    branches = np.char.add('Branch ', (sabre_index % n_branches).astype(str)).astype(object)
+    branches[rng.random(n_rows) < MISSING_BRANCH_SHARE] = ''
+
+    device_ids = np.arange(first_device_id, first_device_id + n_rows)
+    return pd.DataFrame({
+        'DeviceId': device_ids,
+        'SerialNo': np.char.add('SN', device_ids.astype(str)),
+        'FirstSignalDate': first_text,
+        'LastSignalDate': last_text,
+        'ItemCode': item_codes,
+        'Amount': amounts,
+        'SabreCode': np.char.add('S', np.char.zfill(sabre_index.astype(str), 6)),
+        'Branch': branches,
+        'Status': rng.choice(['Online', 'Offline'], n_rows, p=[0.8, 0.2])
+    })
+
+
+def generate_extract(csv_file_path, n_rows, n_sabre_codes=None, seed=0, n_branches=None):
+    """Write a seeded synthetic extract of n_rows rows to csv_file_path, one block at a time.
+
+    The same arguments always produce the same file.
+    """
+    if n_sabre_codes is None:
+        n_sabre_codes = default_sabre_codes(n_rows)
+    if n_branches is None:
+        n_branches = max(1, min(200, n_sabre_codes // 20))
+    rng = np.random.default_rng(seed)
+    for first_row in range(0, n_rows, BLOCK_ROWS):
+        block = extract_block(rng, first_row, min(BLOCK_ROWS, n_rows - first_row), n_sabre_codes, n_branches)
+        block.to_csv(csv_file_path, mode='w' if first_row == 0 else 'a', header=first_row == 0, index=False)
+    return csv_file_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a seeded synthetic SECU device extract.')
+    parser.add_argument('output', help='CSV file to write')
+    parser.add_argument('--rows', type=parse_size, default=EXTRACT_SIZES['100k'],
+                        help=f"row count or one of {', '.join(EXTRACT_SIZES)} (default: 100k)")
+    parser.add_argument('--sabre-codes', type=int, default=None,
+                        help='distinct SabreCodes (default: one per 100 rows)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    generate_extract(args.output, args.rows, args.sabre_codes, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,13 +8,47 @@ setup(
     author_email='your.email@example.com',
     packages=find_packages(where='src'),
     package_dir={'': 'src'},
+    py_modules=[
+        'Secu_Routing_calc_report_app',
+        'arrears_cli',
+        'arrears_report',
+        'billing_cache',
+        'billing_engine',
+        'branch_reports',
+        'detail_export',
+        'device_store',
+        'extract_reader',
+        'reconcile',
+        'report_metrics',
+        'report_options',
+        'report_service',
+        'report_shards',
+        'report_writer',
+        'tariff',
+        'watch_folder',
+        'xlsxwriter_backend'
+    ],
     include_package_data=True,
     install_requires=[
         'pandas',
+        'numpy',
         'openpyxl',
         'tkinter'
     ],
+    extras_require={
+        'arrow': ['pyarrow'],
+        'xlsxwriter': ['XlsxWriter']
+    },
     entry_points={
+        'console_scripts': [
+            'secu-arrears=arrears_cli:main',
+            'secu-arrears-convert=arrears_cli:convert_main',
+            'secu-arrears-query=arrears_cli:query_main',
+            'secu-arrears-reconcile=arrears_cli:reconcile_main',
+            'secu-arrears-service=arrears_cli:service_main',
+            'secu-arrears-submit=report_service:submit_main',
+            'secu-arrears-watch=arrears_cli:watch_main'
+        ],
         'gui_scripts': [
             'secu_routing_calc_report_app=Secu_Routing_calc_report_app:main'
         ]
@@ -24,5 +58,5 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.9',
 )
\ No newline at end of file
@@ -1,17 +1,83 @@
-import pandas as pd
-import numpy as np
-from tkinter import Tk, Button, Label, filedialog, messagebox, StringVar, OptionMenu, PhotoImage
-from openpyxl import load_workbook
-from openpyxl.styles import Font, Border, Side, NamedStyle, PatternFill, Alignment
-from openpyxl.utils.dataframe import dataframe_to_rows
+from tkinter import Tk, Button, Label, filedialog, messagebox, StringVar, DoubleVar, OptionMenu, PhotoImage
+from tkinter import ttk
+import importlib
 import os
-from PIL import Image, ImageTk
+import queue
+import threading
+from report_options import DATE_OPTIONS, REPORT_STAGES
+
+# Status text shown while each report stage runs
+STAGE_LABELS = {
+    'load': "Loading extract...",
+    'compute': "Calculating active devices...",
+    'summary': "Building summary...",
+    'write detail': "Writing Updated Data sheet...",
+    'save': "Saving workbook..."
+}
+
+# Milliseconds between checks for messages from the report worker
+POLL_INTERVAL_MS = 100
+
+# Heavy modules imported on a background thread once the window is up; arrears_report brings in
+# pandas, numpy and openpyxl
+PRELOAD_MODULES = ['PIL.Image', 'PIL.ImageTk', 'arrears_report']
+
+# Names scripts used to import from this module, now loaded from arrears_report on first use
+LAZY_ATTRIBUTES = {'process_data', 'ReportCancelled'}
+
+def __getattr__(name):
+    """Import arrears_report on first use of one of the LAZY_ATTRIBUTES."""
+    if name in LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module('arrears_report'), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def preload_modules(done):
+    """Background thread body: import the PRELOAD_MODULES, then set done.
+
+    A module that fails to import is skipped here; the error surfaces when the module is used.
+    """
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+    done.set()
+
+def start_preload():
+    """Start importing the heavy modules and show the icon image once PIL is loaded."""
+    done = threading.Event()
+    threading.Thread(target=preload_modules, args=(done,), daemon=True).start()
+    root.after(POLL_INTERVAL_MS, poll_preload, done)
+
+def poll_preload(done):
+    """Reschedule until the preload thread finishes, then show the icon image."""
+    if not done.is_set():
+        root.after(POLL_INTERVAL_MS, poll_preload, done)
+        return
+    show_icon_image()
+
+def show_icon_image():
+    """Load the icon with PIL, converted to a format that PhotoImage can use, into the image label."""
+    try:
+        from PIL import Image, ImageTk
+    except ImportError:
+        return
+    img = Image.open(icon_path)
+    img = img.convert("RGBA")
+    img_label.image = ImageTk.PhotoImage(img)
+    img_label.config(image=img_label.image)
 
 def select_file():
-    """Open a file dialog to select a CSV file and return its path."""
+    """Open a file dialog to select a CSV, Parquet or Feather extract and return its path."""
     file_path = filedialog.askopenfilename(
-        title="Select the CSV file",
-        filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        title="Select the extract file",
+        filetypes=[
+            ("Extract files", "*.csv *.parquet *.pq *.feather *.arrow"),
+            ("CSV files", "*.csv"),
+            ("Parquet files", "*.parquet *.pq"),
+            ("Feather files", "*.feather *.arrow"),
+            ("All files", "*.*")
+        ]
     )
     return file_path
 
@@ -23,353 +89,11 @@ def save_file():
     )
     return file_path
 
-def process_data(csv_file_path, excel_path, date_option):
-    """Process the CSV file and save the report to an Excel file based on the selected date range option."""
-    df = pd.read_csv(csv_file_path, low_memory=False)
-    df_copy = df.copy()
-
-    # Convert dates to datetime format for comparison
-    df_copy['FirstSignalDate'] = pd.to_datetime(df_copy['FirstSignalDate'], errors='coerce')
-    df_copy['LastSignalDate'] = pd.to_datetime(df_copy['LastSignalDate'], errors='coerce')
-
-    # Get the current year and previous year
-    current_year = pd.Timestamp.now().year
-    previous_year = current_year - 1
-
-    # Define start and end dates based on the selected option
-    if date_option == 'April - September':
-        start_date = pd.Timestamp(f'{current_year}-04-01')
-        end_date = pd.Timestamp(f'{current_year}-09-30')
-    elif date_option == 'October - March':
-        start_date = pd.Timestamp(f'{previous_year}-10-01')
-        end_date = pd.Timestamp(f'{current_year}-03-31')
-    else:
-        raise ValueError("Invalid date option selected")
-
-    # Create 'DeviceActive' column
-    df_copy['DeviceActive'] = 'Inactive'
-    df_copy.loc[
-        (df_copy['LastSignalDate'] > start_date) &
-        (df_copy['LastSignalDate'] < end_date) &
-        ((df_copy['LastSignalDate'] - df_copy['FirstSignalDate']).dt.days > 10) &
-        (df_copy['ItemCode'].isin(['17300', '15300'])),
-        'DeviceActive'
-    ] = 'Active'
-
-    # Create 'DaysActive' column
-    df_copy['DaysActive'] = 0
-    df_copy.loc[
-        df_copy['DeviceActive'] == 'Active',
-        'DaysActive'
-    ] = df_copy.apply(
-        lambda row: (row['LastSignalDate'] - row['FirstSignalDate']).days 
-        if row['FirstSignalDate'] > pd.Timestamp(f'{current_year}-03-30') 
-        else (row['LastSignalDate'] - start_date).days, axis=1
-    )
-
-    # Create 'MonthsActive' column
-    df_copy['MonthsActive'] = (df_copy['DaysActive'] / 30).apply(lambda x: -(-x // 1))  # Ceiling division
-
-    # Create 'Fee ex VAT' column
-    df_copy['Fee ex VAT'] = df_copy['MonthsActive'] * df_copy['Amount']
-
-    # Filter for ItemCode 17300 and 15300
-    df_filtered = df_copy[df_copy['ItemCode'].isin(['17300', '15300'])].copy()
-
-    # Create summary DataFrame
-    summary_df = df_filtered.groupby('SabreCode').agg(
-        Branch=('Branch', 'first'),
-        ItemCode_17300=('Fee ex VAT', lambda x: x[df_filtered['ItemCode'] == '17300'].sum()),
-        ItemCode_15300=('Fee ex VAT', lambda x: x[df_filtered['ItemCode'] == '15300'].sum()),
-        TotalActive=('DeviceActive', lambda x: (x == 'Active').sum()),
-        Total_ex_VAT=('Fee ex VAT', 'sum')
-    ).reset_index()
-
-    # Calculate 'Price Per Unit' column
-    summary_df['Price Per Unit'] = summary_df.apply(
-        lambda row: row['Total_ex_VAT'] / row['TotalActive'] if row['TotalActive'] > 0 else None, axis=1
-    )
-
-    # Rename columns
-    summary_df.rename(columns={
-        'ItemCode_17300': '17300',
-        'ItemCode_15300': '15300'
-    }, inplace=True)
-
-    # Add new columns to summary_df
-    summary_df['% Split'] = summary_df.apply(
-        lambda row: row['15300'] / row['17300'] if row['17300'] != 0 else 0, axis=1
-    )
-    summary_df['% 15300'] = round(summary_df['TotalActive'] * summary_df['% Split'])
-    summary_df['% 17300'] = summary_df['TotalActive'] - summary_df['% 15300']
-
-    # Format % Split cells that equal 0 to "-"
-    summary_df['% Split'] = summary_df['% Split'].apply(lambda x: '-' if x == 0 else x)
-
-    # Format % 17300 cells where % Split is "-"
-    summary_df['% 17300'] = summary_df.apply(lambda row: '-' if row['% Split'] == '-' else row['% 17300'], axis=1)
-
-    # Format % 15300 cells that equal 0 to "-"
-    summary_df['% 15300'] = summary_df['% 15300'].apply(lambda x: '-' if x == 0 else x)
-
-    # Calculate the total sum for 'Total_ex_VAT'
-    total_ex_vat = summary_df['Total_ex_VAT'].sum()
-
-    # Append the total and empty row
-    total_row = pd.DataFrame({
-        'SabreCode': ['Total'],
-        'Branch': [None],
-        '17300': [None],
-        '15300': [None],
-        'TotalActive': [None],
-        'Price Per Unit': [None],
-        'Total_ex_VAT': [total_ex_vat]
-    })
-
-    empty_row = pd.DataFrame({
-        'SabreCode': [None],
-        'Branch': [None],
-        '17300': [None],
-        '15300': [None],
-        'TotalActive': [None],
-        'Price Per Unit': [None],
-        'Total_ex_VAT': [None]
-    })
-
-    empty_row = empty_row.dropna(how='all', axis=1)
-    total_row = total_row.dropna(how='all', axis=1)
-
-    summary_df = pd.concat([summary_df, empty_row, total_row], ignore_index=True)
-
-    # Save the summary DataFrame to Excel
-    summary_df.to_excel(excel_path, index=False, sheet_name='Summary')
-
-    # Open the workbook and select the sheet
-    wb = load_workbook(excel_path)
-    ws = wb['Summary']
-
-    # Move data up by 2 columns and down by 2 rows
-    max_row = ws.max_row
-    max_col = ws.max_column
-    for row in range(max_row, 0, -1):
-        for col in range(max_col, 0, -1):
-            new_row = row + 2
-            new_col = col + 2
-            ws.cell(row=new_row, column=new_col, value=ws.cell(row=row, column=col).value)
-            ws.cell(row=row, column=col).value = None
-
-    # Add a blank row at row 4 and set its height to 7.5
-    ws.insert_rows(4)
-    ws.row_dimensions[4].height = 7.5
-
-    # Ensure the first two columns are blank, have no filling, and no borders
-    for row in range(1, max_row + 4):
-        for col in range(1, 3):
-            cell = ws.cell(row=row, column=col)
-            cell.value = None
-            cell.fill = PatternFill(fill_type=None)
-            cell.border = Border()
-
-    # Ensure row 1 has no borders
-    for col in range(1, max_col + 3):
-        cell = ws.cell(row=1, column=col)
-        cell.border = Border()
-
-    # Add title row
-    title = "SECU 6 month Active billing"
-    ws.merge_cells('D1:H1')
-    title_cell = ws['D1']
-    title_cell.value = title
-    title_cell.font = Font(bold=True, underline='single', size=14)
-
-    # Ensure cells A3 and B3 have no fill
-    ws['A3'].fill = PatternFill(fill_type=None)
-    ws['B3'].fill = PatternFill(fill_type=None)
-
-    # Define styles
-    currency_format = NamedStyle(name='currency', number_format='R #,##0.00')
-    number_format = NamedStyle(name='number', number_format='0')
-    bold_font = Font(bold=True)
-    blue_font = Font(color="0000FF")
-    red_font = Font(color="FF0000")
-    header_fill = PatternFill(start_color="000099", end_color="000099", fill_type="solid")
-    header_font = Font(color="FFFFFF")
-    border_color = "D9D9D9"
-
-    # Define border styles
-    border_style = Border(
-        left=Side(border_style='thin', color=border_color),
-        right=Side(border_style='thin', color=border_color),
-        top=Side(border_style='thin', color=border_color),
-        bottom=Side(border_style='thin', color=border_color)
-    )
-
-    # Define 'Top and Thick Bottom' border style for the 'Total_ex_VAT' cell with black color
-    total_ex_vat_border = Border(
-        top=Side(border_style='thin', color="000000"),  # Black color
-        bottom=Side(border_style='thick', color="000000"),  # Black color
-        left=Side(border_style='none'),
-        right=Side(border_style='none')
-    )
-
-    # Apply formatting to specific columns
-    currency_cols = ['17300', '15300', 'Total_ex_VAT', 'Amount', 'Price Per Unit']
-    # Add '% Split' to the list of percentage columns
-    percentage_cols = ['% Split']
-
-    for col in currency_cols:
-        if col in summary_df.columns:
-            col_letter = chr(ord('A') + summary_df.columns.get_loc(col) + 2)  # Adjust for new column position
-            for cell in ws[col_letter][4:]:  # Skip title, blank rows, and header row
-                cell.style = currency_format
-
-    for col in percentage_cols:
-        if col in summary_df.columns:
-            col_letter = chr(ord('A') + summary_df.columns.get_loc(col) + 2)  # Adjust for new column position
-            for cell in ws[col_letter][4:]:  # Skip title, blank rows, and header row
-                if cell.value == 0:
-                    cell.value = '-'
-                else:
-                    cell.number_format = '0%'
-
-    # Apply numeric formatting to 'DaysActive' and 'MonthsActive'
-    numeric_cols = ['DaysActive', 'MonthsActive']
-    for col in numeric_cols:
-        if col in summary_df.columns:
-            col_letter = chr(ord('A') + summary_df.columns.get_loc(col) + 2)  # Adjust for new column position
-            for cell in ws[col_letter][4:]:  # Skip title, blank rows, and header row
-                cell.style = number_format
-
-    # Format % 17300 cells where % Split is "-"
-    percent_17300_col_index = summary_df.columns.get_loc('% 17300') + 3  # Adjust for new column position
-    percent_split_col_index = summary_df.columns.get_loc('% Split') + 3  # Adjust for new column position
-    if percent_17300_col_index <= ws.max_column and percent_split_col_index <= ws.max_column:
-        for row in ws.iter_rows(min_row=5, max_row=ws.max_row, min_col=3, max_col=ws.max_column):
-            percent_split_cell = row[percent_split_col_index - 3]  # Indexing correction for 0-based indexing
-            percent_17300_cell = row[percent_17300_col_index - 3]  # Indexing correction for 0-based indexing
-            if percent_split_cell.value == '-':
-                percent_17300_cell.value = '-'
-
-    # Format % 15300 cells that equal 0 to "-"
-    percent_15300_col_index = summary_df.columns.get_loc('% 15300') + 3  # Adjust for new column position
-    if percent_15300_col_index <= ws.max_column:
-        for row in ws.iter_rows(min_row=5, max_row=ws.max_row, min_col=3, max_col=ws.max_column):
-            percent_15300_cell = row[percent_15300_col_index - 3]  # Indexing correction for 0-based indexing
-            if percent_15300_cell.value == 0:
-                percent_15300_cell.value = '-'
-
-    # Apply fill color and font color for headings on 'Summary' sheet
-    for cell in ws[3][2:]:  # Apply styles to the new header row (row 3), starting from column 3
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center')  # Center align the headings
-
-    # Apply red font formatting to rows where 'Total_ex_VAT' = 0
-    total_ex_vat_col_index = summary_df.columns.get_loc('Total_ex_VAT') + 3  # Adjust for new column position
-    if total_ex_vat_col_index <= ws.max_column:
-        for row in ws.iter_rows(min_row=5, max_row=ws.max_row, min_col=3, max_col=ws.max_column):
-            total_ex_vat_cell = row[total_ex_vat_col_index - 3]  # Indexing correction for 0-based indexing
-            if total_ex_vat_cell.value is not None and total_ex_vat_cell.value == 0:
-                for cell in row:
-                    cell.font = red_font
-
-    # Apply borders to the headings (row 3)
-    for cell in ws[3][2:]:  # Row 3
-        cell.border = border_style
-
-    # Apply bold font to 'Total_ex_VAT' values greater than 0
-    if total_ex_vat_col_index <= ws.max_column:
-        for row in ws.iter_rows(min_row=5, max_row=ws.max_row, min_col=total_ex_vat_col_index, max_col=total_ex_vat_col_index):
-            total_ex_vat_cell = row[0]
-            if total_ex_vat_cell.value is not None and total_ex_vat_cell.value > 0:
-                total_ex_vat_cell.font = bold_font
-
-    # Apply bold font to 'Total' row
-    total_row_index = ws.max_row
-    for cell in ws[total_row_index]:
-        cell.font = Font(bold=True)
-
-    # Apply 'Top and Thick Bottom' border style with black color to the 'Total_ex_VAT' cell in the 'Total' row
-    if total_ex_vat_col_index <= ws.max_column:
-        total_ex_vat_total_cell = ws.cell(row=ws.max_row, column=total_ex_vat_col_index)
-        total_ex_vat_total_cell.border = total_ex_vat_border
-
-    # Uncheck gridlines
-    ws.sheet_view.showGridLines = False
-
-    # Apply left and bottom borders to all rows except 'Total' and blank row
-    for row in ws.iter_rows(min_row=5, max_row=ws.max_row - 2, min_col=3, max_col=ws.max_column):
-        for cell in row:
-            if cell.row != ws.max_row:  # Skip the 'Total' row
-                cell.border = border_style
-
-    # Adjust the row height of the blank row above 'Total'
-    blank_row_index = ws.max_row - 1
-    ws.row_dimensions[blank_row_index].height = 7.5
-
-    # Add a thick border to the outside of the data starting from row 5, column 3
-    thick_border_style = Border(
-        left=Side(border_style='thick', color="000000"),
-        right=Side(border_style='thick', color="000000"),
-        top=Side(border_style='thick', color="000000"),
-        bottom=Side(border_style='thick', color="000000")
-    )
-
-    for row in ws.iter_rows(min_row=5, max_row=ws.max_row - 2, min_col=3, max_col=ws.max_column):
-        for cell in row:
-            if cell.row == 5:  # Top border
-                cell.border = Border(top=thick_border_style.top, left=cell.border.left, right=cell.border.right, bottom=cell.border.bottom)
-            if cell.row == ws.max_row - 2:  # Bottom border
-                cell.border = Border(bottom=thick_border_style.bottom, left=cell.border.left, right=cell.border.right, top=cell.border.top)
-            if cell.column == 3:  # Left border
-                cell.border = Border(left=thick_border_style.left, top=cell.border.top, right=cell.border.right, bottom=cell.border.bottom)
-            if cell.column == ws.max_column:  # Right border
-                cell.border = Border(right=thick_border_style.right, top=cell.border.top, left=cell.border.left, bottom=cell.border.bottom)
-
-    # Add the 'Updated Data' sheet
-    ws_new = wb.create_sheet(title='Updated Data')
-
-    # Write the headers
-    for r_idx, col_name in enumerate(df_filtered.columns.tolist(), 1):
-        ws_new.cell(row=1, column=r_idx, value=col_name)
-
-    # Write the data
-    for r_idx, row in enumerate(df_filtered.values.tolist(), 2):
-        for c_idx, value in enumerate(row, 1):
-            ws_new.cell(row=r_idx, column=c_idx, value=value)
-
-    # Apply styles to the new sheet
-    currency_cols = ['Amount']
-    for col in currency_cols:
-        if col in df_filtered.columns:
-            col_letter = chr(ord('A') + df_filtered.columns.get_loc(col))
-            for cell in ws_new[col_letter][1:]:  # Skip header row
-                cell.style = currency_format
-
-    for col in numeric_cols:
-        if col in df_filtered.columns:
-            col_letter = chr(ord('A') + df_filtered.columns.get_loc(col))
-            for cell in ws_new[col_letter][1:]:  # Skip header row
-                cell.style = number_format
-
-    # Apply blue font formatting for 'DeviceActive' = 'Active'
-    device_active_col_index = df_filtered.columns.get_loc('DeviceActive') + 1
-    for row in ws_new.iter_rows(min_row=2, max_row=ws_new.max_row, min_col=1, max_col=ws_new.max_column):
-        device_active_cell = row[device_active_col_index - 1]  # Indexing correction for 0-based indexing
-        if device_active_cell.value == 'Active':
-            for cell in row:
-                cell.font = blue_font
-
-    # Save the updated workbook with both sheets
-    wb.save(excel_path)
-
-    messagebox.showinfo("Success", f"Report successfully saved to {excel_path}")
-
 def on_generate_report():
     """Wrapper function to handle file selection and report generation."""
     csv_file_path = select_file()
     if not csv_file_path:
-        messagebox.showwarning("No File Selected", "No CSV file selected. Exiting.")
+        messagebox.showwarning("No File Selected", "No extract file selected. Exiting.")
         return
 
     excel_path = save_file()
@@ -378,40 +102,161 @@ def on_generate_report():
         return
 
     date_option = date_option_var.get()
-    process_data(csv_file_path, excel_path, date_option)
+    start_report(csv_file_path, excel_path, date_option)
+
+def start_report(csv_file_path, excel_path, date_option):
+    """Generate the report on a worker thread and poll it for progress from the Tk event loop."""
+    global cancel_event
+
+    cancel_event = threading.Event()
+    messages = queue.Queue()
+    worker = threading.Thread(
+        target=run_report,
+        args=(csv_file_path, excel_path, date_option, messages, cancel_event),
+        daemon=True
+    )
+
+    generate_button.config(state='disabled')
+    cancel_button.config(state='normal')
+    progress_var.set(0)
+    status_var.set(STAGE_LABELS[REPORT_STAGES[0]])
+
+    worker.start()
+    root.after(POLL_INTERVAL_MS, poll_report, messages)
+
+def run_report(csv_file_path, excel_path, date_option, messages, cancel_event):
+    """Worker thread body: generate the report and post progress and the outcome to messages.
+
+    When the SECU_REPORT_SERVICE environment variable names a running report service, the report
+    is generated by its warm workers instead of in this process.
+    """
+    from report_service import SERVICE_ENV, ReportServiceClient, service_available
+    service_url = os.environ.get(SERVICE_ENV)
+    if service_url and service_available(service_url):
+        run_service_report(ReportServiceClient(service_url), csv_file_path, excel_path, date_option, messages,
+                           cancel_event)
+        return
+
+    # Waits for the preload thread if it is still importing arrears_report
+    from arrears_report import ReportCancelled, process_data
+
+    def progress(stage, fraction):
+        if cancel_event.is_set():
+            raise ReportCancelled()
+        messages.put(('progress', stage, fraction))
+
+    try:
+        process_data(csv_file_path, excel_path, date_option, progress=progress)
+    except ReportCancelled:
+        messages.put(('cancelled',))
+    except Exception as exc:
+        messages.put(('error', exc))
+    else:
+        messages.put(('done', excel_path))
+
+def run_service_report(client, csv_file_path, excel_path, date_option, messages, cancel_event):
+    """Worker thread body for a report generated by a report service: follow the job and post its progress."""
+    def on_status(status):
+        if cancel_event.is_set() and not cancel_requested:
+            cancel_requested.append(client.cancel(status['id']))
+        elif status.get('stage'):
+            messages.put(('progress', status['stage'], status['fraction']))
+
+    cancel_requested = []
+    try:
+        status = client.submit(csv_file_path, excel_path, date_option)
+        status = client.wait(status['id'], POLL_INTERVAL_MS / 1000, on_status)
+    except Exception as exc:
+        messages.put(('error', exc))
+        return
+    if status['status'] == 'done':
+        messages.put(('done', excel_path))
+    elif status['status'] == 'cancelled':
+        messages.put(('cancelled',))
+    else:
+        messages.put(('error', status.get('error')))
+
+def poll_report(messages):
+    """Apply the worker's queued messages to the window and reschedule until the report finishes."""
+    while True:
+        try:
+            message = messages.get_nowait()
+        except queue.Empty:
+            root.after(POLL_INTERVAL_MS, poll_report, messages)
+            return
+
+        if message[0] == 'progress':
+            _, stage, fraction = message
+            if not cancel_event.is_set():
+                status_var.set(STAGE_LABELS[stage])
+            progress_var.set(100 * (REPORT_STAGES.index(stage) + (fraction or 0)) / len(REPORT_STAGES))
+            continue
+
+        finish_report()
+        if message[0] == 'done':
+            progress_var.set(100)
+            status_var.set("Report saved")
+            messagebox.showinfo("Success", f"Report successfully saved to {message[1]}")
+        elif message[0] == 'cancelled':
+            status_var.set("Report cancelled")
+        else:
+            status_var.set("Report failed")
+            messagebox.showerror("Error", f"The report could not be generated:\n{message[1]}")
+        return
+
+def finish_report():
+    """Return the buttons to their idle state."""
+    generate_button.config(state='normal')
+    cancel_button.config(state='disabled')
+
+def on_cancel_report():
+    """Ask the running report to stop at its next progress check."""
+    cancel_event.set()
+    cancel_button.config(state='disabled')
+    status_var.set("Cancelling...")
 
 def main():
-    global date_option_var
+    global root, icon_path, img_label, date_option_var, progress_var, status_var, generate_button, cancel_button
 
     # Create the GUI window
     root = Tk()
     root.title("SECU 6 month arrears bill Generator")
-    root.geometry("450x300")  # Set window size
+    root.geometry("450x400")  # Set window size
     root.configure(bg="#FFFFFF")  # Set background color
 
     # Set application icon
     icon_path = os.path.join(os.path.dirname(__file__), 'assets', 'app_icon.ico')
     root.iconbitmap(icon_path)
 
-    # Load the image using PIL and convert to a format that PhotoImage can use
-    img = Image.open(icon_path)
-    img = img.convert("RGBA")
-    img = ImageTk.PhotoImage(img)
-
-    # Create image label
-    img_label = Label(root, image=img, bg="#FFFFFF")
+    # Create image label; the image is added by show_icon_image once PIL has been loaded
+    img_label = Label(root, bg="#FFFFFF")
     img_label.pack(pady=20)
 
     date_option_var = StringVar(root)
-    date_option_var.set("April - September")  # Default value
+    date_option_var.set(DATE_OPTIONS[0])  # Default value
 
     # Set dropdown menu for date range selection
-    date_option_menu = OptionMenu(root, date_option_var, "April - September", "October - March")
+    date_option_menu = OptionMenu(root, date_option_var, *DATE_OPTIONS)
     date_option_menu.config(font=("Helvetica", 12))
     date_option_menu.pack(pady=10)
 
-    button = Button(root, text="Generate Report", command=on_generate_report, font=("Helvetica", 12), fg="#FFFFFF", bg="#2457FC")
-    button.pack(pady=10)
+    generate_button = Button(root, text="Generate Report", command=on_generate_report, font=("Helvetica", 12), fg="#FFFFFF", bg="#2457FC")
+    generate_button.pack(pady=10)
+
+    # Progress bar and stage text for the running report
+    progress_var = DoubleVar(root)
+    progress_bar = ttk.Progressbar(root, variable=progress_var, maximum=100, length=300)
+    progress_bar.pack(pady=5)
+
+    status_var = StringVar(root)
+    status_label = Label(root, textvariable=status_var, font=("Helvetica", 10), bg="#FFFFFF")
+    status_label.pack()
+
+    cancel_button = Button(root, text="Cancel", command=on_cancel_report, font=("Helvetica", 10), state='disabled')
+    cancel_button.pack(pady=5)
+
+    # Import the heavy modules once the window has been drawn
+    root.after_idle(start_preload)
 
     # Run the GUI event loop
     root.mainloop()
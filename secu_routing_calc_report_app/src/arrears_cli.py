@@ -0,0 +1,577 @@
+"""Command line entry point for generating SECU 6 month arrears reports without the GUI.
+
+Examples:
+    secu-arrears extract.csv -o report.xlsx --period "October - March"
+    secu-arrears exports/ --output-dir reports/ --workers 8
+    secu-arrears "exports/branch_*.csv" --output-dir reports/
+    secu-arrears national.csv -o national.xlsx --chunksize 500000
+    secu-arrears national.csv -o national.xlsx --shard-by branch --shard-files
+    secu-arrears national.csv -o national.xlsx --detail-file parquet
+    secu-arrears national.csv --by-branch --output-dir branches/ --workers 8
+    secu-arrears national.csv -o history.xlsx --years 3 --window 2025-01-01:2025-06-30
+    secu-arrears-convert national.csv && secu-arrears national.parquet -o national.xlsx
+    secu-arrears national.csv -o national.xlsx --save-store && secu-arrears-query national.store --sabre-code S012 --inactive
+    secu-arrears extract.csv -o report.xlsx --tariff tariff.csv
+    secu-arrears-reconcile march.csv september.csv -o changes.xlsx --previous-period "October - March" --period "April - September"
+    secu-arrears-watch //fileserver/drop //fileserver/reports --workers 2
+    secu-arrears-service --workers 4 & secu-arrears exports/ --output-dir reports/ --service
+"""
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from arrears_report import process_branches, process_data, process_periods, process_sharded
+from billing_engine import DATE_OPTIONS, billing_period, recent_periods
+from extract_reader import CSV_ENGINES, EXTRACT_EXTENSIONS, convert_extract
+from billing_cache import DEFAULT_CACHE_BYTES, BillingCache
+from detail_export import DETAIL_FORMATS
+from device_store import STORE_EXTENSION, TOTALS_KEYS, DeviceStore
+from reconcile import DEFAULT_SHEET_DEVICES, DEVICE_KEY, process_reconciliation
+from report_metrics import ReportMetrics
+from report_service import (DEFAULT_HOST, DEFAULT_PORT, DEFAULT_SERVICE_URL, ReportServiceClient,
+                            ReportServiceError, serve)
+from report_shards import DEFAULT_SHARD_ROWS, SHARD_KEYS
+from report_writer import WRITER_BACKENDS
+from tariff import DEFAULT_TARIFF, load_tariff
+from watch_folder import (DEFAULT_POLL_SECONDS, DEFAULT_QUEUE_SIZE, DEFAULT_RETRIES, DEFAULT_RETRY_SECONDS,
+                          DEFAULT_SETTLE_SECONDS, FolderWatcher)
+
+
+def expand_inputs(inputs, extensions=EXTRACT_EXTENSIONS):
+    """Return the sorted extract files named by a list of file paths, directories and glob patterns.
+
+    Directories contribute the files with one of the given extensions.
+    """
+    csv_files = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for extension in extensions:
+                csv_files.update(glob.glob(os.path.join(pattern, '*' + extension)))
+        elif os.path.isfile(pattern):
+            csv_files.add(pattern)
+        else:
+            csv_files.update(path for path in glob.glob(pattern) if os.path.isfile(path))
+    return sorted(csv_files)
+
+
+def output_path_for(csv_file_path, output_dir=None, extension='.xlsx'):
+    """Return the output path with the given extension for an extract, next to it or inside output_dir."""
+    stem = os.path.splitext(os.path.basename(csv_file_path))[0]
+    directory = output_dir if output_dir else os.path.dirname(csv_file_path)
+    return os.path.join(directory, stem + extension)
+
+
+def run_job(csv_file_path, excel_path, date_option, engine='c', detail_columns=None, chunksize=None,
+            metrics_options=None, cache_options=None, periods=None, writer='openpyxl', shard_options=None,
+            save_store=False, tariff=DEFAULT_TARIFF, detail_format=None):
+    """Generate one report in a worker process and return its output path.
+
+    metrics_options and cache_options, if given, are the ReportMetrics and BillingCache arguments
+    used to measure the report and to reuse earlier results. With periods, a list of BillingPeriods,
+    a multi-period Summary report is written instead and date_option is not used. writer names the
+    workbook writer backend. shard_options, if given, are the arguments of process_sharded that
+    split the detail rows into shards. With save_store the classified rows are also saved next to
+    the report as a device store, with the STORE_EXTENSION. tariff is the tariff.Tariff billed.
+    With detail_format the detail rows are saved as a file next to a Summary-only workbook.
+    """
+    metrics = ReportMetrics(**metrics_options) if metrics_options is not None else None
+    if periods:
+        process_periods(csv_file_path, excel_path, periods, engine, chunksize, metrics=metrics, writer=writer,
+                        tariff=tariff)
+        return excel_path
+    cache = BillingCache(**cache_options) if cache_options is not None else None
+    if shard_options is not None:
+        process_sharded(csv_file_path, excel_path, date_option, engine=engine, detail_columns=detail_columns,
+                        metrics=metrics, cache=cache, writer=writer, tariff=tariff, **shard_options)
+        return excel_path
+    store_path = os.path.splitext(excel_path)[0] + STORE_EXTENSION if save_store else None
+    process_data(csv_file_path, excel_path, date_option, engine, detail_columns, chunksize, metrics=metrics,
+                 cache=cache, writer=writer, store_path=store_path, tariff=tariff, detail_format=detail_format)
+    return excel_path
+
+
+def run_batch(jobs, date_option, workers=None, engine='c', detail_columns=None, chunksize=None,
+              metrics_options=None, cache_options=None, periods=None, writer='openpyxl', shard_options=None,
+              save_store=False, tariff=DEFAULT_TARIFF, detail_format=None):
+    """Generate the (csv_file_path, excel_path) jobs in a process pool.
+
+    Returns a list of (csv_file_path, excel_path, error) tuples, where error is None on success.
+    """
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_job, csv_file_path, excel_path, date_option, engine, detail_columns,
+                            chunksize, metrics_options, cache_options, periods, writer, shard_options, save_store,
+                            tariff, detail_format):
+                (csv_file_path, excel_path)
+            for csv_file_path, excel_path in jobs
+        }
+        for future in as_completed(futures):
+            csv_file_path, excel_path = futures[future]
+            try:
+                future.result()
+            except Exception as exc:
+                results.append((csv_file_path, excel_path, exc))
+                print(f"FAILED {csv_file_path}: {exc}", file=sys.stderr)
+            else:
+                results.append((csv_file_path, excel_path, None))
+                print(f"Report successfully saved to {excel_path}")
+    return results
+
+
+def run_service_jobs(client, jobs, date_option, options):
+    """Submit the (csv_file_path, excel_path) jobs to a report service and wait for all of them.
+
+    options are the optional job fields of report_service.JOB_OPTIONS. Returns a list of
+    (csv_file_path, excel_path, error) tuples, where error is None on success.
+    """
+    try:
+        submitted = [(csv_file_path, excel_path, client.submit(csv_file_path, excel_path, date_option, **options))
+                     for csv_file_path, excel_path in jobs]
+    except OSError as exc:
+        raise SystemExit(f"The report service at {client.url} cannot be reached: {exc}")
+    results = []
+    for csv_file_path, excel_path, status in submitted:
+        try:
+            status = client.wait(status['id'])
+        except (OSError, ReportServiceError) as exc:
+            status = {'status': 'failed', 'error': str(exc)}
+        if status['status'] == 'done':
+            results.append((csv_file_path, excel_path, None))
+            print(f"Report successfully saved to {excel_path} ({status['total_wall_seconds']:.1f} s)")
+        else:
+            error = status.get('error', status['status'])
+            results.append((csv_file_path, excel_path, error))
+            print(f"FAILED {csv_file_path}: {error}", file=sys.stderr)
+    return results
+
+
+def parse_column_list(value):
+    """Split a comma separated list of column names."""
+    return [col.strip() for col in value.split(',') if col.strip()]
+
+
+def parse_window(value):
+    """Return the BillingPeriod for a 'START:END' pair of dates."""
+    try:
+        start_date, end_date = value.split(':')
+        return billing_period(start_date, end_date)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid window {value!r}; expected START:END, e.g. 2025-04-01:2025-09-30")
+
+
+def build_parser():
+    """Return the argument parser for the secu-arrears command."""
+    parser = argparse.ArgumentParser(
+        prog='secu-arrears',
+        description='Generate SECU 6 month arrears billing reports from device extract CSV, Parquet or '
+                    'Feather files.'
+    )
+    parser.add_argument('inputs', nargs='+', help='extract files, directories of extracts or glob patterns')
+    parser.add_argument('-o', '--output', help='output .xlsx path when a single extract is given')
+    parser.add_argument('--output-dir', help='directory for the reports (default: next to each CSV file)')
+    parser.add_argument('-p', '--period', choices=DATE_OPTIONS, default=DATE_OPTIONS[0],
+                        help='billing window (default: %(default)s)')
+    parser.add_argument('--years', type=int, default=None,
+                        help='bill every period of the last YEARS years, one Summary sheet each')
+    parser.add_argument('--window', type=parse_window, action='append', default=None,
+                        help='also bill the window START:END (YYYY-MM-DD dates) on its own Summary sheet; '
+                             'may be repeated')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='worker processes for batch mode (default: one per CPU)')
+    parser.add_argument('--engine', choices=CSV_ENGINES, default='c',
+                        help='CSV parser; pyarrow is faster on large extracts (default: %(default)s)')
+    parser.add_argument('--writer', choices=WRITER_BACKENDS, default='openpyxl',
+                        help='workbook writer; xlsxwriter writes large reports faster in constant memory '
+                             '(default: %(default)s)')
+    parser.add_argument('--detail-columns', type=parse_column_list, default=None,
+                        help='comma separated extra columns to keep on the Updated Data sheet '
+                             '(default: all columns)')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='read each CSV file this many rows at a time, for extracts too large for memory')
+    parser.add_argument('--by-branch', action='store_true',
+                        help='write one report per Branch to --output-dir, rendered by --workers processes '
+                             '(needs pyarrow)')
+    parser.add_argument('--shard-by', choices=SHARD_KEYS, default=None,
+                        help='split the Updated Data rows into shards by row count, Branch or SabreCode, '
+                             'linked from a Detail Index sheet')
+    parser.add_argument('--shard-rows', type=int, default=DEFAULT_SHARD_ROWS,
+                        help='most rows in one shard (default: %(default)s, the Excel sheet limit)')
+    parser.add_argument('--shard-files', action='store_true',
+                        help='write each shard to its own workbook in <report>_detail/ instead of a sheet')
+    parser.add_argument('--detail-file', nargs='?', choices=DETAIL_FORMATS, const='auto', default=None,
+                        metavar='FORMAT',
+                        help='write only the Summary to the workbook and save the detail rows next to it as '
+                             '<report>_detail.parquet or .csv.gz (FORMAT: %(choices)s; default: auto, Parquet '
+                             'when pyarrow is installed)')
+    parser.add_argument('--save-store', action='store_true',
+                        help='also save the classified rows next to each report as <report>.store, '
+                             'for follow-up questions with secu-arrears-query')
+    parser.add_argument('--tariff',
+                        help='CSV table of the billed item codes and their billing rules '
+                             '(default: 17300 and 15300, active after 10 days, per started 30-day month)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='save per-stage timings and memory use next to each report as <report>.metrics.json')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='with --metrics, also trace Python memory allocations per stage (slower)')
+    parser.add_argument('--profile', action='store_true',
+                        help='save a cProfile dump of each report run as <report>.prof')
+    parser.add_argument('--cache-dir',
+                        help='reuse results from earlier runs kept in this directory (needs pyarrow)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_BYTES // 2 ** 20,
+                        help='size cap of the cache directory in MB (default: %(default)s)')
+    parser.add_argument('--service', nargs='?', const=DEFAULT_SERVICE_URL, default=None, metavar='URL',
+                        help='send the reports to a running secu-arrears-service instead of generating them '
+                             'here (default URL: %(const)s)')
+    return parser
+
+
+def main(argv=None):
+    """Run the secu-arrears command and return its exit status."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    csv_files = expand_inputs(args.inputs)
+    if not csv_files:
+        parser.error('no extract files found')
+    if args.output and len(csv_files) > 1:
+        parser.error('--output can only be used with a single extract; use --output-dir instead')
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.chunksize is not None and args.chunksize < 1:
+        parser.error('--chunksize must be at least 1')
+    if args.chunksize and args.engine != 'c':
+        parser.error('--chunksize is only supported by the c engine')
+    if args.chunksize and args.cache_dir:
+        parser.error('--cache-dir cannot be used with --chunksize')
+    if args.years is not None and args.years < 1:
+        parser.error('--years must be at least 1')
+    periods = (recent_periods(args.years) if args.years else []) + (args.window or [])
+    if periods and args.cache_dir:
+        parser.error('--cache-dir cannot be used with --years or --window')
+    if periods and args.detail_columns is not None:
+        parser.error('--detail-columns cannot be used with --years or --window, which write no detail sheet')
+    if args.shard_rows < 1:
+        parser.error('--shard-rows must be at least 1')
+    if args.shard_files and not args.shard_by:
+        parser.error('--shard-files needs --shard-by')
+    if args.shard_by and (args.chunksize or periods):
+        parser.error('--shard-by cannot be used with --chunksize, --years or --window')
+    if args.detail_file and (args.chunksize or periods or args.shard_by or args.by_branch):
+        parser.error('--detail-file cannot be used with --chunksize, --years, --window, --shard-by or --by-branch')
+    if args.save_store and (args.chunksize or args.cache_dir or periods or args.shard_by or args.by_branch):
+        parser.error('--save-store cannot be used with --chunksize, --cache-dir, --years, --window, --shard-by '
+                     'or --by-branch')
+    if args.by_branch and (len(csv_files) > 1 or args.output or args.chunksize or periods or args.shard_by):
+        parser.error('--by-branch takes a single extract and --output-dir, and cannot be used with --output, '
+                     '--chunksize, --years, --window or --shard-by')
+    tariff = DEFAULT_TARIFF
+    if args.tariff:
+        try:
+            tariff = load_tariff(args.tariff)
+        except (OSError, ValueError) as exc:
+            parser.error(f'invalid --tariff: {exc}')
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    metrics_options = None
+    if args.metrics or args.trace_memory or args.profile:
+        metrics_options = {
+            'trace_memory': args.trace_memory,
+            'profile': args.profile,
+            'sidecar': args.metrics or args.trace_memory
+        }
+    cache_options = None
+    if args.cache_dir:
+        cache_options = {'cache_dir': args.cache_dir, 'max_bytes': args.cache_size * 2 ** 20}
+
+    shard_options = None
+    if args.shard_by:
+        shard_options = {'shard_by': args.shard_by, 'max_rows': args.shard_rows, 'files': args.shard_files,
+                         'workers': args.workers}
+
+    if args.service:
+        if (periods or args.shard_by or args.by_branch or args.save_store or args.detail_file or args.cache_dir
+                or metrics_options):
+            parser.error('--service cannot be used with --years, --window, --shard-by, --by-branch, --save-store, '
+                         '--detail-file, --cache-dir, --metrics, --trace-memory or --profile')
+        jobs = [(csv_file_path, args.output or output_path_for(csv_file_path, args.output_dir))
+                for csv_file_path in csv_files]
+        options = {'engine': args.engine, 'writer': args.writer, 'detail_columns': args.detail_columns,
+                   'chunksize': args.chunksize, 'tariff': args.tariff}
+        results = run_service_jobs(ReportServiceClient(args.service), jobs, args.period, options)
+        failed = [result for result in results if result[2] is not None]
+        if len(results) > 1:
+            print(f"{len(results) - len(failed)} of {len(results)} reports generated")
+        return 1 if failed else 0
+
+    # Per-branch reports share one load of the extract and use the worker pool for the workbooks
+    if args.by_branch:
+        metrics = ReportMetrics(**metrics_options) if metrics_options is not None else None
+        cache = BillingCache(**cache_options) if cache_options is not None else None
+        output_dir = args.output_dir or os.path.dirname(os.path.abspath(csv_files[0]))
+        prefix = os.path.splitext(os.path.basename(csv_files[0]))[0] + '_'
+        _, reports = process_branches(csv_files[0], output_dir, args.period, args.workers, prefix, args.engine,
+                                      args.detail_columns, metrics=metrics, cache=cache, writer=args.writer,
+                                      tariff=tariff)
+        print(f"{len(reports)} branch reports saved to {output_dir}")
+        return 0
+
+    # A single file is processed in this process; batches go through the process pool
+    if len(csv_files) == 1:
+        excel_path = args.output or output_path_for(csv_files[0], args.output_dir)
+        run_job(csv_files[0], excel_path, args.period, args.engine, args.detail_columns, args.chunksize,
+                metrics_options, cache_options, periods, args.writer, shard_options, args.save_store, tariff,
+                args.detail_file)
+        print(f"Report successfully saved to {excel_path}")
+        return 0
+
+    # The batch pool already uses every worker, so each report writes its shard files one at a time
+    if shard_options is not None:
+        shard_options['workers'] = 1
+    jobs = [(csv_file_path, output_path_for(csv_file_path, args.output_dir)) for csv_file_path in csv_files]
+    results = run_batch(jobs, args.period, args.workers, args.engine, args.detail_columns, args.chunksize,
+                        metrics_options, cache_options, periods, args.writer, shard_options, args.save_store,
+                        tariff, args.detail_file)
+    failed = [result for result in results if result[2] is not None]
+    print(f"{len(results) - len(failed)} of {len(results)} reports generated")
+    return 1 if failed else 0
+
+
+def build_convert_parser():
+    """Return the argument parser for the secu-arrears-convert command."""
+    parser = argparse.ArgumentParser(
+        prog='secu-arrears-convert',
+        description='Write typed Parquet or Feather copies of device extract CSV files, which later reports '
+                    'read much faster than the CSV.'
+    )
+    parser.add_argument('inputs', nargs='+', help='CSV files, directories of CSV files or glob patterns')
+    parser.add_argument('-o', '--output', help='output path when a single CSV file is given')
+    parser.add_argument('--output-dir', help='directory for the copies (default: next to each CSV file)')
+    parser.add_argument('--format', choices=['parquet', 'feather'], default='parquet',
+                        help='file format of the copies (default: %(default)s)')
+    parser.add_argument('--engine', choices=CSV_ENGINES, default='c',
+                        help='CSV parser used for the conversion (default: %(default)s)')
+    parser.add_argument('--detail-columns', type=parse_column_list, default=None,
+                        help='comma separated extra columns to keep in the copy (default: all columns)')
+    return parser
+
+
+def convert_main(argv=None):
+    """Run the secu-arrears-convert command and return its exit status."""
+    parser = build_convert_parser()
+    args = parser.parse_args(argv)
+
+    csv_files = expand_inputs(args.inputs, extensions=['.csv'])
+    if not csv_files:
+        parser.error('no CSV files found')
+    if args.output and len(csv_files) > 1:
+        parser.error('--output can only be used with a single CSV file; use --output-dir instead')
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    for csv_file_path in csv_files:
+        output_path = args.output or output_path_for(csv_file_path, args.output_dir, '.' + args.format)
+        convert_extract(csv_file_path, output_path, args.engine, args.detail_columns)
+        print(f"Extract converted to {output_path}")
+    return 0
+
+
+def build_query_parser():
+    """Return the argument parser for the secu-arrears-query command."""
+    parser = argparse.ArgumentParser(
+        prog='secu-arrears-query',
+        description='Answer follow-up questions from a device store saved by secu-arrears --save-store, '
+                    'without reading the extract again.'
+    )
+    parser.add_argument('store', help='device store file')
+    parser.add_argument('--sabre-code', help='only rows of this SabreCode')
+    parser.add_argument('--branch', help='only rows of this Branch')
+    parser.add_argument('--item-code', help='only rows of this ItemCode')
+    state = parser.add_mutually_exclusive_group()
+    state.add_argument('--active', dest='active', action='store_const', const=True, default=None,
+                       help='only active devices')
+    state.add_argument('--inactive', dest='active', action='store_const', const=False,
+                       help='only inactive devices')
+    answer = parser.add_mutually_exclusive_group()
+    answer.add_argument('--fees', action='store_true', help='print the total Fee ex VAT of the matching rows')
+    answer.add_argument('--totals', choices=TOTALS_KEYS,
+                        help='print the matching rows totalled by SabreCode, Branch or ItemCode')
+    parser.add_argument('-o', '--output', help='save the devices or totals to this CSV file instead of printing them')
+    return parser
+
+
+def query_main(argv=None):
+    """Run the secu-arrears-query command and return its exit status."""
+    parser = build_query_parser()
+    args = parser.parse_args(argv)
+    if args.fees and args.output:
+        parser.error('--output cannot be used with --fees')
+
+    store = DeviceStore.load(args.store)
+    filters = {'sabre_code': args.sabre_code, 'branch': args.branch, 'item_code': args.item_code,
+               'active': args.active}
+    if args.fees:
+        print(f"{store.fees(**filters):.2f}")
+        return 0
+    if args.totals:
+        result = store.totals(args.totals, **filters)
+    else:
+        result = store.devices(**filters)
+    if args.output:
+        result.to_csv(args.output, index=not args.totals)
+        print(f"{len(result)} rows saved to {args.output}")
+    else:
+        print(result.to_string(index=not args.totals))
+    return 0
+
+
+def build_reconcile_parser():
+    """Return the argument parser for the secu-arrears-reconcile command."""
+    parser = argparse.ArgumentParser(
+        prog='secu-arrears-reconcile',
+        description='Compare two billing runs, such as last period\'s and this one, or an extract and its '
+                    'corrected copy, and save what changed per device and per SabreCode to a workbook.'
+    )
+    parser.add_argument('previous', help='extract or device store (.store) of the earlier run')
+    parser.add_argument('current', help='extract or device store (.store) of the later run')
+    parser.add_argument('-o', '--output', required=True, help='output .xlsx path')
+    parser.add_argument('-p', '--period', choices=DATE_OPTIONS, default=DATE_OPTIONS[0],
+                        help='billing period of a current extract (default: %(default)s)')
+    parser.add_argument('--previous-period', choices=DATE_OPTIONS, default=None,
+                        help='billing period of a previous extract (default: the same as --period)')
+    parser.add_argument('--engine', choices=CSV_ENGINES, default='c',
+                        help='CSV parser used for CSV extracts (default: %(default)s)')
+    parser.add_argument('--device-key', default=DEVICE_KEY,
+                        help='column that identifies a device within its SabreCode (default: %(default)s)')
+    parser.add_argument('--max-devices', type=int, default=DEFAULT_SHEET_DEVICES,
+                        help='most device changes listed on the sheet (default: %(default)s)')
+    parser.add_argument('--changes-file', nargs='?', choices=DETAIL_FORMATS, const='auto', default=None,
+                        metavar='FORMAT',
+                        help='also save every device change next to the workbook as <output>_changes.parquet '
+                             'or .csv.gz (FORMAT: %(choices)s; default: auto)')
+    parser.add_argument('--tariff', help='CSV table of the billed item codes and their billing rules')
+    parser.add_argument('--cache-dir',
+                        help='reuse results from earlier runs kept in this directory (needs pyarrow)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_BYTES // 2 ** 20,
+                        help='size cap of the cache directory in MB (default: %(default)s)')
+    return parser
+
+
+def reconcile_main(argv=None):
+    """Run the secu-arrears-reconcile command and return its exit status."""
+    parser = build_reconcile_parser()
+    args = parser.parse_args(argv)
+    if args.max_devices < 0:
+        parser.error('--max-devices cannot be negative')
+    tariff = DEFAULT_TARIFF
+    if args.tariff:
+        try:
+            tariff = load_tariff(args.tariff)
+        except (OSError, ValueError) as exc:
+            parser.error(f'invalid --tariff: {exc}')
+    cache = BillingCache(args.cache_dir, args.cache_size * 2 ** 20) if args.cache_dir else None
+
+    try:
+        result = process_reconciliation(args.previous, args.current, args.output, args.previous_period or args.period,
+                                        args.period, args.engine, args.device_key, args.max_devices,
+                                        args.changes_file, cache, tariff)
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(f"{len(result.device_changes)} device changes and {len(result.sabre_deltas) - 1} changed SabreCodes "
+          f"saved to {args.output}")
+    return 0
+
+
+def build_service_parser():
+    """Return the argument parser for the secu-arrears-service command."""
+    parser = argparse.ArgumentParser(
+        prog='secu-arrears-service',
+        description='Keep warm report workers running on this machine and generate the reports sent to them by '
+                    'secu-arrears --service and the GUI.'
+    )
+    parser.add_argument('--host', default=DEFAULT_HOST, help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='reports generated at once (default: number of CPUs)')
+    return parser
+
+
+def service_main(argv=None):
+    """Run the secu-arrears-service command until it is interrupted and return its exit status."""
+    parser = build_service_parser()
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    serve(args.host, args.port, args.workers)
+    return 0
+
+
+def build_watch_parser():
+    """Return the argument parser for the secu-arrears-watch command."""
+    parser = argparse.ArgumentParser(
+        prog='secu-arrears-watch',
+        description='Watch a drop folder and bill every extract copied into it, saving the reports to an outbox.'
+    )
+    parser.add_argument('inbox', help='folder to watch for extracts')
+    parser.add_argument('outbox', help='folder for the reports')
+    parser.add_argument('-p', '--period', choices=DATE_OPTIONS, default=DATE_OPTIONS[0],
+                        help='billing date range (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='reports generated at once (default: number of CPUs)')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='settled extracts that may wait for a worker before polling pauses '
+                             '(default: %(default)s)')
+    parser.add_argument('--poll-seconds', type=float, default=DEFAULT_POLL_SECONDS,
+                        help='seconds between polls of the inbox (default: %(default)s)')
+    parser.add_argument('--settle-seconds', type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help='seconds an extract must be unchanged before it is billed (default: %(default)s)')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help='times a failed extract is tried again (default: %(default)s)')
+    parser.add_argument('--retry-seconds', type=float, default=DEFAULT_RETRY_SECONDS,
+                        help='wait before the first retry, doubled for every further one (default: %(default)s)')
+    parser.add_argument('--engine', choices=CSV_ENGINES, default='c',
+                        help='CSV parser (default: %(default)s)')
+    parser.add_argument('--writer', choices=WRITER_BACKENDS, default='openpyxl',
+                        help='workbook writer (default: %(default)s)')
+    parser.add_argument('--tariff', help='CSV table of the billed item codes and their billing rules')
+    parser.add_argument('--once', action='store_true',
+                        help='stop once the inbox is empty instead of watching until interrupted')
+    return parser
+
+
+def watch_main(argv=None):
+    """Run the secu-arrears-watch command and return its exit status."""
+    parser = build_watch_parser()
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.inbox):
+        parser.error(f'{args.inbox} is not a directory')
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.queue_size < 1:
+        parser.error('--queue-size must be at least 1')
+    if args.retries < 0:
+        parser.error('--retries cannot be negative')
+    tariff = DEFAULT_TARIFF
+    if args.tariff:
+        try:
+            tariff = load_tariff(args.tariff)
+        except (OSError, ValueError) as exc:
+            parser.error(f'invalid --tariff: {exc}')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    watcher = FolderWatcher(args.inbox, args.outbox, args.period, args.workers, args.queue_size, args.poll_seconds,
+                            args.settle_seconds, args.retries, args.retry_seconds, args.engine, args.writer, tariff)
+    try:
+        metrics = asyncio.run(watcher.run(args.once))
+    except KeyboardInterrupt:
+        return 130
+    return 1 if metrics.counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
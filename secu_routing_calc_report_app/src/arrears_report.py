@@ -0,0 +1,311 @@
+"""Headless report generation for the SECU 6 month arrears bill.
+
+Nothing in this module touches the Tk user interface, so it can be scripted or run in worker processes.
+"""
+import os
+
+from billing_engine import (SummaryAccumulator, build_summary, classify_devices, classify_periods, finish_summary,
+                            option_period)
+from branch_reports import write_branch_reports
+from detail_export import write_summary_report
+from device_store import DeviceStore
+from extract_reader import iter_extract_chunks, read_extract
+from report_metrics import measure_report, stage_span
+from report_options import PERIOD_REPORT_STAGES, REPORT_STAGES  # noqa: F401
+from report_shards import DEFAULT_SHARD_ROWS, plan_shards, write_sharded_report
+from report_writer import write_period_report, write_report, write_streaming_report
+from tariff import DEFAULT_TARIFF
+
+# Detail rows written between two 'write detail' progress reports
+DETAIL_PROGRESS_ROWS = 10000
+
+
+class ReportCancelled(Exception):
+    """Raised from a progress callback to stop report generation before the workbook is saved."""
+
+
+def _report_stage(progress, stage, fraction=0.0):
+    """Call progress(stage, fraction) if a progress callback was given."""
+    if progress is not None:
+        progress(stage, fraction)
+
+
+def billing_dates(date_option):
+    """Return the (start_date, end_date, cutoff_date) used to classify devices for the date range option."""
+    period = option_period(date_option)
+    return period.start_date, period.end_date, period.cutoff_date
+
+
+def build_report(csv_file_path, date_option, engine='c', detail_columns=None, progress=None, metrics=None,
+                 cache=None, store_path=None, tariff=DEFAULT_TARIFF):
+    """Return the (summary_df, df_filtered) frames for the CSV file and selected date range option.
+
+    engine selects the CSV parser ('c' or 'pyarrow') and detail_columns limits the passthrough
+    columns kept for the 'Updated Data' sheet. progress is called as progress(stage, fraction) as
+    each of the REPORT_STAGES starts; fraction is the share of that stage already done, or None
+    when it is not known. A progress callback may raise ReportCancelled to stop the report.
+    metrics, a report_metrics.ReportMetrics, measures the 'load', 'compute' and 'summary' stages.
+    cache, a billing_cache.BillingCache, reuses the results of an unchanged extract and of the
+    unchanged SabreCode partitions of a corrected one. With store_path every classified row is
+    also saved there as a device_store.DeviceStore for later lookups; it cannot be combined with
+    cache, which does not keep the non-billable rows. tariff, a tariff.Tariff, gives the billed
+    item codes and the rules each one is billed by.
+    """
+    if cache is not None and store_path:
+        raise ValueError("A device store cannot be saved from cached results")
+    # Define start and end dates based on the selected option
+    start_date, end_date, cutoff_date = billing_dates(date_option)
+
+    _report_stage(progress, 'load')
+    with stage_span(metrics, 'load') as span:
+        cached = None
+        if cache is not None:
+            report_key = cache.report_key(csv_file_path, start_date, end_date, cutoff_date, engine, detail_columns,
+                                          tariff)
+            cached = cache.load_report(report_key)
+        if cached is None:
+            df_copy = read_extract(csv_file_path, engine=engine, detail_columns=detail_columns)
+            span.rows = len(df_copy)
+
+    # An unchanged extract has its totals and classified rows in the cache
+    if cached is not None:
+        totals, df_filtered = cached
+        _report_stage(progress, 'summary')
+        with stage_span(metrics, 'summary') as span:
+            summary_df = finish_summary(totals, tariff)
+            span.rows = len(df_filtered)
+        return summary_df, df_filtered
+
+    # Create 'DeviceActive', 'DaysActive', 'MonthsActive' and 'Fee ex VAT' columns
+    _report_stage(progress, 'compute')
+    with stage_span(metrics, 'compute') as span:
+        if cache is None:
+            classify_devices(df_copy, start_date, end_date, cutoff_date, tariff)
+        else:
+            totals = cache.classify(df_copy, start_date, end_date, cutoff_date, tariff)
+
+        # Filter for the billable item codes (17300 and 15300 by default)
+        df_filtered = df_copy[tariff.billable(df_copy['ItemCode'])].copy()
+        span.rows = len(df_copy)
+
+    if store_path:
+        with stage_span(metrics, 'store') as span:
+            save_device_store(df_copy, store_path, csv_file_path, date_option, tariff)
+            span.rows = len(df_copy)
+
+    _report_stage(progress, 'summary')
+    with stage_span(metrics, 'summary') as span:
+        if cache is None:
+            summary_df = build_summary(df_filtered, tariff)
+        else:
+            cache.store_report(report_key, totals, df_filtered)
+            summary_df = finish_summary(totals.copy(), tariff)
+        span.rows = len(df_filtered)
+    return summary_df, df_filtered
+
+
+def save_device_store(df, store_path, csv_file_path, date_option, tariff=DEFAULT_TARIFF):
+    """Save the classified rows of an extract as a DeviceStore, noting the extract, billing window and item codes."""
+    start_date, end_date, cutoff_date = billing_dates(date_option)
+    metadata = {
+        'extract': os.path.abspath(csv_file_path),
+        'period': date_option,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'cutoff_date': cutoff_date.isoformat(),
+        'item_codes': tariff.item_codes
+    }
+    return DeviceStore.from_frame(df, metadata=metadata).save(store_path)
+
+
+def _detail_chunks(df_filtered, progress):
+    """Yield df_filtered in slices of DETAIL_PROGRESS_ROWS rows, reporting progress before each one."""
+    n_rows = len(df_filtered)
+    for start in range(0, max(n_rows, 1), DETAIL_PROGRESS_ROWS):
+        _report_stage(progress, 'write detail', start / n_rows if n_rows else 0.0)
+        yield df_filtered.iloc[start:start + DETAIL_PROGRESS_ROWS]
+
+
+def stream_report(csv_file_path, excel_path, date_option, chunksize, detail_columns=None, progress=None,
+                  metrics=None, writer='openpyxl', tariff=DEFAULT_TARIFF):
+    """Write the report while reading the CSV file chunksize rows at a time, and return the summary_df.
+
+    Only one chunk is held in memory at once: each chunk is classified, folded into the running
+    per-SabreCode totals and streamed to the 'Updated Data' sheet before the next one is read.
+    Every chunk is reported to progress as 'write detail' with an unknown fraction.
+    """
+    start_date, end_date, cutoff_date = billing_dates(date_option)
+    accumulator = SummaryAccumulator(tariff)
+    summary = []
+
+    def billable_chunks():
+        chunks = iter_extract_chunks(csv_file_path, chunksize, detail_columns)
+        while True:
+            with stage_span(metrics, 'load') as span:
+                chunk = next(chunks, None)
+                span.rows = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            _report_stage(progress, 'write detail', None)
+            with stage_span(metrics, 'compute') as span:
+                classify_devices(chunk, start_date, end_date, cutoff_date, tariff)
+                chunk_filtered = chunk[tariff.billable(chunk['ItemCode'])]
+                span.rows = len(chunk)
+            with stage_span(metrics, 'summary') as span:
+                accumulator.add(chunk_filtered)
+                span.rows = len(chunk_filtered)
+            yield chunk_filtered
+
+    def make_summary():
+        _report_stage(progress, 'summary')
+        with stage_span(metrics, 'summary'):
+            summary.append(finish_summary(accumulator.totals(), tariff))
+        return summary[0]
+
+    _report_stage(progress, 'load')
+    write_streaming_report(excel_path, billable_chunks(), make_summary, progress=progress, metrics=metrics,
+                           writer=writer)
+    return summary[0]
+
+
+def build_period_summaries(csv_file_path, periods, engine='c', chunksize=None, progress=None, metrics=None,
+                           tariff=DEFAULT_TARIFF):
+    """Return {period name: summary_df} for a list of billing_engine.BillingPeriods, from one read of the extract.
+
+    Only the billing columns are read, once, and every row is classified against all the periods
+    together by classify_periods. Each summary is identical to the one build_report gives for
+    that period alone. With chunksize set the extract is read that many rows at a time (C engine
+    only). progress and metrics are used as in build_report, with the PERIOD_REPORT_STAGES.
+    """
+    if chunksize and engine != 'c':
+        raise ValueError("Chunked reading is only supported by the 'c' CSV engine")
+    names = [period.name for period in periods]
+    if len(set(names)) != len(names):
+        raise ValueError("Billing period names must be unique")
+    accumulator = SummaryAccumulator(tariff, n_periods=len(periods))
+    if chunksize:
+        chunks = iter_extract_chunks(csv_file_path, chunksize, detail_columns=[])
+    else:
+        chunks = (read_extract(csv_file_path, engine=engine, detail_columns=[]) for _ in range(1))
+
+    _report_stage(progress, 'load')
+    while True:
+        with stage_span(metrics, 'load') as span:
+            chunk = next(chunks, None)
+            span.rows = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+
+        # Classify the billable rows against every period at once and fold them into every period's totals
+        _report_stage(progress, 'compute', None if chunksize else 0.0)
+        with stage_span(metrics, 'compute') as span:
+            chunk_filtered = chunk[tariff.billable(chunk['ItemCode'])]
+            active, fees = classify_periods(chunk_filtered, periods, tariff)
+            accumulator.add_classified(chunk_filtered, active, fees)
+            span.rows = len(chunk)
+
+    _report_stage(progress, 'summary')
+    with stage_span(metrics, 'summary') as span:
+        summaries = {period.name: finish_summary(accumulator.totals(index), tariff)
+                     for index, period in enumerate(periods)}
+        span.rows = sum(len(summary_df) for summary_df in summaries.values())
+    return summaries
+
+
+def process_periods(csv_file_path, excel_path, periods, engine='c', chunksize=None, progress=None, metrics=None,
+                    writer='openpyxl', tariff=DEFAULT_TARIFF):
+    """Bill several periods from one read of the CSV file and save one Summary sheet per period.
+
+    periods is a list of billing_engine.BillingPeriods, for example billing_engine.recent_periods(3).
+    Returns the {period name: summary_df} frames that were written, in the order of periods.
+    """
+    with measure_report(metrics, excel_path):
+        summaries = build_period_summaries(csv_file_path, periods, engine, chunksize, progress, metrics, tariff)
+        write_period_report(excel_path, summaries, progress=progress, metrics=metrics, writer=writer)
+    return summaries
+
+
+def process_data(csv_file_path, excel_path, date_option, engine='c', detail_columns=None, chunksize=None,
+                 progress=None, metrics=None, cache=None, writer='openpyxl', store_path=None, tariff=DEFAULT_TARIFF,
+                 detail_format=None):
+    """Process the CSV file and save the report to an Excel file based on the selected date range option.
+
+    Returns the (summary_df, df_filtered) frames that were written. With chunksize set the CSV file
+    is streamed in chunks of that many rows (C engine only) and df_filtered is returned as None.
+    progress is described in build_report; when it raises ReportCancelled no file is saved.
+    metrics, a report_metrics.ReportMetrics, measures every stage and emits the measurements once
+    the report is saved; without it nothing is measured. cache is described in build_report and
+    cannot be combined with chunksize. writer names the report_writer.WRITER_BACKENDS used to
+    write the workbook. When there are more billable rows than one Excel sheet holds, the detail
+    is split by row count across several sheets, as process_sharded does. store_path is described
+    in build_report and cannot be combined with chunksize; tariff is described in build_report.
+    With detail_format, one of detail_export.DETAIL_FORMATS, the workbook holds only the Summary
+    and the detail rows are saved next to it as a Parquet or gzip CSV file; this cannot be
+    combined with chunksize.
+    """
+    if chunksize and engine != 'c':
+        raise ValueError("Chunked reading is only supported by the 'c' CSV engine")
+    if chunksize and cache is not None:
+        raise ValueError("The billing cache cannot be used with chunked reading")
+    if chunksize and store_path:
+        raise ValueError("A device store cannot be saved with chunked reading")
+    if chunksize and detail_format:
+        raise ValueError("A detail file cannot be written with chunked reading")
+    with measure_report(metrics, excel_path):
+        if chunksize:
+            summary_df = stream_report(csv_file_path, excel_path, date_option, chunksize, detail_columns, progress,
+                                       metrics, writer, tariff)
+            return summary_df, None
+        summary_df, df_filtered = build_report(csv_file_path, date_option, engine, detail_columns, progress,
+                                               metrics, cache, store_path, tariff)
+        if detail_format:
+            write_summary_report(excel_path, summary_df, df_filtered, detail_format, progress=progress,
+                                 metrics=metrics, writer=writer)
+            return summary_df, df_filtered
+        if len(df_filtered) > DEFAULT_SHARD_ROWS:
+            shards = plan_shards(df_filtered, 'rows', DEFAULT_SHARD_ROWS)
+            write_sharded_report(excel_path, summary_df, df_filtered, shards, progress=progress, metrics=metrics,
+                                 writer=writer)
+            return summary_df, df_filtered
+        detail = df_filtered if progress is None else _detail_chunks(df_filtered, progress)
+        write_report(excel_path, summary_df, detail, progress=progress, metrics=metrics, writer=writer)
+    return summary_df, df_filtered
+
+
+def process_sharded(csv_file_path, excel_path, date_option, shard_by='rows', max_rows=DEFAULT_SHARD_ROWS,
+                    files=False, workers=None, engine='c', detail_columns=None, progress=None, metrics=None,
+                    cache=None, writer='openpyxl', tariff=DEFAULT_TARIFF):
+    """Process the CSV file and save the report with its detail rows split into shards.
+
+    shard_by is one of report_shards.SHARD_KEYS and max_rows caps the rows of every shard. With
+    files set the shards are written as companion workbooks by up to workers processes and the
+    report holds only the Summary and the 'Detail Index'; otherwise every shard is a sheet of the
+    report. The other arguments are described in process_data. Returns the (summary_df,
+    df_filtered) frames and the index entries written.
+    """
+    with measure_report(metrics, excel_path):
+        summary_df, df_filtered = build_report(csv_file_path, date_option, engine, detail_columns, progress,
+                                               metrics, cache, tariff=tariff)
+        shards = plan_shards(df_filtered, shard_by, max_rows)
+        entries = write_sharded_report(excel_path, summary_df, df_filtered, shards, files, workers,
+                                       progress=progress, metrics=metrics, writer=writer)
+    return summary_df, df_filtered, entries
+
+
+def process_branches(csv_file_path, output_dir, date_option, workers=None, prefix='', engine='c', detail_columns=None,
+                     progress=None, metrics=None, cache=None, writer='openpyxl', tariff=DEFAULT_TARIFF):
+    """Process the CSV file once and save one report per Branch to output_dir, in parallel.
+
+    The extract is loaded and classified once; the Branch partitions are then rendered by up to
+    workers processes (one per CPU by default), each into a workbook named after its branch.
+    The other arguments are described in process_data; metrics saves its measurements next to
+    output_dir. Returns the summary_df of the whole extract and a list of (branch, excel_path,
+    rows) for the workbooks written.
+    """
+    with measure_report(metrics, os.path.normpath(output_dir)):
+        summary_df, df_filtered = build_report(csv_file_path, date_option, engine, detail_columns, progress,
+                                               metrics, cache, tariff=tariff)
+        _report_stage(progress, 'write detail', 0.0)
+        reports = write_branch_reports(df_filtered, output_dir, workers, prefix, progress=progress, metrics=metrics,
+                                       writer=writer, tariff=tariff)
+    return summary_df, reports
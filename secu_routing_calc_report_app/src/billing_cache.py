@@ -0,0 +1,179 @@
+"""On-disk cache of classified rows and per-SabreCode totals, for re-billing an extract after small corrections.
+
+A report is cached whole under a key made from the CSV file's content hash and size, the billing window,
+the tariff and the read options, so regenerating an unchanged extract skips both the CSV parse
+and the computation. Underneath, rows are split into partitions by SabreCode and every partition is cached
+by the content of its billing columns: when a corrected extract comes in, only the partitions whose rows
+changed are classified and totalled again. Everything is stored as Parquet files and the cache is kept
+under a size cap by evicting the least recently used items.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from billing_engine import SummaryAccumulator, classify_devices, code_order
+from extract_reader import BILLING_COLUMNS
+from tariff import DEFAULT_TARIFF
+
+# Bump when the cached layout or the billing rules change, so older entries are never reused
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'secu_arrears')
+DEFAULT_CACHE_BYTES = 2 * 2 ** 30
+
+# Rows are spread over this many partitions by a stable hash of their SabreCode
+CACHE_PARTITIONS = 64
+
+# Columns added by classify_devices that are cached per partition; DeviceActive is stored as a flag
+CLASSIFIED_COLUMNS = ['DeviceActive', 'DaysActive', 'MonthsActive', 'Fee ex VAT']
+CACHED_COLUMNS = ['Active', 'DaysActive', 'MonthsActive', 'Fee ex VAT']
+
+HASH_BLOCK_BYTES = 2 ** 20
+
+
+def file_fingerprint(csv_file_path):
+    """Return the (size, sha256 hex digest) of a file's contents."""
+    digest = hashlib.sha256()
+    with open(csv_file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return os.path.getsize(csv_file_path), digest.hexdigest()
+
+
+def _key(*parts):
+    """Return a cache key for JSON-serialisable parts."""
+    text = json.dumps([CACHE_VERSION] + list(parts), default=str, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class BillingCache:
+    """Parquet cache of report results under cache_dir, holding at most max_bytes."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES, partitions=CACHE_PARTITIONS):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("The billing cache requires the pyarrow package (pip install pyarrow)")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.partitions = partitions
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def report_key(self, csv_file_path, start_date, end_date, cutoff_date, engine='c', detail_columns=None,
+                   tariff=DEFAULT_TARIFF):
+        """Return the key of a whole report: file fingerprint, billing window, tariff and read options."""
+        size, content_hash = file_fingerprint(csv_file_path)
+        return _key('report', size, content_hash, start_date, end_date, cutoff_date, tariff.key(),
+                    engine, detail_columns)
+
+    def load_report(self, key):
+        """Return the cached (totals, df_filtered) for a report key, or None on a miss."""
+        frames = self._load(key, ['totals', 'rows'])
+        return None if frames is None else (frames['totals'], frames['rows'])
+
+    def store_report(self, key, totals, df_filtered):
+        """Cache the per-SabreCode totals and the classified billable rows of a report."""
+        self._store(key, {'totals': totals, 'rows': df_filtered})
+        self.evict()
+
+    def classify(self, df, start_date, end_date, cutoff_date, tariff=DEFAULT_TARIFF):
+        """Classify df in place as classify_devices does and return the per-SabreCode totals of its billable rows.
+
+        Partitions whose billing columns are unchanged since they were cached are taken from the cache;
+        only the others are classified and totalled. Every SabreCode falls in exactly one partition and
+        keeps its rows in file order, so the totals are identical to accumulating the whole frame.
+        """
+        window = (start_date, end_date, cutoff_date, tariff.key())
+        row_hashes = pd.util.hash_pandas_object(df[BILLING_COLUMNS], index=False).to_numpy()
+        partition_of_row = pd.util.hash_array(df['SabreCode'].to_numpy(dtype=object)) % self.partitions
+        order = np.argsort(partition_of_row, kind='stable')
+        bounds = np.searchsorted(partition_of_row[order], np.arange(self.partitions + 1))
+
+        classified = {col: [] for col in CACHED_COLUMNS}
+        row_order = []
+        totals = []
+        for partition in range(self.partitions):
+            rows = order[bounds[partition]:bounds[partition + 1]]
+            if not len(rows):
+                continue
+            key = _key('partition', window, hashlib.sha256(row_hashes[rows].tobytes()).hexdigest())
+            frames = self._load(key, ['classified', 'totals'])
+            if frames is None:
+                part = df.iloc[rows].copy()
+                classify_devices(part, start_date, end_date, cutoff_date, tariff)
+                accumulator = SummaryAccumulator(tariff)
+                accumulator.add(part[tariff.billable(part['ItemCode'])])
+                classified_part = part[CLASSIFIED_COLUMNS[1:]].reset_index(drop=True)
+                classified_part.insert(0, 'Active', part['DeviceActive'].to_numpy(dtype=object) == 'Active')
+                frames = {'classified': classified_part, 'totals': accumulator.totals()}
+                self._store(key, frames)
+            for col in CACHED_COLUMNS:
+                classified[col].append(frames['classified'][col].to_numpy())
+            row_order.append(rows)
+            totals.append(frames['totals'])
+
+        # Put the partition results back in file order
+        positions = np.concatenate(row_order) if row_order else np.empty(0, dtype=np.int64)
+        columns = {}
+        for col in CACHED_COLUMNS:
+            values = np.concatenate(classified[col]) if classified[col] else np.empty(0)
+            columns[col] = np.empty(len(df), dtype=values.dtype)
+            columns[col][positions] = values
+        df['DeviceActive'] = np.where(columns.pop('Active').astype(bool), 'Active', 'Inactive')
+        for col, values in columns.items():
+            df[col] = values
+        self.evict()
+        if not totals:
+            return SummaryAccumulator(tariff).totals()
+        return pd.concat(totals, ignore_index=True).sort_values('SabreCode', ignore_index=True, key=code_order)
+
+    def _item_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _load(self, key, names):
+        """Return the named frames of a cached item and mark it as recently used, or None on a miss."""
+        item_dir = self._item_dir(key)
+        try:
+            frames = {name: pd.read_parquet(os.path.join(item_dir, f'{name}.parquet')) for name in names}
+            os.utime(item_dir)
+        except Exception:
+            # A missing, half-evicted or unreadable item is simply a miss
+            return None
+        return frames
+
+    def _store(self, key, frames):
+        """Write the frames of an item to a temporary directory and move it into place."""
+        item_dir = self._item_dir(key)
+        if os.path.isdir(item_dir):
+            return
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            for name, frame in frames.items():
+                frame.to_parquet(os.path.join(tmp_dir, f'{name}.parquet'))
+            os.rename(tmp_dir, item_dir)
+        except OSError:
+            # Another process stored the same item first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def evict(self):
+        """Remove the least recently used items until the cache fits in max_bytes."""
+        items = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or entry.name.startswith('.tmp-'):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                items.append((entry.stat().st_mtime, size, entry.path))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in items)
+        for _, size, path in sorted(items):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,336 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from report_options import DATE_OPTIONS
+from tariff import DEFAULT_TARIFF
+
+# Item codes that are billed on the 6 month arrears report by default
+BILLABLE_ITEM_CODES = DEFAULT_TARIFF.item_codes
+
+ONE_DAY = np.timedelta64(1, 'D')
+
+# Devices first seen after 30 March of the year a billing window ends are billed from their first signal
+CUTOFF_MONTH_DAY = '03-30'
+
+# A billing window: the sheet name and the dates classify_devices is called with
+BillingPeriod = namedtuple('BillingPeriod', ['name', 'start_date', 'end_date', 'cutoff_date'])
+
+
+def resolve_billing_window(date_option, current_year=None):
+    """Return the (start_date, end_date) timestamps for the selected date range option."""
+    if current_year is None:
+        current_year = pd.Timestamp.now().year
+    previous_year = current_year - 1
+
+    if date_option == 'April - September':
+        start_date = pd.Timestamp(f'{current_year}-04-01')
+        end_date = pd.Timestamp(f'{current_year}-09-30')
+    elif date_option == 'October - March':
+        start_date = pd.Timestamp(f'{previous_year}-10-01')
+        end_date = pd.Timestamp(f'{current_year}-03-31')
+    else:
+        raise ValueError("Invalid date option selected")
+    return start_date, end_date
+
+
+def billing_period(start_date, end_date, cutoff_date=None, name=None):
+    """Return the BillingPeriod for an arbitrary window.
+
+    cutoff_date defaults to 30 March of the year end_date falls in, and name to the two dates.
+    """
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+    if cutoff_date is None:
+        cutoff_date = f'{end_date.year}-{CUTOFF_MONTH_DAY}'
+    if name is None:
+        name = f'{start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}'
+    return BillingPeriod(name, start_date, end_date, pd.Timestamp(cutoff_date))
+
+
+def option_period(date_option, year=None):
+    """Return the BillingPeriod of a date range option in the given year (default: this year)."""
+    if year is None:
+        year = pd.Timestamp.now().year
+    start_date, end_date = resolve_billing_window(date_option, year)
+    return billing_period(start_date, end_date, name=f'{date_option} {year}')
+
+
+def recent_periods(years, current_year=None):
+    """Return the BillingPeriods of every date range option in the last years years, oldest first."""
+    if current_year is None:
+        current_year = pd.Timestamp.now().year
+    periods = [option_period(date_option, year)
+               for year in range(current_year - years + 1, current_year + 1)
+               for date_option in DATE_OPTIONS]
+    return sorted(periods, key=lambda period: period.start_date)
+
+
+def whole_days(later, earlier):
+    """Return the whole days between two datetime64 arrays, floored like Timedelta.days."""
+    return (later - earlier) // ONE_DAY
+
+
+def classify_devices(df, start_date, end_date, cutoff_date, tariff=DEFAULT_TARIFF):
+    """Add the DeviceActive, DaysActive, MonthsActive and Fee ex VAT columns to df in place.
+
+    DaysActive is measured from FirstSignalDate for devices first seen after cutoff_date
+    and from start_date otherwise. Only active rows are evaluated; every other row is 0. Each
+    row is billed by the rules of its ItemCode in the tariff, a tariff.Tariff; rows whose code
+    the tariff does not bill are never active.
+    """
+    first = df['FirstSignalDate'].to_numpy()
+    last = df['LastSignalDate'].to_numpy()
+    start = start_date.to_datetime64()
+    end = end_date.to_datetime64()
+    cutoff = cutoff_date.to_datetime64()
+
+    # Days between first and last signal, only where both dates are known
+    known = ~(np.isnat(first) | np.isnat(last))
+    signal_days = np.zeros(len(df), dtype=np.int64)
+    signal_days[known] = whole_days(last[known], first[known])
+
+    # Create 'DeviceActive' column, with each row's threshold taken from its tariff rule
+    rule_index = tariff.rule_index(df['ItemCode'])
+    active = (
+        known &
+        (last > start) &
+        (last < end) &
+        (rule_index >= 0) &
+        (signal_days > tariff.threshold_days[np.maximum(rule_index, 0)])
+    )
+    df['DeviceActive'] = np.where(active, 'Active', 'Inactive')
+
+    # Create 'DaysActive' column, measured only over the active rows
+    days_active = np.zeros(len(df), dtype=np.int64)
+    active_first = first[active]
+    days_active[active] = np.where(
+        active_first > cutoff,
+        signal_days[active],
+        whole_days(last[active], start)
+    )
+    df['DaysActive'] = days_active
+
+    # Create 'MonthsActive' column (ceiling division by default)
+    df['MonthsActive'] = tariff.months(days_active, rule_index)
+
+    # Create 'Fee ex VAT' column
+    df['Fee ex VAT'] = df['MonthsActive'] * df['Amount']
+
+
+def classify_periods(df, periods, tariff=DEFAULT_TARIFF):
+    """Return the DeviceActive flags and Fee ex VAT of df's rows in every period, each shaped (periods, rows).
+
+    The rules are those of classify_devices, but every row's signal dates are compared against all
+    the window boundaries at once by broadcasting, so several periods are billed in a single pass.
+    Only rows that can be active in some period are evaluated; every other fee is 0.
+    """
+    first = df['FirstSignalDate'].to_numpy()
+    last = df['LastSignalDate'].to_numpy()
+    starts = np.array([period.start_date.to_datetime64() for period in periods])[:, None]
+    ends = np.array([period.end_date.to_datetime64() for period in periods])[:, None]
+    cutoffs = np.array([period.cutoff_date.to_datetime64() for period in periods])[:, None]
+
+    # Rows with both dates, a billable ItemCode and enough signal days, whatever the window
+    known = ~(np.isnat(first) | np.isnat(last))
+    signal_days = np.zeros(len(df), dtype=np.int64)
+    signal_days[known] = whole_days(last[known], first[known])
+    rule_index = tariff.rule_index(df['ItemCode'])
+    candidates = np.flatnonzero(
+        known &
+        (rule_index >= 0) &
+        (signal_days > tariff.threshold_days[np.maximum(rule_index, 0)])
+    )
+    first = first[candidates]
+    last = last[candidates]
+    signal_days = signal_days[candidates]
+    rule_index = rule_index[candidates]
+
+    # Window tests and DaysActive for every (period, candidate row) pair
+    candidate_active = (last > starts) & (last < ends)
+    days_active = np.where(
+        candidate_active,
+        np.where(first > cutoffs, signal_days, whole_days(last, starts)),
+        0
+    )
+
+    active = np.zeros((len(periods), len(df)), dtype=bool)
+    active[:, candidates] = candidate_active
+    fees = np.zeros((len(periods), len(df)))
+    fees[:, candidates] = tariff.months(days_active, rule_index) * df['Amount'].to_numpy(dtype=float)[candidates]
+    return active, fees
+
+
+class SummaryAccumulator:
+    """Running per-SabreCode fee totals and active counts over chunks of classified, billable rows.
+
+    Fees are added in row order, so folding an extract in chunks gives exactly the same totals as
+    adding it in one piece. Branch is the first non-empty Branch seen for each SabreCode. With
+    n_periods the same rows are totalled separately for each of several billing periods, sharing
+    the SabreCode and ItemCode lookups; totals(period) returns one period's totals. Fees are
+    totalled per item code of the tariff, in one pass whatever the number of codes.
+    """
+
+    def __init__(self, tariff=DEFAULT_TARIFF, n_periods=1):
+        self.tariff = tariff
+        self.item_codes = list(tariff.item_codes)
+        self.n_periods = n_periods
+        self.sabre_codes = []
+        self.positions = {}
+        self.branches = np.empty(0, dtype=object)
+        self.item_fees = np.zeros((n_periods, len(self.item_codes), 0))
+        self.total_active = np.zeros((n_periods, 0), dtype=np.int64)
+        self.total_fees = np.zeros((n_periods, 0))
+
+    def _group_index(self, sabre_codes):
+        """Return the running group position of each row, or -1 where SabreCode is missing."""
+        row_codes, uniques = pd.factorize(sabre_codes)
+        new_codes = [code for code in uniques if code not in self.positions]
+        if new_codes:
+            for code in new_codes:
+                self.positions[code] = len(self.sabre_codes)
+                self.sabre_codes.append(code)
+            grow = len(new_codes)
+            self.branches = np.concatenate([self.branches, np.full(grow, None, dtype=object)])
+            self.item_fees = np.pad(self.item_fees, ((0, 0), (0, 0), (0, grow)))
+            self.total_active = np.pad(self.total_active, ((0, 0), (0, grow)))
+            self.total_fees = np.pad(self.total_fees, ((0, 0), (0, grow)))
+        if not len(uniques):
+            return np.full(len(row_codes), -1, dtype=np.int64)
+        unique_positions = np.array([self.positions[code] for code in uniques], dtype=np.int64)
+        return np.where(row_codes >= 0, unique_positions[np.maximum(row_codes, 0)], -1)
+
+    def add(self, df_filtered):
+        """Fold a chunk of classified, billable rows into the running totals in one vectorized pass."""
+        self.add_classified(
+            df_filtered,
+            (df_filtered['DeviceActive'].to_numpy(dtype=object) == 'Active')[None, :],
+            df_filtered['Fee ex VAT'].to_numpy(dtype=float)[None, :]
+        )
+
+    def add_classified(self, df_filtered, active, fees):
+        """Fold billable rows into the running totals of every period, given their DeviceActive flags and fees.
+
+        active and fees are (n_periods, rows) arrays, as returned by classify_periods; df_filtered
+        only needs its SabreCode, Branch and ItemCode columns.
+        """
+        groups = self._group_index(df_filtered['SabreCode'])
+        keep = groups >= 0
+        groups = groups[keep]
+        n_groups = len(self.sabre_codes)
+        fees = fees[:, keep]
+        fees = np.where(np.isnan(fees), 0.0, fees)
+        code_index = self.tariff.rule_index(df_filtered['ItemCode'])[keep]
+        active = active[:, keep]
+
+        # Fee totals per (period, ItemCode, SabreCode) cell, with one flat bin per cell
+        period_index = np.arange(self.n_periods)[:, None]
+        is_item = code_index >= 0
+        cells = (period_index * len(self.item_codes) + code_index[is_item]) * n_groups + groups[is_item]
+        item_fees = _running_bincount(self.item_fees.ravel(), cells.ravel(), fees[:, is_item].ravel())
+        self.item_fees = item_fees.reshape(self.n_periods, len(self.item_codes), n_groups)
+
+        # Fee totals and active counts per (period, SabreCode)
+        bins = (period_index * n_groups + groups).ravel()
+        self.total_fees = _running_bincount(self.total_fees.ravel(), bins, fees.ravel()).reshape(
+            self.n_periods, n_groups)
+        self.total_active += np.bincount(bins[active.ravel()], minlength=self.n_periods * n_groups).reshape(
+            self.n_periods, n_groups)
+
+        # Keep the first non-empty Branch of every SabreCode
+        branches = df_filtered['Branch'].to_numpy(dtype=object)[keep]
+        has_branch = pd.notna(branches)
+        missing = pd.isna(self.branches)
+        if missing.any() and has_branch.any():
+            branch_groups, first_rows = np.unique(groups[has_branch], return_index=True)
+            fill = missing[branch_groups]
+            self.branches[branch_groups[fill]] = branches[has_branch][first_rows[fill]]
+
+    def totals(self, period=0):
+        """Return the per-SabreCode totals of a period, sorted by SabreCode as code_order sorts them."""
+        totals = pd.DataFrame({'SabreCode': self.sabre_codes, 'Branch': self.branches})
+        for code_index, item_code in enumerate(self.item_codes):
+            totals[f'ItemCode_{item_code}'] = self.item_fees[period, code_index]
+        totals['TotalActive'] = self.total_active[period]
+        totals['Total_ex_VAT'] = self.total_fees[period]
+        return totals.sort_values('SabreCode', ignore_index=True, key=code_order)
+
+
+def code_order(codes):
+    """Return a code column's sort keys: the codes as numbers when every one is a plain integer.
+
+    The extract's code columns are read as text, so SabreCodes such as '9' and '10' would
+    otherwise sort as text; passed as sort_values' key, this keeps them in numeric order.
+    """
+    values = codes.astype(object)
+    text = values.dropna().astype(str)
+    if len(text) and text.str.fullmatch(r'[0-9]+').all():
+        return pd.to_numeric(values)
+    return codes
+
+
+def _running_bincount(totals, bins, weights):
+    """Return totals with weights added to their bins, one row at a time in row order.
+
+    The running totals are fed to np.bincount ahead of the new rows, so each sum is built in
+    exactly the order the rows were read, whether they arrive in one piece or in chunks.
+    """
+    return np.bincount(
+        np.concatenate([np.arange(len(totals)), bins]),
+        weights=np.concatenate([totals, weights]),
+        minlength=len(totals)
+    )
+
+
+def build_summary(df_filtered, tariff=DEFAULT_TARIFF):
+    """Return the per-SabreCode summary of df_filtered, ending with a blank row and the 'Total' row."""
+    accumulator = SummaryAccumulator(tariff)
+    accumulator.add(df_filtered)
+    return finish_summary(accumulator.totals(), tariff)
+
+
+def finish_summary(summary_df, tariff=DEFAULT_TARIFF):
+    """Add the derived columns, blank row and 'Total' row to the per-SabreCode totals.
+
+    The fee columns are named after the tariff labels, and the % Split columns compare the
+    tariff's 'share' code with its 'base' code (15300 and 17300 by default); a tariff without a
+    split has no % Split columns. The derived columns stay numeric: a split with no base fees is
+    0, and a Price Per Unit with no active devices is NaN. The '-' placeholders are added when
+    the sheet is written.
+    """
+    total_active = summary_df['TotalActive']
+
+    # Calculate 'Price Per Unit' column
+    summary_df['Price Per Unit'] = (summary_df['Total_ex_VAT'] / total_active).where(total_active > 0)
+
+    # Rename columns
+    summary_df.rename(columns={f'ItemCode_{rule.item_code}': rule.label for rule in tariff.rules}, inplace=True)
+
+    # Add new columns to summary_df
+    if tariff.split_base is not None:
+        base, share = tariff.split_base, tariff.split_share
+        base_fees = summary_df[base].to_numpy(dtype=float)
+        summary_df['% Split'] = np.divide(
+            summary_df[share].to_numpy(dtype=float), base_fees,
+            out=np.zeros(len(summary_df)), where=base_fees != 0
+        )
+        summary_df[f'% {share}'] = (total_active * summary_df['% Split']).round()
+        summary_df[f'% {base}'] = total_active - summary_df[f'% {share}']
+
+    # Calculate the total sum for 'Total_ex_VAT'
+    total_ex_vat = summary_df['Total_ex_VAT'].sum()
+
+    # Append the total and empty row
+    columns = ['SabreCode', 'Branch'] + tariff.labels + ['TotalActive', 'Price Per Unit', 'Total_ex_VAT']
+    empty_row = pd.DataFrame({col: [None] for col in columns})
+    total_row = empty_row.copy()
+    total_row['SabreCode'] = ['Total']
+    total_row['Total_ex_VAT'] = [total_ex_vat]
+
+    empty_row = empty_row.dropna(how='all', axis=1)
+    total_row = total_row.dropna(how='all', axis=1)
+
+    summary_df = pd.concat([summary_df, empty_row, total_row], ignore_index=True)
+
+    return summary_df
@@ -0,0 +1,131 @@
+"""One arrears workbook per Branch, rendered in parallel from a single load of the extract.
+
+The extract is read and classified once. The billable rows are then written, grouped by Branch, to
+one Arrow IPC file in a temporary directory. Each worker process memory-maps that file and takes a
+zero-copy slice holding its branch's rows, so the partitions are never pickled, and renders the
+branch's styled Summary and 'Updated Data' workbook.
+"""
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from billing_engine import build_summary
+from report_metrics import stage_span
+from report_shards import plan_shards, safe_file_label
+from report_writer import REPORT_TITLE, write_report
+from tariff import DEFAULT_TARIFF
+
+PARTITION_FILE = 'partitions.arrow'
+
+
+def _import_pyarrow():
+    """Return the pyarrow module, which passes the partitions to the worker processes."""
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Per-branch reports require the pyarrow package (pip install pyarrow)")
+    return pyarrow
+
+
+def branch_file_name(branch, prefix=''):
+    """Return the file name of a branch workbook, made safe for file systems."""
+    return f'{prefix}{safe_file_label(branch)}.xlsx'
+
+
+def branch_file_names(branches, prefix=''):
+    """Return distinct file names for the branch workbooks, in the order of branches.
+
+    Branches whose names clean up to the same label, such as 'Durban/North' and 'Durban North',
+    or a real 'No Branch' next to the rows without a Branch, get a '_2', '_3', ... suffix. Names
+    are compared without case, as Windows file systems do.
+    """
+    names = []
+    taken = set()
+    for branch in branches:
+        name = branch_file_name(branch, prefix)
+        suffix = 2
+        while name.lower() in taken:
+            name = branch_file_name(f'{branch}_{suffix}', prefix)
+            suffix += 1
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+
+def write_partition_file(df_filtered, ipc_path):
+    """Write df_filtered to an Arrow IPC file with its rows grouped by Branch.
+
+    Returns a list of (branch, offset, rows) giving each branch's rows in the file, in Branch
+    order; rows keep their file order within a branch and rows with no Branch come last.
+    """
+    pa = _import_pyarrow()
+    partitions = plan_shards(df_filtered, 'branch', max(len(df_filtered), 1))
+    order = np.concatenate([positions for _, positions in partitions]) if partitions else np.arange(0)
+    table = pa.Table.from_pandas(df_filtered.iloc[order], preserve_index=False)
+    with pa.OSFile(ipc_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as ipc_writer:
+        ipc_writer.write_table(table)
+
+    offsets = np.cumsum([0] + [len(positions) for _, positions in partitions])
+    return [(branch, int(offset), len(positions)) for (branch, positions), offset in zip(partitions, offsets)]
+
+
+def read_partition(ipc_path, offset, rows):
+    """Return rows rows of the partition file, starting at offset, as a DataFrame.
+
+    The file is memory-mapped and sliced without copying; only the DataFrame conversion copies.
+    """
+    pa = _import_pyarrow()
+    with pa.memory_map(ipc_path) as source:
+        table = pa.ipc.open_file(source).read_all().slice(offset, rows)
+        df = table.to_pandas()
+    for col in df.select_dtypes('category').columns:
+        df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+def write_branch_workbook(ipc_path, offset, rows, excel_path, title=REPORT_TITLE, writer='openpyxl',
+                          tariff=DEFAULT_TARIFF):
+    """Render one branch's Summary and 'Updated Data' workbook from its slice of the partition file."""
+    df_branch = read_partition(ipc_path, offset, rows)
+    write_report(excel_path, build_summary(df_branch, tariff), df_branch, title, writer=writer)
+    return excel_path
+
+
+def write_branch_reports(df_filtered, output_dir, workers=None, prefix='', title=REPORT_TITLE, progress=None,
+                         metrics=None, writer='openpyxl', tariff=DEFAULT_TARIFF):
+    """Save one workbook per Branch of df_filtered to output_dir, rendered by up to workers processes.
+
+    Every workbook is named after its branch, after prefix, with a suffix where two branch names
+    would give the same file name (see branch_file_names), and holds the same Summary and
+    'Updated Data' sheets as a report on that branch's rows alone. progress is called as
+    progress('write detail', fraction) as workbooks are finished. Returns a list of (branch,
+    excel_path, rows), in Branch order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='secu_branches_') as tmp_dir:
+        ipc_path = os.path.join(tmp_dir, PARTITION_FILE)
+        with stage_span(metrics, 'partition') as span:
+            partitions = write_partition_file(df_filtered, ipc_path)
+            span.rows = len(df_filtered)
+
+        file_names = branch_file_names([branch for branch, _, _ in partitions], prefix)
+        paths = [os.path.join(output_dir, file_name) for file_name in file_names]
+        with stage_span(metrics, 'write branches') as span:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(write_branch_workbook, ipc_path, offset, rows, path, title, writer,
+                                           tariff)
+                           for (_, offset, rows), path in zip(partitions, paths)]
+                try:
+                    for done, future in enumerate(as_completed(futures)):
+                        if progress is not None:
+                            progress('write detail', done / len(futures))
+                        future.result()
+                except BaseException:
+                    # Stop the workbooks that have not started yet, e.g. when the report is cancelled
+                    for future in futures:
+                        future.cancel()
+                    raise
+            span.rows = len(df_filtered)
+    return [(branch, path, rows) for (branch, _, rows), path in zip(partitions, paths)]
@@ -0,0 +1,347 @@
+"""Columnar store of classified device rows for follow-up questions after a report run.
+
+Every column is a flat numpy array in extract row order: the signal dates as int32 day numbers,
+ItemCode, SabreCode, Branch and the passthrough columns as category codes of the smallest integer
+type that fits, and the amounts, flags and fees as numbers. The sorted category values of each
+coded column are kept as a table of two arrays, their UTF-8 bytes end to end and the offset where
+each value starts. SabreCode and Branch each have an offset index (the rows sorted by code plus
+the offset where each code starts), so a lookup touches only the matching rows.
+
+The store is saved as one binary file: a small JSON header followed by the raw arrays, 64-byte
+aligned. DeviceStore.load memory-maps the file, so the arrays, category tables included, are paged
+in only as they are used.
+"""
+import json
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+from billing_engine import BILLABLE_ITEM_CODES, code_order
+from extract_reader import BILLING_COLUMNS, DATE_COLUMNS
+
+# Extension of the store saved next to a report
+STORE_EXTENSION = '.store'
+
+# Magic bytes of a store file; the digit is the format version
+STORE_PREFIX = b'SECUSTORE'
+STORE_MAGIC = STORE_PREFIX + b'2\n'
+STORE_ALIGNMENT = 64
+
+# Day number of a missing signal date
+MISSING_DAY = np.iinfo(np.int32).min
+
+# Code looked up for a value no row has; it matches no row, as missing values are coded -1
+ABSENT_CODE = -2
+
+# Columns added by classify_devices
+CLASSIFIED_COLUMNS = ['DeviceActive', 'DaysActive', 'MonthsActive', 'Fee ex VAT']
+
+# Billing columns kept as category codes, and the store arrays that hold their codes
+KEY_COLUMNS = {'ItemCode': 'item_code', 'SabreCode': 'sabre_code', 'Branch': 'branch'}
+
+# Columns with an offset index, and the store arrays that hold their codes
+INDEXED_COLUMNS = {'SabreCode': 'sabre_code', 'Branch': 'branch'}
+
+# Group keys accepted by DeviceStore.totals
+TOTALS_KEYS = ['SabreCode', 'Branch', 'ItemCode']
+
+EPOCH_DAY = np.datetime64(0, 'D')
+
+
+def _code_dtype(n_values):
+    """Return the smallest signed integer dtype that holds -1 and every position below n_values."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_values <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _encode(values):
+    """Return the category codes of values, -1 where missing, and the sorted categories as strings."""
+    codes, categories = pd.factorize(pd.Series(values).astype('string'), sort=True)
+    return codes.astype(_code_dtype(len(categories))), [str(category) for category in categories]
+
+
+def _category_table(categories):
+    """Return categories as a uint8 array of their UTF-8 bytes end to end and the offsets where each starts.
+
+    The offsets have one more entry than categories, the end of the last value.
+    """
+    encoded = [category.encode('utf-8') for category in categories]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets.astype(_code_dtype(offsets[-1]))
+
+
+def _category_values(data, offsets, codes=None):
+    """Return the category values of a table built by _category_table, or only those at codes."""
+    data = data.tobytes()
+    starts = offsets[:-1] if codes is None else offsets[codes]
+    ends = offsets[1:] if codes is None else offsets[codes + 1]
+    return [data[start:end].decode('utf-8') for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def _offset_index(codes, n_categories):
+    """Return the (order, offsets) index of category codes; missing codes are grouped last.
+
+    order lists the rows sorted by code, in row order within a code, and the rows of code c are
+    order[offsets[c]:offsets[c + 1]].
+    """
+    keys = np.where(codes < 0, n_categories, codes)
+    order = np.argsort(keys, kind='stable').astype(_code_dtype(len(codes)))
+    offsets = np.zeros(n_categories + 2, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_categories + 1), out=offsets[1:])
+    return order, offsets
+
+
+def _day_numbers(dates):
+    """Return datetimes as int32 days since 1970-01-01, with MISSING_DAY for NaT."""
+    days = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    return np.where(np.isnat(days), MISSING_DAY, (days - EPOCH_DAY).astype(np.int32))
+
+
+def _aligned(n_bytes):
+    """Return n_bytes rounded up to a multiple of STORE_ALIGNMENT."""
+    return -(-n_bytes // STORE_ALIGNMENT) * STORE_ALIGNMENT
+
+
+def _ordered_sum(values):
+    """Return the sum of values added one at a time in row order, as the Summary totals are."""
+    if not len(values):
+        return 0.0
+    return float(np.bincount(np.zeros(len(values), dtype=np.intp), weights=values)[0])
+
+
+class DeviceStore:
+    """Classified device rows held as columnar arrays, with SabreCode and Branch offset indexes.
+
+    Build one from a classified extract with from_frame, or load a saved one with load. rows
+    returns the positions of the rows matching a lookup; devices, fees and totals decode or
+    aggregate just those rows.
+    """
+
+    def __init__(self, arrays, columns, metadata=None, buffer=None):
+        self.arrays = arrays
+        self.columns = columns
+        self.metadata = metadata or {}
+        self.n_rows = len(arrays['item_code'])
+        self.detail_columns = [name for name in columns if name not in KEY_COLUMNS]
+        # Category values read from their tables on first use, as lists and as object arrays
+        self._categories = {}
+        self._values = {}
+        self._lookup = {name: {value: code for code, value in enumerate(self.categories(name))}
+                        for name in KEY_COLUMNS}
+        # The memory map backing a loaded store
+        self._buffer = buffer
+
+    @classmethod
+    def from_frame(cls, df, detail_columns=None, metadata=None):
+        """Build a store from an extract classified by billing_engine.classify_devices.
+
+        detail_columns lists the passthrough columns to keep (default: all of them). metadata is
+        a JSON-serialisable dict saved with the store, such as the billing window.
+        """
+        if detail_columns is None:
+            detail_columns = [col for col in df.columns if col not in BILLING_COLUMNS + CLASSIFIED_COLUMNS]
+        arrays = {
+            'first_day': _day_numbers(df[DATE_COLUMNS[0]]),
+            'last_day': _day_numbers(df[DATE_COLUMNS[1]]),
+            'amount': df['Amount'].to_numpy(dtype=np.float64),
+            'active': (df['DeviceActive'].to_numpy(dtype=object) == 'Active'),
+            'days_active': df['DaysActive'].to_numpy(dtype=np.int32),
+            # A tariff rule with rounding 'none' bills fractional months
+            'months_active': df['MonthsActive'].to_numpy(dtype=np.float64),
+            'fee': df['Fee ex VAT'].to_numpy(dtype=np.float64)
+        }
+        columns = {**KEY_COLUMNS, **{name: f'detail_{number}' for number, name in enumerate(detail_columns)}}
+        n_categories = {}
+        for name, key in columns.items():
+            arrays[key], categories = _encode(df[name])
+            arrays[f'{key}_categories'], arrays[f'{key}_category_offsets'] = _category_table(categories)
+            n_categories[name] = len(categories)
+        for name, key in INDEXED_COLUMNS.items():
+            arrays[f'{key}_order'], arrays[f'{key}_offsets'] = _offset_index(arrays[key], n_categories[name])
+        return cls(arrays, columns, metadata)
+
+    def save(self, path):
+        """Write the store to path: the magic bytes, the header length and JSON header, then the arrays."""
+        header = {'rows': self.n_rows, 'columns': self.columns, 'metadata': self.metadata, 'arrays': {}}
+        offset = 0
+        for name, array in self.arrays.items():
+            header['arrays'][name] = {'dtype': array.dtype.str, 'offset': offset, 'length': len(array)}
+            offset += _aligned(array.nbytes)
+        header_bytes = json.dumps(header).encode('utf-8')
+        data_start = _aligned(len(STORE_MAGIC) + 8 + len(header_bytes))
+
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(STORE_MAGIC)
+            f.write(len(header_bytes).to_bytes(8, 'little'))
+            f.write(header_bytes)
+            for name, array in self.arrays.items():
+                f.seek(data_start + header['arrays'][name]['offset'])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a store saved by save; the arrays are read-only views of the file."""
+        with open(path, 'rb') as f:
+            magic = f.read(len(STORE_MAGIC))
+            if magic != STORE_MAGIC and magic.startswith(STORE_PREFIX):
+                raise ValueError(f"{path} was saved in an older device store format; save it again")
+            if magic != STORE_MAGIC:
+                raise ValueError(f"{path} is not a device store file")
+            header_length = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_length).decode('utf-8'))
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data_start = _aligned(len(STORE_MAGIC) + 8 + header_length)
+        arrays = {
+            name: np.frombuffer(buffer, dtype=np.dtype(spec['dtype']), count=spec['length'],
+                                offset=data_start + spec['offset'])
+            for name, spec in header['arrays'].items()
+        }
+        return cls(arrays, header['columns'], header['metadata'], buffer)
+
+    def categories(self, column):
+        """Return the sorted category values of a coded column, as strings."""
+        if column not in self._categories:
+            key = self.columns[column]
+            self._categories[column] = _category_values(self.arrays[f'{key}_categories'],
+                                                        self.arrays[f'{key}_category_offsets'])
+        return self._categories[column]
+
+    def _code(self, column, value):
+        """Return the category code of value in column, or ABSENT_CODE if no row has it."""
+        return self._lookup[column].get(str(value), ABSENT_CODE)
+
+    def _indexed_rows(self, column, value):
+        """Return the rows holding value in an indexed column, from its offset index."""
+        code = self._code(column, value)
+        key = INDEXED_COLUMNS[column]
+        if code == ABSENT_CODE:
+            return np.empty(0, dtype=np.int64)
+        offsets = self.arrays[f'{key}_offsets']
+        return self.arrays[f'{key}_order'][offsets[code]:offsets[code + 1]]
+
+    def rows(self, sabre_code=None, branch=None, item_code=None, active=None):
+        """Return the positions, in extract row order, of the rows matching every given filter.
+
+        With sabre_code or branch the matching rows come straight from the offset index and only
+        those rows are checked against the other filters; without either every row is checked.
+        active is True for the 'Active' rows and False for the 'Inactive' ones.
+        """
+        candidates = None
+        for column, value in (('SabreCode', sabre_code), ('Branch', branch)):
+            if value is not None:
+                rows = self._indexed_rows(column, value)
+                if candidates is None or len(rows) < len(candidates):
+                    candidates = rows
+        if candidates is None:
+            candidates = np.arange(self.n_rows, dtype=np.int64)
+
+        keep = np.ones(len(candidates), dtype=bool)
+        for column, key, value in (('SabreCode', 'sabre_code', sabre_code), ('Branch', 'branch', branch),
+                                   ('ItemCode', 'item_code', item_code)):
+            if value is not None:
+                keep &= self.arrays[key][candidates] == self._code(column, value)
+        if active is not None:
+            keep &= self.arrays['active'][candidates] == bool(active)
+        return candidates[keep]
+
+    def _decode(self, column, codes):
+        """Return the values of category codes, with None where a code is missing.
+
+        A column's whole category table is read, and kept, once a lookup has at least half as many
+        rows as the table has values; smaller lookups read only the values at the codes present.
+        """
+        key = self.columns[column]
+        offsets = self.arrays[f'{key}_category_offsets']
+        if column not in self._values and 2 * len(codes) >= len(offsets) - 1:
+            self._values[column] = np.array(self.categories(column) + [None], dtype=object)
+        if column in self._values:
+            values = self._values[column]
+            return values[np.where(codes < 0, len(values) - 1, codes)]
+        present, inverse = np.unique(codes, return_inverse=True)
+        found = present[present >= 0]
+        values = _category_values(self.arrays[f'{key}_categories'], offsets, found)
+        return np.array([None] * (len(present) - len(found)) + values, dtype=object)[inverse]
+
+    def devices(self, sabre_code=None, branch=None, item_code=None, active=None):
+        """Return the matching rows as a DataFrame indexed by their row position in the extract.
+
+        The columns are those of the 'Updated Data' sheet, with the signal dates kept to the day.
+        """
+        rows = self.rows(sabre_code, branch, item_code, active)
+        arrays = self.arrays
+        df = pd.DataFrame(index=pd.Index(rows, name='Row'))
+        for column, key in zip(DATE_COLUMNS, ['first_day', 'last_day']):
+            days = arrays[key][rows]
+            dates = (EPOCH_DAY + np.where(days == MISSING_DAY, 0, days)).astype('datetime64[ns]')
+            dates[days == MISSING_DAY] = np.datetime64('NaT')
+            df[column] = dates
+        df['ItemCode'] = self._decode('ItemCode', arrays['item_code'][rows])
+        df['Amount'] = arrays['amount'][rows]
+        df['SabreCode'] = self._decode('SabreCode', arrays['sabre_code'][rows])
+        df['Branch'] = self._decode('Branch', arrays['branch'][rows])
+        for number, column in enumerate(self.detail_columns):
+            df[column] = self._decode(column, arrays[f'detail_{number}'][rows])
+        df['DeviceActive'] = np.where(arrays['active'][rows], 'Active', 'Inactive')
+        df['DaysActive'] = arrays['days_active'][rows].astype(np.int64)
+        df['MonthsActive'] = arrays['months_active'][rows]
+        df['Fee ex VAT'] = arrays['fee'][rows]
+        return df
+
+    def fees(self, sabre_code=None, branch=None, item_code=None, active=None):
+        """Return the total Fee ex VAT of the matching rows, adding them in row order as the Summary does."""
+        fees = self.arrays['fee'][self.rows(sabre_code, branch, item_code, active)]
+        return _ordered_sum(np.where(np.isnan(fees), 0.0, fees))
+
+    def totals(self, by='SabreCode', sabre_code=None, branch=None, item_code=None, active=None,
+               item_codes=None):
+        """Return the matching rows re-aggregated by one of the TOTALS_KEYS.
+
+        There is one row per group with matching rows, sorted by group as billing_engine.code_order
+        sorts them, with the fees of each of item_codes (by default the item codes the store was
+        billed with), the active device count and the total Fee ex VAT. Grouped by SabreCode over
+        the billable rows, the rows and their fee and active columns equal the report's
+        per-SabreCode totals.
+        """
+        if item_codes is None:
+            item_codes = self.metadata.get('item_codes', BILLABLE_ITEM_CODES)
+        if by not in TOTALS_KEYS:
+            raise ValueError(f"Invalid totals key: {by}")
+        rows = self.rows(sabre_code, branch, item_code, active)
+        codes = self.arrays[KEY_COLUMNS[by]][rows]
+        rows, codes = rows[codes >= 0], codes[codes >= 0]
+        groups, bins = np.unique(codes, return_inverse=True)
+        fees = self.arrays['fee'][rows]
+        fees = np.where(np.isnan(fees), 0.0, fees)
+        item_code_array = self.arrays['item_code'][rows]
+
+        totals = pd.DataFrame({by: self._decode(by, groups)})
+        totals['Rows'] = np.bincount(bins, minlength=len(groups))
+        for code in item_codes:
+            item = item_code_array == self._code('ItemCode', code)
+            totals[f'ItemCode_{code}'] = np.bincount(bins[item], weights=fees[item], minlength=len(groups))
+        totals['TotalActive'] = np.bincount(bins[self.arrays['active'][rows]], minlength=len(groups))
+        totals['Total_ex_VAT'] = np.bincount(bins, weights=fees, minlength=len(groups))
+        return totals.sort_values(by, ignore_index=True, key=code_order)
+
+    def close(self):
+        """Close the memory map of a loaded store; its arrays must not be used afterwards.
+
+        The store's arrays are dropped first, as the map cannot be closed while views of it remain.
+        If the caller still holds one, the map is released with the last view instead.
+        """
+        if self._buffer is not None:
+            self.arrays = {}
+            try:
+                self._buffer.close()
+            except BufferError:
+                pass
+            self._buffer = None
@@ -0,0 +1,218 @@
+"""Typed, column-pruned reading of the SECU device extract from CSV, Parquet or Feather files."""
+import os
+
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# Signal dates, parsed while the file is read
+DATE_COLUMNS = ['FirstSignalDate', 'LastSignalDate']
+
+# Low-cardinality code columns stored as categoricals. Reading them as strings also keeps
+# codes such as '17300' from being parsed as numbers.
+CATEGORY_COLUMNS = ['ItemCode', 'SabreCode', 'Branch']
+
+# Columns the billing calculation needs from every extract
+BILLING_COLUMNS = DATE_COLUMNS + ['ItemCode', 'Amount', 'SabreCode', 'Branch']
+
+EXTRACT_DTYPES = {
+    'ItemCode': 'category',
+    'SabreCode': 'category',
+    'Branch': 'category',
+    'Amount': 'float64'
+}
+
+# Parsers accepted by read_extract; 'pyarrow' needs the optional pyarrow package
+CSV_ENGINES = ['c', 'pyarrow']
+
+# Extract file formats by file extension. Parquet and Feather files are read through pyarrow with
+# memory mapping, and only the needed columns are loaded; any other extension is read as CSV.
+EXTRACT_FORMATS = {
+    '.csv': 'CSV',
+    '.parquet': 'Parquet',
+    '.pq': 'Parquet',
+    '.feather': 'Feather',
+    '.arrow': 'Feather'
+}
+EXTRACT_EXTENSIONS = list(EXTRACT_FORMATS)
+
+
+def extract_format(file_path):
+    """Return 'CSV', 'Parquet' or 'Feather' for an extract file, from its extension."""
+    return EXTRACT_FORMATS.get(os.path.splitext(file_path)[1].lower(), 'CSV')
+
+
+def extract_columns(csv_file_path, detail_columns=None):
+    """Return the columns to read from the extract, in file order.
+
+    The billing columns are always read. detail_columns names the passthrough columns for the
+    'Updated Data' sheet; by default every column in the file is kept.
+    """
+    file_format = extract_format(csv_file_path)
+    if file_format == 'CSV':
+        header = pd.read_csv(csv_file_path, nrows=0).columns.tolist()
+    else:
+        header = _arrow_schema(csv_file_path, file_format).names
+    missing = [col for col in BILLING_COLUMNS if col not in header]
+    if missing:
+        raise ValueError(f"{file_format} file is missing required columns: {', '.join(missing)}")
+    if detail_columns is None:
+        return header
+    wanted = set(BILLING_COLUMNS) | set(detail_columns)
+    return [col for col in header if col in wanted]
+
+
+def read_extract(csv_file_path, engine='c', detail_columns=None):
+    """Read the device extract with a declared schema.
+
+    Only the billing columns and the requested passthrough columns are read, the code columns
+    are read as categoricals and the signal dates are parsed during the read. With
+    engine='pyarrow' the passthrough columns are typed by Arrow's own inference. Parquet and
+    Feather files keep the types they were written with, and engine does not apply to them.
+    """
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Invalid CSV engine: {engine}")
+    usecols = extract_columns(csv_file_path, detail_columns)
+
+    file_format = extract_format(csv_file_path)
+    if file_format != 'CSV':
+        df = _arrow_to_extract(_read_arrow_table(csv_file_path, file_format, usecols))
+    elif engine == 'pyarrow':
+        df = _read_csv_pyarrow(csv_file_path, usecols)
+    else:
+        df = pd.read_csv(
+            csv_file_path,
+            usecols=usecols,
+            dtype=EXTRACT_DTYPES,
+            parse_dates=DATE_COLUMNS,
+            low_memory=False
+        )
+
+    return _coerce_dates(df)
+
+
+def iter_extract_chunks(csv_file_path, chunksize, detail_columns=None):
+    """Yield the device extract in DataFrames of at most chunksize rows, typed as read_extract does.
+
+    The date format of each signal date column is guessed once, from its first value, and used
+    for every chunk, so rows parse the same way as when the whole file is read at once.
+    Parquet and Feather files are read one record batch at a time.
+    """
+    usecols = extract_columns(csv_file_path, detail_columns)
+    file_format = extract_format(csv_file_path)
+    if file_format != 'CSV':
+        for batch in _iter_arrow_batches(csv_file_path, file_format, usecols, chunksize):
+            yield _coerce_dates(_arrow_to_extract(batch))
+        return
+
+    reader = pd.read_csv(csv_file_path, usecols=usecols, dtype=EXTRACT_DTYPES, chunksize=chunksize)
+    date_formats = {}
+    with reader:
+        for chunk in reader:
+            for col in DATE_COLUMNS:
+                if col not in date_formats:
+                    first_dates = chunk[col].dropna()
+                    if first_dates.empty:
+                        chunk[col] = pd.to_datetime(chunk[col], errors='coerce')
+                        continue
+                    date_formats[col] = guess_datetime_format(str(first_dates.iloc[0]))
+                chunk[col] = pd.to_datetime(chunk[col], format=date_formats[col], errors='coerce')
+            yield chunk
+
+
+def _coerce_dates(df):
+    """Coerce any signal date column that could not be parsed during the read, as before."""
+    for col in DATE_COLUMNS:
+        if not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+
+def _read_csv_pyarrow(csv_file_path, usecols):
+    """Read the extract with pyarrow.csv into the same dtypes as the C engine."""
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        raise ImportError("The pyarrow engine requires the pyarrow package (pip install pyarrow)")
+
+    # Dates are read as text and parsed by pandas below, so both engines parse them the same way
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    column_types = {col: pa.string() for col in DATE_COLUMNS}
+    column_types.update({col: dictionary for col in CATEGORY_COLUMNS})
+    column_types['Amount'] = pa.float64()
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=usecols,
+        column_types=column_types,
+        strings_can_be_null=True
+    )
+    return _arrow_to_extract(pa_csv.read_csv(csv_file_path, convert_options=convert_options))
+
+
+def _import_pyarrow():
+    """Return the pyarrow module, which Parquet and Feather extracts need."""
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Feather extracts require the pyarrow package (pip install pyarrow)")
+    return pyarrow
+
+
+def _arrow_schema(file_path, file_format):
+    """Return the Arrow schema of a Parquet or Feather file without reading its data."""
+    pa = _import_pyarrow()
+    if file_format == 'Parquet':
+        from pyarrow import parquet as pq
+        return pq.read_schema(file_path, memory_map=True)
+    with pa.memory_map(file_path) as source:
+        return pa.ipc.open_file(source).schema
+
+
+def _read_arrow_table(file_path, file_format, usecols):
+    """Read the usecols columns of a Parquet or Feather file as a memory-mapped Arrow table."""
+    _import_pyarrow()
+    if file_format == 'Parquet':
+        from pyarrow import parquet as pq
+        return pq.read_table(file_path, columns=usecols, memory_map=True)
+    from pyarrow import feather
+    return feather.read_table(file_path, columns=usecols, memory_map=True)
+
+
+def _iter_arrow_batches(file_path, file_format, usecols, chunksize):
+    """Yield the usecols columns of a Parquet or Feather file in record batches of at most chunksize rows."""
+    _import_pyarrow()
+    if file_format == 'Parquet':
+        from pyarrow import parquet as pq
+        yield from pq.ParquetFile(file_path, memory_map=True).iter_batches(batch_size=chunksize, columns=usecols)
+    else:
+        yield from _read_arrow_table(file_path, file_format, usecols).to_batches(max_chunksize=chunksize)
+
+
+def _arrow_to_extract(table):
+    """Convert an Arrow table or record batch to a DataFrame with the dtypes read_csv gives."""
+    df = table.to_pandas()
+    # Arrow keeps categories in order of appearance; sort them as read_csv does so groupby order matches
+    for col in CATEGORY_COLUMNS:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+        else:
+            df[col] = df[col].astype('category')
+    df['Amount'] = df['Amount'].astype('float64')
+    return df
+
+
+def convert_extract(csv_file_path, output_path, engine='c', detail_columns=None):
+    """Write a typed Parquet or Feather copy of a CSV extract, chosen by output_path's extension.
+
+    The signal dates are stored as timestamps and the code columns as dictionaries, so later runs
+    read the copy without parsing any text.
+    """
+    output_format = extract_format(output_path)
+    if output_format == 'CSV':
+        raise ValueError(f"Cannot convert to {output_path}: use a .parquet or .feather file name")
+    _import_pyarrow()
+    df = read_extract(csv_file_path, engine=engine, detail_columns=detail_columns)
+    if output_format == 'Parquet':
+        df.to_parquet(output_path, index=False)
+    else:
+        df.to_feather(output_path)
+    return output_path
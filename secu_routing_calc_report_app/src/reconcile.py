@@ -0,0 +1,335 @@
+"""Reconciliation of two billing runs: what changed between last period's run and this one.
+
+A run is an extract billed for a date range option, as a report would bill it, or a device store
+saved with --save-store. Both runs are reduced to their classified, billable rows and joined on
+the device key (DeviceId by default) plus SabreCode without a row loop: the key columns of both
+runs are factorized together into one integer code per row, a device listed more than once under
+the same SabreCode is told apart by its occurrence number, and every key's row in each run is
+found by scattering row positions into an array indexed by that code.
+
+The result lists the devices that were added, removed, changed DeviceActive status or changed
+DaysActive or Fee ex VAT, and the per-SabreCode changes of TotalActive and Total_ex_VAT. The fee
+change of a device missing from one run counts that run's fee as 0, so the device changes of a
+SabreCode add up to its Total_ex_VAT change.
+"""
+import os
+from collections import namedtuple
+from copy import copy
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from pandas.api.types import union_categoricals
+
+from arrears_report import build_report
+from billing_engine import DATE_OPTIONS, code_order
+from detail_export import resolve_detail_format, write_detail_file
+from device_store import STORE_EXTENSION, DeviceStore
+from report_writer import (BOLD_FONT, BORDER_STYLE, HEADER_ALIGNMENT, HEADER_FILL, HEADER_FONT, TITLE_FONT,
+                           create_named_styles)
+from tariff import DEFAULT_TARIFF
+
+DEVICE_KEY = 'DeviceId'
+RECONCILE_SHEET = 'Reconciliation'
+RECONCILE_TITLE = "SECU billing reconciliation"
+
+# Device changes listed on the sheet; the rest are only counted there
+DEFAULT_SHEET_DEVICES = 5000
+
+# Suffix added to the reconciliation's file name stem for the file holding every device change
+CHANGES_FILE_SUFFIX = '_changes'
+
+CHANGE_ADDED = 'Added'
+CHANGE_REMOVED = 'Removed'
+CHANGE_NOW_ACTIVE = 'Now Active'
+CHANGE_NOW_INACTIVE = 'Now Inactive'
+CHANGE_CHANGED = 'Changed'
+
+SABRE_DELTA_COLUMNS = ['SabreCode', 'Branch', 'Previous TotalActive', 'Current TotalActive', 'TotalActive Change',
+                       'Previous Total_ex_VAT', 'Current Total_ex_VAT', 'Total_ex_VAT Change', 'Devices Changed']
+RECONCILE_CURRENCY_COLS = ('Previous Total_ex_VAT', 'Current Total_ex_VAT', 'Total_ex_VAT Change',
+                           'Previous Fee ex VAT', 'Current Fee ex VAT', 'Fee ex VAT Change')
+
+Reconciliation = namedtuple('Reconciliation', ['sabre_deltas', 'device_changes'])
+
+
+def load_run(path, date_option=DATE_OPTIONS[0], engine='c', device_key=DEVICE_KEY, cache=None,
+             tariff=DEFAULT_TARIFF):
+    """Return the classified, billable rows of one run.
+
+    A path ending in device_store.STORE_EXTENSION is a saved device store, billed with the window
+    and item codes it was saved with. Any other path is an extract billed for date_option with
+    engine, cache and tariff, as described in arrears_report.build_report.
+    """
+    if path.lower().endswith(STORE_EXTENSION):
+        store = DeviceStore.load(path)
+        try:
+            item_codes = store.metadata.get('item_codes', tariff.item_codes)
+            df = pd.concat([store.devices(item_code=code) for code in item_codes]).sort_index()
+        finally:
+            store.close()
+    else:
+        _, df = build_report(path, date_option, engine, cache=cache, tariff=tariff)
+    if device_key not in df.columns:
+        raise ValueError(f"{path} has no '{device_key}' column")
+    return df
+
+
+def _joint_codes(previous, current):
+    """Factorize a column of both runs together; return each run's codes and the value of every code.
+
+    Equal values share a code whichever run they come from, and missing values are coded -1.
+    """
+    if isinstance(previous.dtype, pd.CategoricalDtype) and isinstance(current.dtype, pd.CategoricalDtype):
+        joined = union_categoricals([previous, current])
+        codes, uniques = joined.codes.astype(np.int64), joined.categories
+    else:
+        if pd.api.types.is_numeric_dtype(previous) != pd.api.types.is_numeric_dtype(current):
+            previous, current = previous.astype('string'), current.astype('string')
+        codes, uniques = pd.factorize(pd.concat([previous, current], ignore_index=True))
+    return codes[:len(previous)], codes[len(previous):], uniques
+
+
+def _occurrences(codes):
+    """Return, for every position, how many earlier positions hold the same code."""
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    run_starts = np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+    occurrences = np.empty(len(codes), dtype=np.int64)
+    occurrences[order] = np.arange(len(codes)) - run_starts
+    return occurrences
+
+
+def join_rows(previous_devices, current_devices, previous_sabre, current_sabre):
+    """Pair the rows of two runs on their joint device and SabreCode codes from _joint_codes.
+
+    Returns (previous_rows, current_rows): for every distinct key, its row position in each run
+    or -1 where the run lacks it, keys ordered by their first row in previous and then in current.
+    """
+    # One code per (device, SabreCode) pair, then per occurrence of the pair within its own run
+    n_sabre = max(previous_sabre.max(initial=-1), current_sabre.max(initial=-1)) + 2
+    pairs, _ = pd.factorize(np.concatenate([(previous_devices + 1) * n_sabre + previous_sabre + 1,
+                                            (current_devices + 1) * n_sabre + current_sabre + 1]))
+    n_previous = len(previous_devices)
+    occurrences = np.concatenate([_occurrences(pairs[:n_previous]), _occurrences(pairs[n_previous:])])
+    keys, key_uniques = pd.factorize(pairs * (occurrences.max(initial=0) + 1) + occurrences)
+
+    previous_rows = np.full(len(key_uniques), -1, dtype=np.int64)
+    current_rows = np.full(len(key_uniques), -1, dtype=np.int64)
+    previous_rows[keys[:n_previous]] = np.arange(n_previous)
+    current_rows[keys[n_previous:]] = np.arange(len(current_devices))
+    return previous_rows, current_rows
+
+
+def _take(values, rows, fill):
+    """Return values[rows], with fill where a row is -1."""
+    taken = values[np.maximum(rows, 0)]
+    return np.where(rows >= 0, taken, fill)
+
+
+def _run_arrays(df):
+    """Return the DeviceActive flags, DaysActive and Fee ex VAT (missing fees as 0) of a run's rows."""
+    active = (df['DeviceActive'] == 'Active').to_numpy(dtype=bool)
+    days = df['DaysActive'].to_numpy(dtype=np.int64)
+    fees = df['Fee ex VAT'].to_numpy(dtype=float)
+    return active, days, np.where(np.isnan(fees), 0.0, fees)
+
+
+def _categorical(codes, uniques):
+    """Return the values of joint codes as a Categorical, missing where a code is -1."""
+    return pd.Categorical.from_codes(codes, categories=pd.Index(uniques).astype('string'))
+
+
+def _first_codes(values, groups, n_groups):
+    """Return the first value of every group that is not -1, or -1 where a group has none."""
+    first = np.full(n_groups, -1, dtype=np.int64)
+    present = (values >= 0) & (groups >= 0)
+    # With repeated indices the last assignment wins, so assigning in reverse keeps the first value
+    first[groups[present][::-1]] = values[present][::-1]
+    return first
+
+
+def reconcile(previous, current, device_key=DEVICE_KEY):
+    """Return the Reconciliation of two runs' classified, billable rows.
+
+    device_changes has one row per device that was added, removed, changed DeviceActive status
+    or changed DaysActive or Fee ex VAT, keys ordered as in join_rows. sabre_deltas has one row
+    per SabreCode whose totals or devices changed, sorted by SabreCode and ending with a 'Total'
+    row over every SabreCode; rows without a SabreCode are left out of it, as they are of the
+    Summary.
+    """
+    previous_devices, current_devices, device_uniques = _joint_codes(previous[device_key], current[device_key])
+    previous_sabre, current_sabre, sabre_uniques = _joint_codes(previous['SabreCode'], current['SabreCode'])
+    previous_branch, current_branch, branch_uniques = _joint_codes(previous['Branch'], current['Branch'])
+    previous_rows, current_rows = join_rows(previous_devices, current_devices, previous_sabre, current_sabre)
+    previous_active, previous_days, previous_fees = _run_arrays(previous)
+    current_active, current_days, current_fees = _run_arrays(current)
+
+    # Compare every key's rows in the two runs
+    added = previous_rows < 0
+    removed = current_rows < 0
+    both = ~added & ~removed
+    was_active = _take(previous_active, previous_rows, False)
+    is_active = _take(current_active, current_rows, False)
+    days_before = _take(previous_days, previous_rows, 0)
+    days_after = _take(current_days, current_rows, 0)
+    fees_before = _take(previous_fees, previous_rows, 0.0)
+    fees_after = _take(current_fees, current_rows, 0.0)
+    status_changed = both & (was_active != is_active)
+    changed = added | removed | status_changed | (both & ((days_before != days_after) | (fees_before != fees_after)))
+
+    # Describe the changed keys from whichever run has them, preferring the current one
+    previous_rows, current_rows = previous_rows[changed], current_rows[changed]
+    in_current = current_rows >= 0
+    device_codes = np.where(in_current, _take(current_devices, current_rows, -1), previous_devices[previous_rows])
+    sabre_codes = np.where(in_current, _take(current_sabre, current_rows, -1), previous_sabre[previous_rows])
+    branch_codes = np.where(in_current, _take(current_branch, current_rows, -1), previous_branch[previous_rows])
+    was_active, is_active = was_active[changed], is_active[changed]
+    change_codes = np.select([added[changed], removed[changed], ~was_active & is_active, was_active & ~is_active],
+                             [0, 1, 2, 3], 4)
+    device_changes = pd.DataFrame({
+        device_key: pd.api.extensions.take(np.asarray(device_uniques), device_codes, allow_fill=True),
+        'SabreCode': _categorical(sabre_codes, sabre_uniques),
+        'Branch': _categorical(branch_codes, branch_uniques),
+        'Change': pd.Categorical.from_codes(change_codes, categories=[
+            CHANGE_ADDED, CHANGE_REMOVED, CHANGE_NOW_ACTIVE, CHANGE_NOW_INACTIVE, CHANGE_CHANGED]),
+        'Previous DeviceActive': pd.Categorical.from_codes(np.where(previous_rows >= 0, was_active, -1),
+                                                           categories=['Inactive', 'Active']),
+        'Current DeviceActive': pd.Categorical.from_codes(np.where(in_current, is_active, -1),
+                                                          categories=['Inactive', 'Active']),
+        'Previous DaysActive': pd.arrays.IntegerArray(days_before[changed], previous_rows < 0),
+        'Current DaysActive': pd.arrays.IntegerArray(days_after[changed], ~in_current),
+        'DaysActive Change': days_after[changed] - days_before[changed],
+        'Previous Fee ex VAT': fees_before[changed],
+        'Current Fee ex VAT': fees_after[changed],
+        'Fee ex VAT Change': fees_after[changed] - fees_before[changed]
+    })
+
+    # Total both runs per SabreCode, adding fees in row order as the Summary does; the Branch of a
+    # SabreCode is its first non-empty Branch in the current run, or else in the previous one
+    n_sabre = len(sabre_uniques)
+    previous_billed, current_billed = previous_sabre >= 0, current_sabre >= 0
+    branches = _first_codes(np.concatenate([current_branch, previous_branch]),
+                            np.concatenate([current_sabre, previous_sabre]), n_sabre)
+    sabre_deltas = pd.DataFrame({
+        'SabreCode': np.asarray(sabre_uniques, dtype=object),
+        'Branch': np.asarray(_categorical(branches, branch_uniques), dtype=object),
+        'Previous TotalActive': np.bincount(previous_sabre[previous_billed & previous_active], minlength=n_sabre),
+        'Current TotalActive': np.bincount(current_sabre[current_billed & current_active], minlength=n_sabre),
+        'Previous Total_ex_VAT': np.bincount(previous_sabre[previous_billed], weights=previous_fees[previous_billed],
+                                             minlength=n_sabre),
+        'Current Total_ex_VAT': np.bincount(current_sabre[current_billed], weights=current_fees[current_billed],
+                                            minlength=n_sabre),
+        'Devices Changed': np.bincount(sabre_codes[sabre_codes >= 0], minlength=n_sabre)
+    })
+    sabre_deltas['TotalActive Change'] = sabre_deltas['Current TotalActive'] - sabre_deltas['Previous TotalActive']
+    sabre_deltas['Total_ex_VAT Change'] = sabre_deltas['Current Total_ex_VAT'] - sabre_deltas['Previous Total_ex_VAT']
+    sabre_deltas = sabre_deltas[SABRE_DELTA_COLUMNS]
+
+    # The 'Total' row covers every SabreCode, so it matches the two reports' totals
+    total_row = {col: sabre_deltas[col].sum() for col in SABRE_DELTA_COLUMNS[2:]}
+    total_row.update({'SabreCode': 'Total', 'Branch': None})
+    keep = ((sabre_deltas['Devices Changed'] > 0) | (sabre_deltas['TotalActive Change'] != 0)
+            | (sabre_deltas['Total_ex_VAT Change'] != 0))
+    sabre_deltas = sabre_deltas[keep].sort_values('SabreCode', ignore_index=True, key=code_order)
+    sabre_deltas = pd.concat([sabre_deltas, pd.DataFrame([total_row])], ignore_index=True)
+    return Reconciliation(sabre_deltas, device_changes)
+
+
+def sheet_devices(device_changes, max_devices=DEFAULT_SHEET_DEVICES):
+    """Return the device changes listed on the sheet: status changes first, then the largest fee changes."""
+    status = device_changes['Change'].isin([CHANGE_NOW_ACTIVE, CHANGE_NOW_INACTIVE]).to_numpy()
+    order = np.lexsort((-device_changes['Fee ex VAT Change'].abs().to_numpy(), ~status))
+    return device_changes.iloc[order[:max_devices]]
+
+
+def _sheet_values(df):
+    """Return the rows of df as lists of plain Python values, with None for missing values."""
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+
+def _append_table(ws, df, currency_format, bold_last=False):
+    """Append a header row and the rows of df to a write-only worksheet."""
+    header = []
+    for col_name in df.columns.tolist():
+        cell = WriteOnlyCell(ws, value=col_name)
+        cell.fill = HEADER_FILL
+        cell.font = HEADER_FONT
+        cell.alignment = HEADER_ALIGNMENT
+        cell.border = BORDER_STYLE
+        header.append(cell)
+    ws.append(header)
+
+    # Only the currency cells need a cell object; the other values are appended as they are
+    template = WriteOnlyCell(ws)
+    template.style = currency_format
+    currency_style = template._style
+    currency = [col in RECONCILE_CURRENCY_COLS for col in df.columns]
+    values = _sheet_values(df)
+    for row_values in values[:-1] if bold_last else values:
+        row = []
+        for value, is_currency in zip(row_values, currency):
+            if is_currency:
+                value = WriteOnlyCell(ws, value=value)
+                value._style = copy(currency_style)
+            row.append(value)
+        ws.append(row)
+
+    if bold_last and values:
+        row = []
+        for value, is_currency in zip(values[-1], currency):
+            cell = WriteOnlyCell(ws, value=value)
+            if is_currency:
+                cell.style = currency_format
+            cell.font = BOLD_FONT
+            row.append(cell)
+        ws.append(row)
+
+
+def write_reconciliation(excel_path, result, title=RECONCILE_TITLE, max_devices=DEFAULT_SHEET_DEVICES):
+    """Save a Reconciliation to excel_path as one compact 'Reconciliation' sheet.
+
+    The sheet has the per-SabreCode changes with their 'Total' row, then up to max_devices device
+    changes, the DeviceActive status changes first and then the largest fee changes.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=RECONCILE_SHEET)
+    currency_format, _ = create_named_styles()
+
+    title_cell = WriteOnlyCell(ws, value=title)
+    title_cell.font = TITLE_FONT
+    ws.append([title_cell])
+    ws.append([])
+    _append_table(ws, result.sabre_deltas, currency_format, bold_last=True)
+    ws.append([])
+
+    listed = sheet_devices(result.device_changes, max_devices)
+    heading = WriteOnlyCell(ws, value=f'Device changes: {len(listed)} of {len(result.device_changes)}')
+    heading.font = BOLD_FONT
+    ws.append([heading])
+    _append_table(ws, listed, currency_format)
+    wb.save(excel_path)
+
+
+def process_reconciliation(previous_path, current_path, excel_path, previous_option=DATE_OPTIONS[0],
+                           current_option=None, engine='c', device_key=DEVICE_KEY, max_devices=DEFAULT_SHEET_DEVICES,
+                           changes_format=None, cache=None, tariff=DEFAULT_TARIFF):
+    """Reconcile two runs and save the 'Reconciliation' workbook to excel_path.
+
+    previous_path and current_path are extracts or device stores, as described in load_run; an
+    extract is billed for previous_option or current_option (by default the same option). With
+    changes_format, one of detail_export.DETAIL_FORMATS, every device change is also saved next
+    to the workbook as <excel stem>_changes.parquet or .csv.gz. Returns the Reconciliation.
+    """
+    previous = load_run(previous_path, previous_option, engine, device_key, cache, tariff)
+    current = load_run(current_path, current_option or previous_option, engine, device_key, cache, tariff)
+    result = reconcile(previous, current, device_key)
+    if changes_format:
+        stem = os.path.splitext(excel_path)[0]
+        changes_path = f'{stem}{CHANGES_FILE_SUFFIX}.{resolve_detail_format(changes_format)}'
+        write_detail_file(result.device_changes, changes_path, changes_format)
+    title = f'{RECONCILE_TITLE}: {os.path.basename(previous_path)} to {os.path.basename(current_path)}'
+    write_reconciliation(excel_path, result, title, max_devices)
+    return result
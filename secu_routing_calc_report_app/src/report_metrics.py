@@ -0,0 +1,171 @@
+"""Optional per-stage timing and memory measurements for report generation.
+
+process_data only measures anything when it is given a ReportMetrics; otherwise every stage span is
+a shared no-op context, so an unmeasured report pays for nothing but a few function calls.
+"""
+import cProfile
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+# Suffixes added to the report path for the JSON sidecar and the cProfile dump
+SIDECAR_SUFFIX = '.metrics.json'
+PROFILE_SUFFIX = '.prof'
+
+MB = 2 ** 20
+
+# Span handed out when measurements are disabled; values set on it are simply discarded
+_NULL_SPAN = SimpleNamespace(rows=None)
+
+
+def current_rss():
+    """Return the resident set size of this process in bytes, or None if it cannot be read."""
+    try:
+        import psutil
+    except ImportError:
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            return None
+    return psutil.Process().memory_info().rss
+
+
+def measure_report(metrics, excel_path):
+    """Return a context that measures a whole report run, or a no-op context when metrics is None."""
+    if metrics is None:
+        return nullcontext()
+    return metrics.run(excel_path)
+
+
+def stage_span(metrics, name):
+    """Return the span context for a stage, or a no-op context when metrics is None.
+
+    The span is available through 'as'; set its rows attribute to the number of rows the stage
+    handled.
+    """
+    if metrics is None:
+        return nullcontext(_NULL_SPAN)
+    return metrics.span(name)
+
+
+class ReportMetrics:
+    """Collect named stage spans for one report and emit them once the report is saved.
+
+    Each span records wall time, CPU time, the change in RSS and, with trace_memory, the change in
+    traced memory and its peak. A stage entered more than once (once per chunk when streaming) has
+    its measurements added up. Spans may nest, but a nested span restarts the traced memory peak, so
+    the outer span's peak only covers the time after its last nested span. With sidecar the
+    measurements are saved next to the report as <report>.metrics.json, and with profile a cProfile
+    dump of the whole run is saved as <report>.prof. The measurements are always logged as a record
+    on the 'report_metrics' logger.
+    """
+
+    def __init__(self, trace_memory=False, profile=False, sidecar=True):
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self.sidecar = sidecar
+        self.stages = {}
+        self.started_tracing = False
+        self.profiler = None
+        self.start_time = None
+        self.total_seconds = None
+
+    @contextmanager
+    def run(self, excel_path):
+        """Measure a report run, emitting the measurements if it completes."""
+        self.start()
+        try:
+            yield self
+        except BaseException:
+            self.stop()
+            raise
+        self.finish(excel_path)
+
+    def start(self):
+        """Start measuring the run as a whole."""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start_time = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        """Measure one stage; yields the span record so the stage can set its row count."""
+        record = SimpleNamespace(rows=None)
+        rss_before = current_rss()
+        if self.trace_memory:
+            traced_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            measured = {
+                'wall_seconds': time.perf_counter() - wall_start,
+                'cpu_seconds': time.process_time() - cpu_start
+            }
+            rss_after = current_rss()
+            if rss_before is not None and rss_after is not None:
+                measured['rss_delta_mb'] = (rss_after - rss_before) / MB
+            if self.trace_memory:
+                traced_after, traced_peak = tracemalloc.get_traced_memory()
+                measured['traced_delta_mb'] = (traced_after - traced_before) / MB
+                measured['traced_peak_mb'] = (traced_peak - traced_before) / MB
+            self._add(name, measured, record.rows)
+
+    def _add(self, name, measured, rows):
+        """Add one span's measurements to the totals of its stage."""
+        stage = self.stages.setdefault(name, {'calls': 0, 'rows': None})
+        stage['calls'] += 1
+        if rows is not None:
+            stage['rows'] = (stage['rows'] or 0) + rows
+        for key, value in measured.items():
+            if key == 'traced_peak_mb':
+                stage[key] = max(stage.get(key, value), value)
+            else:
+                stage[key] = stage.get(key, 0.0) + value
+
+    def to_dict(self, excel_path=None):
+        """Return the measurements as a JSON-serialisable dict."""
+        return {
+            'report': excel_path,
+            'total_wall_seconds': None if self.total_seconds is None else round(self.total_seconds, 4),
+            'stages': {
+                name: {key: round(value, 4) if isinstance(value, float) else value for key, value in stage.items()}
+                for name, stage in self.stages.items()
+            }
+        }
+
+    def stop(self, profile_path=None):
+        """Stop the profiler and memory tracing, saving the profile to profile_path if given."""
+        if self.start_time is not None:
+            self.total_seconds = time.perf_counter() - self.start_time
+        if self.profiler is not None:
+            self.profiler.disable()
+            if profile_path is not None:
+                self.profiler.dump_stats(profile_path)
+            self.profiler = None
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def finish(self, excel_path):
+        """Stop measuring and emit the measurements for the report saved at excel_path."""
+        self.stop(excel_path + PROFILE_SUFFIX)
+        results = self.to_dict(excel_path)
+        if self.sidecar:
+            with open(excel_path + SIDECAR_SUFFIX, 'w') as f:
+                json.dump(results, f, indent=2)
+        logger.info("report metrics %s", json.dumps(results), extra={'report_metrics': results})
+        return results
@@ -0,0 +1,14 @@
+"""Report options and stage names shared by the GUI and the report modules.
+
+This module imports nothing heavy, so the GUI can build its window before pandas, numpy and
+openpyxl are loaded.
+"""
+
+# Billing windows offered for the report
+DATE_OPTIONS = ['April - September', 'October - March']
+
+# Stages reported to the progress callback, in the order they run for an in-memory report
+REPORT_STAGES = ['load', 'compute', 'summary', 'write detail', 'save']
+
+# Stages reported to the progress callback by a multi-period report
+PERIOD_REPORT_STAGES = ['load', 'compute', 'summary', 'save']
@@ -0,0 +1,420 @@
+"""Local report service that keeps warm worker processes resident between reports.
+
+A cold report pays for a fresh interpreter and the pandas, numpy and openpyxl imports before any
+billing starts, which dominates the run time of a small branch extract. ReportService starts its
+worker processes once, imports the report modules in each of them, and then runs report jobs
+posted to a small JSON API on localhost:
+
+    POST   /jobs         submit {"input", "output", "period", "engine", "writer", "detail_columns",
+                         "chunksize", "tariff"}; only input and output are required
+    GET    /jobs         list the jobs
+    GET    /jobs/<id>    one job: its status, current stage and, once done, its stage timings
+    DELETE /jobs/<id>    cancel a job that is queued or running
+    GET    /health       service status
+
+ReportServiceClient submits jobs from the command line and the GUI. Only the standard library is
+imported here; the report modules are only imported in the worker processes. That is also why the
+secu-arrears-submit command lives here rather than in arrears_cli: a submission then starts in a few
+milliseconds instead of paying for the imports the service exists to avoid.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from report_options import DATE_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_SERVICE_URL = f'http://{DEFAULT_HOST}:{DEFAULT_PORT}'
+
+# Environment variable naming the service URL the GUI submits its reports to
+SERVICE_ENV = 'SECU_REPORT_SERVICE'
+
+# Modules every worker process imports when it starts
+WARM_MODULES = ['arrears_report', 'xlsxwriter_backend', 'tariff']
+
+# Optional job fields and their defaults
+JOB_OPTIONS = {'period': DATE_OPTIONS[0], 'engine': 'c', 'writer': 'openpyxl', 'detail_columns': None,
+               'chunksize': None, 'tariff': None}
+
+# Finished jobs kept for status queries; the oldest are dropped first
+MAX_FINISHED_JOBS = 1000
+
+JOB_STATES = ['queued', 'running', 'done', 'failed', 'cancelled']
+
+
+class ReportServiceError(Exception):
+    """Raised by ReportServiceClient when the service rejects a request."""
+
+
+def warm_worker():
+    """Worker process initializer: import the WARM_MODULES so the first report does not pay for them."""
+    import importlib
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+
+
+def run_service_job(job_id, job, progress, cancelled):
+    """Worker process body: generate one report and return its stage timings, or None if it was cancelled.
+
+    progress and cancelled are shared dicts of the service's manager: the current stage of the job
+    is posted to progress[job_id] and the report stops at its next stage once cancelled[job_id] is set.
+    """
+    from arrears_report import ReportCancelled, process_data
+    from report_metrics import ReportMetrics
+    from tariff import DEFAULT_TARIFF, load_tariff
+
+    started = time.time()
+    progress[job_id] = {'stage': None, 'fraction': None, 'started': started}
+
+    def report_progress(stage, fraction):
+        if cancelled.get(job_id):
+            raise ReportCancelled()
+        progress[job_id] = {'stage': stage, 'fraction': fraction, 'started': started}
+
+    tariff = load_tariff(job['tariff']) if job['tariff'] else DEFAULT_TARIFF
+    metrics = ReportMetrics(sidecar=False)
+    try:
+        summary_df, df_filtered = process_data(job['input'], job['output'], job['period'], job['engine'],
+                                               job['detail_columns'], job['chunksize'], progress=report_progress,
+                                               metrics=metrics, writer=job['writer'], tariff=tariff)
+    except ReportCancelled:
+        return None
+    timings = metrics.to_dict(job['output'])
+    return {
+        'started': started,
+        'total_wall_seconds': timings['total_wall_seconds'],
+        'stages': timings['stages'],
+        'rows': None if df_filtered is None else len(df_filtered),
+        'total_ex_vat': float(summary_df['Total_ex_VAT'].iloc[-1])
+    }
+
+
+def parse_job(body):
+    """Return the job described by a decoded POST /jobs body, with defaults filled in, or raise ValueError."""
+    if not isinstance(body, dict):
+        raise ValueError("The job must be a JSON object")
+    unknown = sorted(set(body) - set(JOB_OPTIONS) - {'input', 'output'})
+    if unknown:
+        raise ValueError(f"Unknown job fields: {', '.join(unknown)}")
+    job = dict(JOB_OPTIONS, **body)
+    for field in ('input', 'output'):
+        if not isinstance(job.get(field), str) or not os.path.isabs(job[field]):
+            raise ValueError(f"The job needs an absolute '{field}' path")
+    if job['tariff'] is not None and not (isinstance(job['tariff'], str) and os.path.isabs(job['tariff'])):
+        raise ValueError("The job 'tariff' must be an absolute path")
+    if job['period'] not in DATE_OPTIONS:
+        raise ValueError(f"Invalid period: {job['period']}")
+    if job['chunksize'] is not None and (not isinstance(job['chunksize'], int) or job['chunksize'] < 1):
+        raise ValueError("The job 'chunksize' must be a positive integer")
+    if job['detail_columns'] is not None and not isinstance(job['detail_columns'], list):
+        raise ValueError("The job 'detail_columns' must be a list of column names")
+    return job
+
+
+class ReportService:
+    """Run report jobs in a pool of warm worker processes and keep their status.
+
+    The workers are started, and the report modules imported in each of them, before the service
+    accepts its first job. Jobs run in the order they are submitted, up to workers at once.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.manager = multiprocessing.Manager()
+        self.progress = self.manager.dict()
+        self.cancelled = self.manager.dict()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+        self.started = time.time()
+
+    def warm_up(self):
+        """Start every worker process now, rather than on the first jobs, and wait until they are ready."""
+        futures = [self.pool.submit(time.sleep, 0.1) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def submit(self, job):
+        """Queue a job parsed by parse_job and return its status."""
+        job_id = uuid.uuid4().hex[:12]
+        record = {'id': job_id, 'job': job, 'submitted': time.time(), 'result': None, 'error': None}
+        record['future'] = self.pool.submit(run_service_job, job_id, job, self.progress, self.cancelled)
+        with self.lock:
+            self.jobs[job_id] = record
+        record['future'].add_done_callback(lambda future: self._finish(job_id, future))
+        logger.info("job %s queued: %s", job_id, job['input'])
+        return self.status(job_id)
+
+    def _finish(self, job_id, future):
+        """Record the outcome of a finished job and drop its shared progress entries."""
+        record = self.jobs[job_id]
+        if not future.cancelled():
+            error = future.exception()
+            if error is None:
+                record['result'] = future.result()
+            else:
+                record['error'] = f"{type(error).__name__}: {error}"
+        # Set last: status reads the outcome once the job is marked finished
+        record['finished'] = time.time()
+        self.progress.pop(job_id, None)
+        self.cancelled.pop(job_id, None)
+        logger.info("job %s %s", job_id, self.status(job_id)['status'])
+        self._drop_old_jobs()
+
+    def _drop_old_jobs(self):
+        """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS."""
+        with self.lock:
+            finished = [job_id for job_id, record in self.jobs.items() if 'finished' in record]
+            for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+                del self.jobs[job_id]
+
+    def status(self, job_id):
+        """Return the JSON-serialisable status of a job, or None if it is not known."""
+        record = self.jobs.get(job_id)
+        if record is None:
+            return None
+        future = record['future']
+        status = {'id': job_id, **record['job'], 'submitted': record['submitted']}
+        if future.cancelled():
+            status['status'] = 'cancelled'
+        elif 'finished' not in record:
+            current = self.progress.get(job_id)
+            status['status'] = 'running' if current else 'queued'
+            if current:
+                status.update(stage=current['stage'], fraction=current['fraction'], started=current['started'])
+        elif record['result'] is not None:
+            status['status'] = 'done'
+            status.update(record['result'], finished=record['finished'])
+        elif record['error'] is not None:
+            status.update(status='failed', error=record['error'], finished=record['finished'])
+        else:
+            status.update(status='cancelled', finished=record['finished'])
+        return status
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or ask a running one to stop at its next stage; returns its status."""
+        record = self.jobs.get(job_id)
+        if record is None:
+            return None
+        if not record['future'].cancel() and not record['future'].done():
+            self.cancelled[job_id] = True
+        return self.status(job_id)
+
+    def health(self):
+        """Return the service status: workers, uptime and the number of jobs in each state."""
+        counts = dict.fromkeys(JOB_STATES, 0)
+        for job_id in list(self.jobs):
+            status = self.status(job_id)
+            if status is not None:
+                counts[status['status']] += 1
+        return {'status': 'ok', 'workers': self.workers, 'uptime_seconds': round(time.time() - self.started, 1),
+                'jobs': counts}
+
+    def shutdown(self):
+        """Cancel the queued jobs, wait for the running ones and stop the workers."""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.manager.shutdown()
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    """JSON API of a ReportService; the service is the server's 'service' attribute."""
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/health':
+            self._reply(200, service.health())
+        elif self.path == '/jobs':
+            self._reply(200, [status for status in map(service.status, list(service.jobs)) if status is not None])
+        elif self.path.startswith('/jobs/'):
+            self._reply_job(service.status(self.path[len('/jobs/'):]))
+        else:
+            self._reply(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self._reply(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = parse_job(json.loads(self.rfile.read(length) or b'null'))
+        except ValueError as exc:
+            self._reply(400, {'error': str(exc)})
+            return
+        self._reply(202, self.server.service.submit(job))
+
+    def do_DELETE(self):
+        if not self.path.startswith('/jobs/'):
+            self._reply(404, {'error': 'Not found'})
+            return
+        self._reply_job(self.server.service.cancel(self.path[len('/jobs/'):]))
+
+    def _reply_job(self, status):
+        if status is None:
+            self._reply(404, {'error': 'No such job'})
+        else:
+            self._reply(200, status)
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None):
+    """Warm up a ReportService and serve its API on host:port until interrupted or terminated."""
+    signal.signal(signal.SIGTERM, _interrupt)
+    service = ReportService(workers)
+    service.warm_up()
+    server = ThreadingHTTPServer((host, port), ReportRequestHandler)
+    server.service = service
+    logger.info("report service on http://%s:%d with %d warm workers", host, server.server_port, service.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+class ReportServiceClient:
+    """Submit report jobs to a running ReportService and follow them until they finish."""
+
+    def __init__(self, url=DEFAULT_SERVICE_URL, timeout=10):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = Request(self.url + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except HTTPError as exc:
+            try:
+                message = json.loads(exc.read()).get('error', exc.reason)
+            except ValueError:
+                message = exc.reason
+            raise ReportServiceError(message) from None
+
+    def health(self):
+        """Return the service status; raises URLError when no service is listening."""
+        return self._request('GET', '/health')
+
+    def submit(self, input_path, output_path, period=DATE_OPTIONS[0], **options):
+        """Queue a report of input_path into output_path and return its status.
+
+        options are the other JOB_OPTIONS. Paths are sent as absolute paths, as the service does
+        not share this process's working directory.
+        """
+        job = {'input': os.path.abspath(input_path), 'output': os.path.abspath(output_path), 'period': period}
+        job.update((key, value) for key, value in options.items() if value is not None)
+        if job.get('tariff'):
+            job['tariff'] = os.path.abspath(job['tariff'])
+        return self._request('POST', '/jobs', job)
+
+    def status(self, job_id):
+        """Return the status of a job."""
+        return self._request('GET', f'/jobs/{job_id}')
+
+    def cancel(self, job_id):
+        """Cancel a job and return its status."""
+        return self._request('DELETE', f'/jobs/{job_id}')
+
+    def wait(self, job_id, poll_seconds=0.1, on_status=None):
+        """Poll a job until it is done, failed or cancelled and return its final status.
+
+        on_status, if given, is called with every status polled while the job is unfinished.
+        """
+        while True:
+            status = self.status(job_id)
+            if status['status'] in ('done', 'failed', 'cancelled'):
+                return status
+            if on_status is not None:
+                on_status(status)
+            time.sleep(poll_seconds)
+
+
+def service_available(url):
+    """Return True if a report service answers at url."""
+    try:
+        ReportServiceClient(url, timeout=2).health()
+    except (URLError, OSError, ReportServiceError, ValueError):
+        return False
+    return True
+
+
+def build_submit_parser():
+    """Return the argument parser for the secu-arrears-submit command."""
+    parser = argparse.ArgumentParser(
+        prog='secu-arrears-submit',
+        description='Send extracts to a running secu-arrears-service and wait for their reports.'
+    )
+    parser.add_argument('inputs', nargs='+', help='extract files')
+    parser.add_argument('-o', '--output', help='output .xlsx path when a single extract is given')
+    parser.add_argument('--output-dir', help='directory for the reports (default: next to each extract)')
+    parser.add_argument('-p', '--period', choices=DATE_OPTIONS, default=DATE_OPTIONS[0],
+                        help='billing date range (default: %(default)s)')
+    parser.add_argument('--engine', help='CSV parser, c or pyarrow (default: c)')
+    parser.add_argument('--writer', help='workbook writer, openpyxl or xlsxwriter (default: openpyxl)')
+    parser.add_argument('--chunksize', type=int, help='read CSV extracts this many rows at a time')
+    parser.add_argument('--tariff', help='CSV table of the billed item codes and their billing rules')
+    parser.add_argument('--url', default=DEFAULT_SERVICE_URL, help='service URL (default: %(default)s)')
+    return parser
+
+
+def submit_main(argv=None):
+    """Run the secu-arrears-submit command and return its exit status."""
+    parser = build_submit_parser()
+    args = parser.parse_args(argv)
+    if args.output and len(args.inputs) > 1:
+        parser.error('--output can only be used with a single extract; use --output-dir instead')
+
+    client = ReportServiceClient(args.url)
+    options = {'engine': args.engine, 'writer': args.writer, 'chunksize': args.chunksize, 'tariff': args.tariff}
+    jobs = []
+    try:
+        for input_path in args.inputs:
+            stem = os.path.splitext(os.path.basename(input_path))[0]
+            output_path = args.output or os.path.join(args.output_dir or os.path.dirname(input_path), stem + '.xlsx')
+            jobs.append((input_path, output_path, client.submit(input_path, output_path, args.period, **options)))
+        statuses = [client.wait(status['id']) for _, _, status in jobs]
+    except (URLError, OSError) as exc:
+        print(f"The report service at {args.url} cannot be reached: {exc}", file=sys.stderr)
+        return 1
+    except ReportServiceError as exc:
+        print(f"The report service rejected the job: {exc}", file=sys.stderr)
+        return 1
+
+    failed = 0
+    for (input_path, output_path, _), status in zip(jobs, statuses):
+        if status['status'] == 'done':
+            print(f"Report successfully saved to {output_path} ({status['total_wall_seconds']:.1f} s)")
+        else:
+            failed += 1
+            print(f"FAILED {input_path}: {status.get('error', status['status'])}", file=sys.stderr)
+    return 1 if failed else 0
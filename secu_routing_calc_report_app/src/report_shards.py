@@ -0,0 +1,197 @@
+"""Sharded output for reports whose 'Updated Data' sheet is too large for one worksheet or one workbook.
+
+The billable rows are split into shards by Branch, by SabreCode or by row count. The shards are
+written either as several detail sheets of the report itself or as companion workbooks, which a
+pool of worker processes writes in parallel. The report keeps its Summary and gains a
+'Detail Index' sheet that links to every shard.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from billing_engine import code_order
+from report_metrics import stage_span
+from report_writer import REPORT_TITLE, open_report_workbook, sheet_name
+
+# An Excel worksheet holds at most this many rows, header included
+EXCEL_MAX_ROWS = 1048576
+DEFAULT_SHARD_ROWS = EXCEL_MAX_ROWS - 1
+
+# Ways of splitting the detail rows accepted by plan_shards
+SHARD_KEYS = ['rows', 'branch', 'sabrecode']
+
+INDEX_SHEET = 'Detail Index'
+DETAIL_SHEET = 'Updated Data'
+MISSING_LABELS = {'Branch': 'No Branch', 'SabreCode': 'No SabreCode'}
+
+# Suffix of the directory, next to the report, that holds its companion workbooks
+SHARD_DIR_SUFFIX = '_detail'
+
+
+def plan_shards(df_filtered, shard_by='rows', max_rows=DEFAULT_SHARD_ROWS):
+    """Return the shards of df_filtered as a list of (label, row positions) pairs.
+
+    'rows' cuts the rows in file order into shards of max_rows. 'branch' gives every Branch its
+    own shard. 'sabrecode' packs whole SabreCodes, in the Summary's order, into shards of at most
+    max_rows. A group larger than max_rows is cut into several shards. Rows keep their file order
+    within every shard.
+    """
+    if shard_by not in SHARD_KEYS:
+        raise ValueError(f"Invalid shard key: {shard_by}")
+    if max_rows < 1:
+        raise ValueError("max_rows must be at least 1")
+    n_rows = len(df_filtered)
+    if shard_by == 'rows':
+        return [(f'Rows {start + 1}-{min(start + max_rows, n_rows)}', np.arange(start, min(start + max_rows, n_rows)))
+                for start in range(0, n_rows, max_rows)]
+
+    # Sort the rows by group, stably, and find where each group starts
+    column = 'Branch' if shard_by == 'branch' else 'SabreCode'
+    codes, uniques = pd.factorize(df_filtered[column], sort=True)
+    # Put the groups in the Summary's order, so numeric codes such as 9 and 10 are not sorted as text
+    group_order = pd.Series(uniques).sort_values(key=code_order).index.to_numpy()
+    ranks = np.empty(len(uniques), dtype=np.int64)
+    ranks[group_order] = np.arange(len(uniques))
+    codes = np.where(codes < 0, codes, ranks[np.maximum(codes, 0)])
+    labels = [str(uniques[group]) for group in group_order]
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append(MISSING_LABELS[column])
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+
+    shards = []
+    if shard_by == 'branch':
+        for group, label in enumerate(labels):
+            shards.extend(_cut(label, order[bounds[group]:bounds[group + 1]], max_rows))
+        return shards
+
+    # Pack consecutive SabreCodes until the next one would overflow the shard
+    first = 0
+    for group in range(1, len(labels) + 1):
+        if group == len(labels) or bounds[group + 1] - bounds[first] > max_rows:
+            label = labels[first] if group - first == 1 else f'{labels[first]} to {labels[group - 1]}'
+            shards.extend(_cut(label, order[bounds[first]:bounds[group]], max_rows))
+            first = group
+    return shards
+
+
+def _cut(label, positions, max_rows):
+    """Return one shard for positions, or numbered parts of at most max_rows if it is larger."""
+    if len(positions) <= max_rows:
+        return [(label, positions)]
+    return [(f'{label} ({part})', positions[start:start + max_rows])
+            for part, start in enumerate(range(0, len(positions), max_rows), 1)]
+
+
+def shard_dir_for(excel_path):
+    """Return the directory that holds the companion workbooks of a report."""
+    return os.path.splitext(excel_path)[0] + SHARD_DIR_SUFFIX
+
+
+def safe_file_label(label):
+    """Return label with every character other than letters, digits, '-' and '.' replaced by '_'."""
+    return ''.join(char if char.isalnum() or char in '-.' else '_' for char in label.strip())
+
+
+def shard_file_name(number, label):
+    """Return the file name of a companion workbook: its number and label, made safe for file systems and links."""
+    return f'{number:03d}_{safe_file_label(label)}.xlsx'
+
+
+def _unique_sheet_names(labels):
+    """Return valid, distinct Excel sheet names for the shard labels."""
+    names = []
+    taken = {INDEX_SHEET.lower(), 'summary'}
+    for label in labels:
+        name = sheet_name(label)
+        suffix = 2
+        while name.lower() in taken:
+            tail = f' ({suffix})'
+            name = sheet_name(label)[:31 - len(tail)] + tail
+            suffix += 1
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+
+def write_shard_workbook(excel_path, df_shard, writer='openpyxl'):
+    """Write one companion workbook holding a shard's 'Updated Data' sheet and return its row count."""
+    workbook = open_report_workbook(excel_path, writer)
+    rows = workbook.write_detail(workbook.add_sheet(DETAIL_SHEET), df_shard)
+    workbook.save()
+    return rows
+
+
+def write_sharded_report(excel_path, summary_df, df_filtered, shards, files=False, workers=None,
+                         title=REPORT_TITLE, progress=None, metrics=None, writer='openpyxl'):
+    """Save the Summary, a 'Detail Index' sheet and the detail rows split into shards from plan_shards.
+
+    Without files every shard is a sheet of the report itself. With files every shard is written
+    to its own workbook in the directory given by shard_dir_for(excel_path), by up to workers
+    processes at once (one per CPU by default), and the index links to those files. progress is
+    called as progress('write detail', fraction) as shards are written and as
+    progress('save', 0.0) before the report is saved. Returns the index entries.
+    """
+    workbook = open_report_workbook(excel_path, writer)
+    with stage_span(metrics, 'write summary') as span:
+        workbook.write_summary(workbook.add_sheet('Summary'), summary_df, title)
+        span.rows = len(summary_df)
+    index_ws = workbook.add_sheet(INDEX_SHEET)
+
+    labels = [label for label, _ in shards]
+    if files:
+        shard_dir = shard_dir_for(excel_path)
+        os.makedirs(shard_dir, exist_ok=True)
+        file_names = [shard_file_name(number, label) for number, label in enumerate(labels, 1)]
+        links = [f'{os.path.basename(shard_dir)}/{file_name}' for file_name in file_names]
+        with stage_span(metrics, 'write detail') as span:
+            span.rows = _write_shard_files([os.path.join(shard_dir, file_name) for file_name in file_names],
+                                           df_filtered, shards, workers, progress, writer)
+    else:
+        sheet_names = _unique_sheet_names(labels)
+        links = ["#'{}'!A1".format(name.replace("'", "''")) for name in sheet_names]
+        with stage_span(metrics, 'write detail') as span:
+            span.rows = 0
+            for number, (name, (_, positions)) in enumerate(zip(sheet_names, shards)):
+                if progress is not None:
+                    progress('write detail', number / len(shards))
+                span.rows += workbook.write_detail(workbook.add_sheet(name), df_filtered.iloc[positions])
+
+    entries = [(label, len(positions), link) for (label, positions), link in zip(shards, links)]
+    workbook.write_index(index_ws, entries)
+
+    if progress is not None:
+        progress('save', 0.0)
+    with stage_span(metrics, 'save'):
+        workbook.save()
+    return entries
+
+
+def _write_shard_files(paths, df_filtered, shards, workers, progress, writer):
+    """Write the shard workbooks, in a process pool when there is more than one, and return the row total."""
+    if len(shards) <= 1 or workers == 1:
+        rows = 0
+        for number, (path, (_, positions)) in enumerate(zip(paths, shards)):
+            if progress is not None:
+                progress('write detail', number / len(shards))
+            rows += write_shard_workbook(path, df_filtered.iloc[positions], writer)
+        return rows
+
+    rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_shard_workbook, path, df_filtered.iloc[positions], writer)
+                   for path, (_, positions) in zip(paths, shards)]
+        try:
+            for done, future in enumerate(as_completed(futures)):
+                if progress is not None:
+                    progress('write detail', done / len(futures))
+                rows += future.result()
+        except BaseException:
+            # Stop the shards that have not started yet, e.g. when the report is cancelled
+            for future in futures:
+                future.cancel()
+            raise
+    return rows
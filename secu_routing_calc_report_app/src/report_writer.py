@@ -0,0 +1,420 @@
+import re
+from copy import copy
+from itertools import chain
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.packaging.custom import StringProperty
+from openpyxl.styles import Font, Border, Side, NamedStyle, PatternFill, Alignment
+from openpyxl.worksheet.hyperlink import Hyperlink
+
+from report_metrics import stage_span
+
+REPORT_TITLE = "SECU 6 month Active billing"
+
+# Define styles
+CURRENCY_FORMAT = 'R #,##0.00'
+PERCENTAGE_FORMAT = '0%'
+TITLE_FONT = Font(bold=True, underline='single', size=14)
+BOLD_FONT = Font(bold=True)
+BLUE_FONT = Font(color="0000FF")
+RED_FONT = Font(color="FF0000")
+HEADER_FILL = PatternFill(start_color="000099", end_color="000099", fill_type="solid")
+HEADER_FONT = Font(color="FFFFFF")
+HEADER_ALIGNMENT = Alignment(horizontal='center')
+BORDER_COLOR = "D9D9D9"
+
+# Define border styles
+THIN_SIDE = Side(border_style='thin', color=BORDER_COLOR)
+THICK_SIDE = Side(border_style='thick', color="000000")
+BORDER_STYLE = Border(left=THIN_SIDE, right=THIN_SIDE, top=THIN_SIDE, bottom=THIN_SIDE)
+
+# 'Top and Thick Bottom' border style for the 'Total_ex_VAT' cell with black color
+TOTAL_EX_VAT_BORDER = Border(
+    top=Side(border_style='thin', color="000000"),
+    bottom=Side(border_style='thick', color="000000"),
+    left=Side(border_style='none'),
+    right=Side(border_style='none')
+)
+
+SUMMARY_CURRENCY_COLS = ['17300', '15300', 'Total_ex_VAT', 'Amount', 'Price Per Unit']
+SUMMARY_PERCENTAGE_COLS = ['% Split']
+
+# Number formats of the 'Updated Data' sheet
+DETAIL_CURRENCY_COLS = ('Amount',)
+DETAIL_NUMBER_COLS = ('DaysActive', 'MonthsActive')
+
+# Summary layout: title merged over D1:H1, header in row 3 from column C, spacer row 4, data from row 5
+SUMMARY_TITLE_COL = 4
+SUMMARY_TITLE_RANGE = 'D1:H1'
+SUMMARY_HEADER_ROW = 3
+SUMMARY_FIRST_COL = 3
+SPACER_ROW_HEIGHT = 7.5
+
+# Columns of the index sheet that links a sharded report to its detail sheets or workbooks
+INDEX_COLUMNS = ['Detail', 'Rows', 'Location']
+
+# Excel sheet names are at most 31 characters and cannot contain any of []:*?/\
+SHEET_NAME_LENGTH = 31
+INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+# Codes used by the Summary style plan
+FORMAT_NONE, FORMAT_CURRENCY, FORMAT_PERCENTAGE = 0, 1, 2
+FONT_NONE, FONT_RED, FONT_BOLD = 0, 1, 2
+BORDER_NONE = 0
+BORDER_THIN = 1
+BORDER_THICK_TOP = 2
+BORDER_THICK_BOTTOM = 4
+BORDER_THICK_LEFT = 8
+BORDER_THICK_RIGHT = 16
+BORDER_TOTAL = 32
+
+
+def create_named_styles():
+    """Return fresh 'currency' and 'number' named styles for a new workbook."""
+    currency_format = NamedStyle(name='currency', number_format=CURRENCY_FORMAT)
+    number_format = NamedStyle(name='number', number_format='0')
+    return currency_format, number_format
+
+
+# Workbook writers accepted by open_report_workbook; 'xlsxwriter' needs the optional XlsxWriter package
+WRITER_BACKENDS = ['openpyxl', 'xlsxwriter']
+
+
+def open_report_workbook(excel_path, writer='openpyxl'):
+    """Return a new report workbook that will be saved to excel_path by the named writer backend.
+
+    Every backend has the same methods, add_sheet, write_summary, write_detail, write_index,
+    set_properties and save, and produces the same layout.
+    """
+    if writer == 'openpyxl':
+        return OpenpyxlReportWorkbook(excel_path)
+    if writer == 'xlsxwriter':
+        from xlsxwriter_backend import XlsxWriterReportWorkbook
+        return XlsxWriterReportWorkbook(excel_path)
+    raise ValueError(f"Invalid writer backend: {writer}")
+
+
+class OpenpyxlReportWorkbook:
+    """Report workbook written by openpyxl in write-only mode, so every sheet streams straight to disk."""
+
+    def __init__(self, excel_path):
+        self.excel_path = excel_path
+        self.wb = Workbook(write_only=True)
+        self.currency_format, self.number_format = create_named_styles()
+
+    def add_sheet(self, title):
+        """Add an empty worksheet and return it."""
+        return self.wb.create_sheet(title=title)
+
+    def write_summary(self, ws, summary_df, title):
+        """Write the styled Summary to a sheet returned by add_sheet."""
+        write_summary_sheet(ws, summary_df, title, self.currency_format)
+
+    def write_detail(self, ws, df):
+        """Write the detail rows to a sheet returned by add_sheet and return their number."""
+        return write_detail_sheet(ws, df, self.currency_format, self.number_format)
+
+    def write_index(self, ws, entries):
+        """Write the index of a sharded report to a sheet returned by add_sheet."""
+        write_index_sheet(ws, entries)
+
+    def set_properties(self, properties):
+        """Add a custom document property, holding text, for every name and value in properties."""
+        for name, value in properties.items():
+            self.wb.custom_doc_props.append(StringProperty(name=name, value=value))
+
+    def save(self):
+        self.wb.save(self.excel_path)
+
+
+def write_report(excel_path, summary_df, df_filtered, title=REPORT_TITLE, progress=None, metrics=None,
+                 writer='openpyxl'):
+    """Save the styled 'Summary' and 'Updated Data' sheets to excel_path in a single write.
+
+    df_filtered may also be an iterable of DataFrame chunks. progress, if given, is called as
+    progress('save', 0.0) before the workbook is saved. metrics, a report_metrics.ReportMetrics,
+    measures the 'write summary', 'write detail' and 'save' stages. writer names one of the
+    WRITER_BACKENDS.
+    """
+    workbook = open_report_workbook(excel_path, writer)
+
+    # Add the styled 'Summary' sheet
+    with stage_span(metrics, 'write summary') as span:
+        workbook.write_summary(workbook.add_sheet('Summary'), summary_df, title)
+        span.rows = len(summary_df)
+
+    # Add the 'Updated Data' sheet, with the 'Active' rows in blue
+    with stage_span(metrics, 'write detail') as span:
+        span.rows = workbook.write_detail(workbook.add_sheet('Updated Data'), df_filtered)
+
+    # Save the workbook with both sheets
+    if progress is not None:
+        progress('save', 0.0)
+    with stage_span(metrics, 'save'):
+        workbook.save()
+
+
+def write_streaming_report(excel_path, detail_chunks, make_summary, title=REPORT_TITLE, progress=None,
+                           metrics=None, writer='openpyxl'):
+    """Stream detail_chunks to the 'Updated Data' sheet, then add the Summary from make_summary().
+
+    make_summary is called once every chunk has been written, so it can use totals gathered while
+    the chunks were consumed. The Summary is still the first sheet of the saved workbook.
+    progress, metrics and writer are used as in write_report; here the 'write detail' stage also
+    contains the time spent producing the chunks.
+    """
+    workbook = open_report_workbook(excel_path, writer)
+    summary_ws = workbook.add_sheet('Summary')
+    detail_ws = workbook.add_sheet('Updated Data')
+
+    # Add the 'Updated Data' sheet first, with the 'Active' rows in blue
+    with stage_span(metrics, 'write detail') as span:
+        span.rows = workbook.write_detail(detail_ws, detail_chunks)
+
+    # Add the styled 'Summary' sheet once all rows have been seen
+    summary_df = make_summary()
+    with stage_span(metrics, 'write summary') as span:
+        workbook.write_summary(summary_ws, summary_df, title)
+        span.rows = len(summary_df)
+
+    if progress is not None:
+        progress('save', 0.0)
+    with stage_span(metrics, 'save'):
+        workbook.save()
+
+
+def write_period_report(excel_path, summaries, title=REPORT_TITLE, progress=None, metrics=None, writer='openpyxl'):
+    """Save one styled Summary sheet per billing period to excel_path.
+
+    summaries maps each period name to its summary_df, in sheet order; every sheet is named and
+    titled after its period. progress, metrics and writer are used as in write_report.
+    """
+    workbook = open_report_workbook(excel_path, writer)
+
+    with stage_span(metrics, 'write summary') as span:
+        for name, summary_df in summaries.items():
+            workbook.write_summary(workbook.add_sheet(sheet_name(name)), summary_df, f'{title} {name}')
+        span.rows = sum(len(summary_df) for summary_df in summaries.values())
+
+    if progress is not None:
+        progress('save', 0.0)
+    with stage_span(metrics, 'save'):
+        workbook.save()
+
+
+def sheet_name(name):
+    """Return name made valid as an Excel sheet name."""
+    return INVALID_SHEET_CHARS.sub('-', name)[:SHEET_NAME_LENGTH]
+
+
+def plan_summary_styles(summary_df, currency_cols=SUMMARY_CURRENCY_COLS,
+                        percentage_cols=SUMMARY_PERCENTAGE_COLS):
+    """Work out the number format, font and border of every Summary data cell in one vectorized step.
+
+    summary_df ends with the blank row and the 'Total' row. The fee columns of the tariff, between
+    'Branch' and 'TotalActive', are always currency. Returns a (rows x columns) array of indexes
+    into the list of distinct (format, font, border) keys used by the sheet.
+    """
+    n_rows, n_cols = summary_df.shape
+    total_col = summary_df.columns.get_loc('Total_ex_VAT')
+    totals = summary_df['Total_ex_VAT'].to_numpy(dtype=float)
+    row_pos = np.arange(n_rows)[:, None]
+    col_pos = np.arange(n_cols)[None, :]
+
+    # Number formats apply per column to every row below the header
+    columns = summary_df.columns
+    fee_cols = columns[columns.get_loc('Branch') + 1:columns.get_loc('TotalActive')]
+    column_formats = np.select(
+        [columns.isin(currency_cols) | columns.isin(fee_cols), columns.isin(percentage_cols)],
+        [FORMAT_CURRENCY, FORMAT_PERCENTAGE],
+        FORMAT_NONE
+    )
+    formats = np.broadcast_to(column_formats, (n_rows, n_cols))
+
+    # Red rows where 'Total_ex_VAT' = 0, bold 'Total_ex_VAT' values greater than 0 and a bold 'Total' row
+    fonts = np.repeat(np.where(totals == 0, FONT_RED, FONT_NONE)[:, None], n_cols, axis=1)
+    fonts[totals > 0, total_col] = FONT_BOLD
+    fonts[-1, :] = FONT_BOLD
+
+    # Thin borders with a thick outline around the data rows, and the total border on the grand total
+    borders = (
+        BORDER_THIN +
+        BORDER_THICK_TOP * (row_pos == 0) +
+        BORDER_THICK_BOTTOM * (row_pos == n_rows - 3) +
+        BORDER_THICK_LEFT * (col_pos == 0) +
+        BORDER_THICK_RIGHT * (col_pos == n_cols - 1)
+    ) * (row_pos < n_rows - 2)
+    borders[-1, total_col] = BORDER_TOTAL
+
+    keys = np.stack([formats, fonts, borders], axis=-1).reshape(-1, 3)
+    distinct_keys, style_ids = np.unique(keys, axis=0, return_inverse=True)
+    return style_ids.reshape(n_rows, n_cols), [tuple(key) for key in distinct_keys.tolist()]
+
+
+def _summary_border(border_code):
+    """Return the Border for a style plan border code."""
+    if border_code == BORDER_TOTAL:
+        return TOTAL_EX_VAT_BORDER
+    return Border(
+        left=THICK_SIDE if border_code & BORDER_THICK_LEFT else THIN_SIDE,
+        right=THICK_SIDE if border_code & BORDER_THICK_RIGHT else THIN_SIDE,
+        top=THICK_SIDE if border_code & BORDER_THICK_TOP else THIN_SIDE,
+        bottom=THICK_SIDE if border_code & BORDER_THICK_BOTTOM else THIN_SIDE
+    )
+
+
+def _summary_style(ws, key, currency_format):
+    """Return the shared style array for one style plan key, or None for an unstyled cell."""
+    number_code, font_code, border_code = key
+    if key == (FORMAT_NONE, FONT_NONE, BORDER_NONE):
+        return None
+    template = WriteOnlyCell(ws)
+    if number_code == FORMAT_CURRENCY:
+        template.style = currency_format
+    elif number_code == FORMAT_PERCENTAGE:
+        template.number_format = PERCENTAGE_FORMAT
+    if font_code == FONT_RED:
+        template.font = RED_FONT
+    elif font_code == FONT_BOLD:
+        template.font = BOLD_FONT
+    if border_code != BORDER_NONE:
+        template.border = _summary_border(border_code)
+    return template._style
+
+
+def write_summary_sheet(ws, summary_df, title, currency_format):
+    """Stream the styled Summary sheet into a write-only worksheet in a single pass.
+
+    summary_df must already end with the blank row and the 'Total' row.
+    """
+    style_ids, keys = plan_summary_styles(summary_df)
+    styles = [_summary_style(ws, key, currency_format) for key in keys]
+    padding = [None] * (SUMMARY_FIRST_COL - 1)
+
+    # Row heights, merges and the sheet view must be set before the rows are streamed out
+    first_data_row = SUMMARY_HEADER_ROW + 2
+    blank_row_index = first_data_row + len(summary_df) - 2
+    ws.row_dimensions[SUMMARY_HEADER_ROW + 1].height = SPACER_ROW_HEIGHT
+    ws.row_dimensions[blank_row_index].height = SPACER_ROW_HEIGHT
+    ws.merged_cells.add(SUMMARY_TITLE_RANGE)
+    ws.sheet_view.showGridLines = False
+
+    # Add title row
+    title_cell = WriteOnlyCell(ws, value=title)
+    title_cell.font = TITLE_FONT
+    ws.append([None] * (SUMMARY_TITLE_COL - 1) + [title_cell])
+    for _ in range(SUMMARY_HEADER_ROW - 2):
+        ws.append([])
+
+    # Header row with fill, font color, centered text and borders
+    header = []
+    for col_name in summary_df.columns.tolist():
+        cell = WriteOnlyCell(ws, value=col_name)
+        cell.fill = HEADER_FILL
+        cell.font = HEADER_FONT
+        cell.alignment = HEADER_ALIGNMENT
+        cell.border = BORDER_STYLE
+        header.append(cell)
+    ws.append(padding + header)
+    ws.append([])
+
+    # Data, blank and 'Total' rows
+    values = summary_display_values(summary_df)
+    for row_values, row_ids in zip(values.itertuples(index=False, name=None), style_ids):
+        ws.append(padding + [_styled_cell(ws, value, styles[style_id])
+                             for value, style_id in zip(row_values, row_ids)])
+
+
+def summary_display_values(summary_df):
+    """Return the Summary values as written to the sheet, with None for missing values.
+
+    '% Split' is followed by the share and base columns ('% 15300' and '% 17300' by default). A
+    '% Split' of 0 and a share of 0 are shown as '-', and so is the base wherever '% Split' is
+    shown as '-'. A Summary without '% Split' is written as it is.
+    """
+    values = summary_df.astype(object).where(summary_df.notna(), None)
+    if '% Split' not in summary_df.columns:
+        return values
+    split_col = summary_df.columns.get_loc('% Split')
+    share_col, base_col = summary_df.columns[split_col + 1:split_col + 3]
+    no_split = summary_df['% Split'] == 0
+    values.loc[no_split, ['% Split', base_col]] = '-'
+    values.loc[summary_df[share_col] == 0, share_col] = '-'
+    return values
+
+
+def write_detail_sheet(ws, df, currency_format, number_format, active_font=BLUE_FONT,
+                       currency_cols=DETAIL_CURRENCY_COLS, numeric_cols=DETAIL_NUMBER_COLS):
+    """Stream df into a write-only worksheet, one styled row at a time.
+
+    df is a DataFrame or an iterable of DataFrame chunks sharing the same columns. Each row is built
+    from shared style templates, so memory stays flat regardless of row count.
+    Rows whose DeviceActive is 'Active' are written in active_font. Returns the number of data rows.
+    """
+    chunks = iter([df]) if hasattr(df, 'itertuples') else iter(df)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return 0
+    columns = first_chunk.columns.tolist()
+    ws.append(columns)
+
+    # Build one template per column for inactive rows and one for active rows
+    templates = []
+    for col in columns:
+        template = WriteOnlyCell(ws)
+        if col in currency_cols:
+            template.style = currency_format
+        elif col in numeric_cols:
+            template.style = number_format
+        templates.append(template)
+    plain_styles = [copy(template._style) if template.has_style else None for template in templates]
+    for template in templates:
+        template.font = active_font
+    active_styles = [template._style for template in templates]
+
+    device_active_index = columns.index('DeviceActive')
+    n_rows = 0
+    for chunk in chain([first_chunk], chunks):
+        for values in chunk.itertuples(index=False, name=None):
+            styles = active_styles if values[device_active_index] == 'Active' else plain_styles
+            ws.append([_styled_cell(ws, value, style) for value, style in zip(values, styles)])
+        n_rows += len(chunk)
+    return n_rows
+
+
+def write_index_sheet(ws, entries):
+    """Stream a sharded report's index into a write-only worksheet, one linked row per shard.
+
+    entries are (label, rows, link) tuples. A link starting with '#' is a location in the same
+    workbook, such as "#'Updated Data 2'!A1"; any other link is a path to another file.
+    """
+    header = []
+    for col_name in INDEX_COLUMNS:
+        cell = WriteOnlyCell(ws, value=col_name)
+        cell.fill = HEADER_FILL
+        cell.font = HEADER_FONT
+        cell.alignment = HEADER_ALIGNMENT
+        cell.border = BORDER_STYLE
+        header.append(cell)
+    ws.append(header)
+
+    for label, rows, link in entries:
+        label_cell = WriteOnlyCell(ws, value=label)
+        if link.startswith('#'):
+            label_cell.hyperlink = Hyperlink(ref='', location=link[1:])
+        else:
+            label_cell.hyperlink = link
+        label_cell.style = 'Hyperlink'
+        ws.append([label_cell, rows, link.lstrip('#')])
+
+
+def _styled_cell(ws, value, style):
+    """Return a write-only cell holding value with a copy of the given style array."""
+    cell = WriteOnlyCell(ws)
+    if style is not None:
+        cell._style = copy(style)
+    # Assign the value last so dates still pick up their default number format
+    cell.value = value
+    return cell
@@ -0,0 +1,157 @@
+"""Tariff table: the billable item codes and the rules each one is billed by.
+
+A tariff is a CSV file with one row per billable ItemCode and these columns:
+
+    item_code       the ItemCode as it appears in the extract
+    label           the Summary column of the code's fees (default: the item code)
+    threshold_days  a device must have signalled for more than this many days to be active (default 10)
+    month_days      days per billed month (default 30)
+    rounding        how DaysActive / month_days becomes MonthsActive: ceil, floor or none (default ceil)
+    split           'base' or 'share' for the two codes compared by the Summary's % Split columns
+
+The table is compiled once into arrays indexed by rule position, so every row is classified and
+billed by its own code's rules in a single vectorized pass, whatever the number of codes.
+"""
+import csv
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+TARIFF_COLUMNS = ['item_code', 'label', 'threshold_days', 'month_days', 'rounding', 'split']
+TariffRule = namedtuple('TariffRule', TARIFF_COLUMNS)
+
+# Defaults for the optional tariff columns; a missing label is the item code
+RULE_DEFAULTS = {'threshold_days': 10, 'month_days': 30, 'rounding': 'ceil', 'split': ''}
+
+ROUNDING_RULES = ['ceil', 'floor', 'none']
+SPLIT_ROLES = ['', 'base', 'share']
+
+# Summary columns a label may not take
+RESERVED_LABELS = ['SabreCode', 'Branch', 'TotalActive', 'Total_ex_VAT', 'Price Per Unit', '% Split']
+
+
+class Tariff:
+    """A validated tariff table compiled into per-rule lookup arrays.
+
+    rule_index maps ItemCodes to rule positions; threshold_days, month_days and rounding hold
+    each rule's values at its position, so indexing them with the rule positions of a frame's
+    rows gives every row its own rules.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(TariffRule(*rule) for rule in rules)
+        if not self.rules:
+            raise ValueError("A tariff needs at least one item code")
+        self.item_codes = [rule.item_code for rule in self.rules]
+        self.labels = [rule.label for rule in self.rules]
+        for name, values in (('item code', self.item_codes), ('label', self.labels)):
+            duplicates = sorted({value for value in values if values.count(value) > 1})
+            if duplicates:
+                raise ValueError(f"Duplicate tariff {name}: {', '.join(duplicates)}")
+        for rule in self.rules:
+            if rule.label in RESERVED_LABELS or rule.label.startswith('% '):
+                raise ValueError(f"Invalid tariff label for {rule.item_code}: {rule.label}")
+            if rule.month_days <= 0 or rule.threshold_days < 0:
+                raise ValueError(f"Invalid tariff days for {rule.item_code}")
+            if rule.rounding not in ROUNDING_RULES:
+                raise ValueError(f"Invalid tariff rounding for {rule.item_code}: {rule.rounding}")
+            if rule.split not in SPLIT_ROLES:
+                raise ValueError(f"Invalid tariff split for {rule.item_code}: {rule.split}")
+
+        # The codes compared by the % Split columns, if the table names both
+        roles = {}
+        for rule in self.rules:
+            if rule.split:
+                if rule.split in roles:
+                    raise ValueError(f"Only one tariff item code can have split '{rule.split}'")
+                roles[rule.split] = rule.label
+        if len(roles) == 1:
+            raise ValueError("A tariff split needs both a 'base' and a 'share' item code")
+        self.split_base = roles.get('base')
+        self.split_share = roles.get('share')
+
+        self.threshold_days = np.array([rule.threshold_days for rule in self.rules], dtype=np.int64)
+        self.month_days = np.array([rule.month_days for rule in self.rules], dtype=np.float64)
+        self.rounding = np.array([ROUNDING_RULES.index(rule.rounding) for rule in self.rules], dtype=np.int8)
+        self._index = pd.Index(self.item_codes)
+
+    def __eq__(self, other):
+        return isinstance(other, Tariff) and self.rules == other.rules
+
+    def __hash__(self):
+        return hash(self.rules)
+
+    def __repr__(self):
+        return f"Tariff({', '.join(self.item_codes)})"
+
+    def key(self):
+        """Return the rules as plain lists, for cache keys."""
+        return [list(rule) for rule in self.rules]
+
+    def rule_index(self, item_codes):
+        """Return the rule position of each ItemCode in a Series, or -1 where the code is not billed.
+
+        Codes are looked up once per distinct value, converted to str as the tariff's item codes
+        are, so an ItemCode column read as numbers bills the same as one read as strings.
+        """
+        if isinstance(item_codes.dtype, pd.CategoricalDtype):
+            codes, values = item_codes.cat.codes.to_numpy(), item_codes.cat.categories
+        else:
+            codes, values = pd.factorize(item_codes)
+        value_rules = self._index.get_indexer(pd.Index(values).astype(str))
+        return np.where(codes >= 0, np.append(value_rules, -1)[codes], -1)
+
+    def billable(self, item_codes):
+        """Return a boolean mask of the ItemCodes the tariff bills."""
+        return self.rule_index(item_codes) >= 0
+
+    def months(self, days_active, rule_index):
+        """Return MonthsActive for DaysActive values billed by the rules at rule_index (-1 rows give 0)."""
+        rules = np.maximum(rule_index, 0)
+        months = days_active / self.month_days[rules]
+        rounding = self.rounding[rules]
+        for code, rule in enumerate(ROUNDING_RULES):
+            if rule == 'none':
+                continue
+            apply = np.ceil if rule == 'ceil' else np.floor
+            if (rounding == code).all():
+                months = apply(months)
+            elif (rounding == code).any():
+                months = np.where(rounding == code, apply(months), months)
+        return np.where(rule_index >= 0, months, 0.0)
+
+
+def load_tariff(path):
+    """Return the Tariff of a tariff CSV file; only item_code is required, the other columns default."""
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None or 'item_code' not in reader.fieldnames:
+            raise ValueError(f"{path} has no item_code column")
+        unknown = [col for col in reader.fieldnames if col not in TARIFF_COLUMNS]
+        if unknown:
+            raise ValueError(f"{path} has unknown tariff columns: {', '.join(unknown)}")
+        rules = []
+        for row in reader:
+            values = {col: (row.get(col) or '').strip() for col in TARIFF_COLUMNS}
+            if not values['item_code']:
+                continue
+            for col, default in RULE_DEFAULTS.items():
+                if not values[col]:
+                    values[col] = default
+            rules.append(TariffRule(
+                item_code=values['item_code'],
+                label=values['label'] or values['item_code'],
+                threshold_days=int(values['threshold_days']),
+                month_days=float(values['month_days']),
+                rounding=values['rounding'],
+                split=values['split']
+            ))
+    return Tariff(rules)
+
+
+# The SECU tariff: 17300 and 15300, active after 10 days, billed per started 30-day month
+DEFAULT_TARIFF = Tariff([
+    TariffRule('17300', '17300', 10, 30, 'ceil', 'base'),
+    TariffRule('15300', '15300', 10, 30, 'ceil', 'share')
+])
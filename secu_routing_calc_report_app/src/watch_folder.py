@@ -0,0 +1,360 @@
+"""Headless daemon that bills every extract dropped into a watched folder.
+
+The inbox is polled, so any local or network file system works. A file is only taken once it has
+stopped changing: its size and modification time must be the same on two polls in a row and it
+must not have been modified for settle_seconds. Settled files go through a bounded asyncio queue
+to a fixed number of worker tasks, each of which runs one report at a time in a shared process
+pool. When the queue is full the poller waits, so a month-end burst is worked through at the
+pool's pace instead of all at once.
+
+Reports are written to the outbox under a temporary name and renamed when complete. The extract
+is then moved to the inbox's 'processed' folder; an extract that still fails after its retries is
+moved to 'failed', next to a text file holding the error. Queue depth, wait, run and end-to-end
+latencies are kept by WatchMetrics, saved to the outbox as watch_status.json after every poll and
+logged for every file.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import signal
+import statistics
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from arrears_report import process_data
+from extract_reader import EXTRACT_EXTENSIONS
+from report_options import DATE_OPTIONS
+from tariff import DEFAULT_TARIFF
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_SECONDS = 2.0
+DEFAULT_SETTLE_SECONDS = 5.0
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_SECONDS = 30.0
+
+# Folders inside the inbox for extracts that are done with
+PROCESSED_DIR = 'processed'
+FAILED_DIR = 'failed'
+
+STATUS_FILE = 'watch_status.json'
+PARTIAL_SUFFIX = '.partial'
+
+# Latencies are summarised over this many of the most recent files
+LATENCY_WINDOW = 1000
+
+WatchJob = namedtuple('WatchJob', ['path', 'discovered', 'attempt'])
+
+
+def render_extract(csv_file_path, excel_path, date_option, engine='c', writer='openpyxl', tariff=DEFAULT_TARIFF):
+    """Bill one extract into excel_path, renaming it into place only once it is complete; returns the billable rows."""
+    directory, name = os.path.split(excel_path)
+    partial_path = os.path.join(directory, f'.{name}{PARTIAL_SUFFIX}')
+    try:
+        _, df_filtered = process_data(csv_file_path, partial_path, date_option, engine, writer=writer,
+                                      tariff=tariff)
+        os.replace(partial_path, excel_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return len(df_filtered)
+
+
+def unique_path(directory, name, reserved=()):
+    """Return the path of name in directory, with a _2, _3, ... suffix before its extension if name is taken.
+
+    A name is taken when the directory already holds it or it is in reserved, the names other
+    reports are being written to.
+    """
+    stem, extension = os.path.splitext(name)
+    candidate = name
+    counter = 1
+    while candidate in reserved or os.path.lexists(os.path.join(directory, candidate)):
+        counter += 1
+        candidate = f'{stem}_{counter}{extension}'
+    return os.path.join(directory, candidate)
+
+
+class FolderScanner:
+    """Find the extracts in a folder that have finished being written.
+
+    scan returns each settled file once; a file is offered again only after forget is called for
+    it, which the daemon does once the file has been moved out of the folder.
+    """
+
+    def __init__(self, inbox, settle_seconds=DEFAULT_SETTLE_SECONDS, extensions=EXTRACT_EXTENSIONS):
+        self.inbox = inbox
+        self.settle_seconds = settle_seconds
+        self.extensions = tuple(extensions)
+        self.signatures = {}
+        self.taken = set()
+
+    def scan(self):
+        """Return the paths of the files that have settled since the last scan, oldest first."""
+        now = time.time()
+        signatures = {}
+        ready = []
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                # Hidden files and Office lock files are never extracts
+                if entry.name.startswith(('.', '~')) or not entry.name.lower().endswith(self.extensions):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                signatures[entry.path] = signature
+                settled = (self.signatures.get(entry.path) == signature and
+                           now - stat.st_mtime >= self.settle_seconds)
+                if settled and entry.path not in self.taken:
+                    ready.append((stat.st_mtime, entry.path))
+        self.signatures = signatures
+        ready.sort()
+        self.taken.update(path for _, path in ready)
+        return [path for _, path in ready]
+
+    def forget(self, path):
+        """Let path be offered again once it settles."""
+        self.taken.discard(path)
+        self.signatures.pop(path, None)
+
+    def waiting(self):
+        """Return the number of extracts seen in the inbox that have not been handed out."""
+        return len(set(self.signatures) - self.taken)
+
+
+class WatchMetrics:
+    """File counts, queue depth and the wait, run and end-to-end latencies of the watched extracts.
+
+    wait is the time from discovery until a worker starts the report, run the time the report
+    itself takes and latency the time from discovery until the file is finished, retries included.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counts = {'queued': 0, 'completed': 0, 'failed': 0, 'retried': 0}
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.latencies = {name: deque(maxlen=LATENCY_WINDOW) for name in ('wait', 'run', 'latency')}
+
+    def record_depth(self, depth):
+        """Note the current number of queued files."""
+        self.queue_depth = depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record(self, name, seconds):
+        """Add one measured wait, run or latency."""
+        self.latencies[name].append(seconds)
+
+    def to_dict(self):
+        """Return the counts and the latency summaries as a JSON-serialisable dict."""
+        summaries = {}
+        for name, values in self.latencies.items():
+            values = sorted(values)
+            summaries[f'{name}_seconds'] = {
+                'count': len(values),
+                'median': round(statistics.median(values), 3) if values else None,
+                'p95': round(values[max(math.ceil(0.95 * len(values)) - 1, 0)], 3) if values else None,
+                'max': round(values[-1], 3) if values else None
+            }
+        return {
+            'updated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'files': dict(self.counts),
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'in_flight': self.in_flight,
+            **summaries
+        }
+
+
+class FolderWatcher:
+    """Poll an inbox and bill every settled extract into the outbox, with up to workers reports at once.
+
+    queue_size caps the settled files waiting for a worker. A failed report is retried up to
+    retries times, after retry_seconds, doubled on every further attempt. With once the watcher
+    stops as soon as the inbox holds no more extracts, instead of running until stop is called.
+    """
+
+    def __init__(self, inbox, outbox, date_option=DATE_OPTIONS[0], workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 poll_seconds=DEFAULT_POLL_SECONDS, settle_seconds=DEFAULT_SETTLE_SECONDS, retries=DEFAULT_RETRIES,
+                 retry_seconds=DEFAULT_RETRY_SECONDS, engine='c', writer='openpyxl', tariff=DEFAULT_TARIFF):
+        if date_option not in DATE_OPTIONS:
+            raise ValueError(f"Invalid date option: {date_option}")
+        self.inbox = inbox
+        self.outbox = outbox
+        self.date_option = date_option
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.poll_seconds = poll_seconds
+        self.retries = retries
+        self.retry_seconds = retry_seconds
+        self.engine = engine
+        self.writer = writer
+        self.tariff = tariff
+        self.scanner = FolderScanner(inbox, settle_seconds)
+        self.metrics = WatchMetrics()
+        self.pending_retries = set()
+        # Outbox names of the reports being written, so two extracts never share one
+        self.reports_in_progress = set()
+        self.stopping = None
+        self.queue = None
+
+    def stop(self):
+        """Stop polling; reports already running are finished and archived, queued files stay in the inbox."""
+        if self.stopping is not None:
+            self.stopping.set()
+
+    async def run(self, once=False):
+        """Watch the inbox until stop is called (or, with once, until it is empty) and return the metrics."""
+        for directory in (self.outbox, os.path.join(self.inbox, PROCESSED_DIR), os.path.join(self.inbox, FAILED_DIR)):
+            os.makedirs(directory, exist_ok=True)
+        self.stopping = asyncio.Event()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Not available on Windows or outside the main thread; Ctrl+C still ends the run
+                pass
+
+        logger.info("watching %s, reports to %s, %d workers", self.inbox, self.outbox, self.workers)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            workers = [asyncio.create_task(self._work(pool)) for _ in range(self.workers)]
+            try:
+                await self._poll(once)
+            finally:
+                # Leave the queued files in the inbox for the next run and let the running reports finish
+                for task in list(self.pending_retries):
+                    task.cancel()
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                self.metrics.record_depth(0)
+                await self.queue.join()
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, *self.pending_retries, return_exceptions=True)
+                self._save_status()
+        logger.info("watch stopped: %s", json.dumps(self.metrics.to_dict()))
+        return self.metrics
+
+    async def _poll(self, once):
+        """Queue the settled extracts every poll_seconds, waiting while the queue is full."""
+        while not self.stopping.is_set():
+            for path in self.scanner.scan():
+                self.metrics.counts['queued'] += 1
+                await self._enqueue(WatchJob(path, time.monotonic(), 0))
+                if self.stopping.is_set():
+                    return
+            self._save_status()
+            if once and self._idle():
+                return
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _idle(self):
+        """Return True when no extract is waiting, queued, running or due to be retried."""
+        return (not self.scanner.waiting() and self.queue.empty() and not self.metrics.in_flight and
+                not self.pending_retries)
+
+    async def _enqueue(self, job):
+        """Put a job on the queue, waiting for room, and note the queue depth."""
+        await self.queue.put(job)
+        self.metrics.record_depth(self.queue.qsize())
+
+    async def _work(self, pool):
+        """Take jobs from the queue one at a time and run each report in the process pool."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            self.metrics.record_depth(self.queue.qsize())
+            if self.stopping.is_set():
+                # Taken after stop was called; it stays in the inbox for the next run
+                self.queue.task_done()
+                continue
+            self.metrics.in_flight += 1
+            try:
+                await self._run_job(loop, pool, job)
+            finally:
+                self.metrics.in_flight -= 1
+                self.queue.task_done()
+
+    async def _run_job(self, loop, pool, job):
+        """Bill one extract, then archive it, retry it or give up on it."""
+        name = os.path.basename(job.path)
+        # An earlier report of the same name, or of an extract with the same stem, is never overwritten
+        excel_path = unique_path(self.outbox, os.path.splitext(name)[0] + '.xlsx', self.reports_in_progress)
+        self.reports_in_progress.add(os.path.basename(excel_path))
+        started = time.monotonic()
+        self.metrics.record('wait', started - job.discovered)
+        try:
+            rows = await loop.run_in_executor(pool, render_extract, job.path, excel_path, self.date_option,
+                                              self.engine, self.writer, self.tariff)
+        except Exception as exc:
+            self.metrics.record('run', time.monotonic() - started)
+            if self.stopping.is_set():
+                logger.warning("%s failed while stopping and is left in the inbox: %s", name, exc)
+                return
+            if job.attempt < self.retries:
+                delay = self.retry_seconds * 2 ** job.attempt
+                logger.warning("%s failed (attempt %d), retrying in %.1f s: %s", name, job.attempt + 1, delay, exc)
+                self.metrics.counts['retried'] += 1
+                retry = asyncio.create_task(self._retry(job, delay))
+                self.pending_retries.add(retry)
+                retry.add_done_callback(self.pending_retries.discard)
+                return
+            logger.error("%s failed after %d attempts: %s", name, job.attempt + 1, exc)
+            self.metrics.counts['failed'] += 1
+            self._archive(job.path, FAILED_DIR, error=f"{type(exc).__name__}: {exc}")
+        else:
+            finished = time.monotonic()
+            self.metrics.record('run', finished - started)
+            self.metrics.record('latency', finished - job.discovered)
+            self.metrics.counts['completed'] += 1
+            self._archive(job.path, PROCESSED_DIR)
+            logger.info("%s billed to %s: %d rows, waited %.1f s, ran %.1f s, queue depth %d", name, excel_path,
+                        rows, started - job.discovered, finished - started, self.queue.qsize())
+        finally:
+            self.reports_in_progress.discard(os.path.basename(excel_path))
+
+    async def _retry(self, job, delay):
+        """Queue a failed job again after delay seconds."""
+        await asyncio.sleep(delay)
+        await self._enqueue(job._replace(attempt=job.attempt + 1))
+
+    def _archive(self, path, folder, error=None):
+        """Move a finished extract into a folder of the inbox, with a text file holding the error if it failed.
+
+        An extract whose name is already in the folder gets a numbered name, as in unique_path.
+        An extract that cannot be moved, e.g. because it is open elsewhere, is not offered again
+        until the watcher restarts.
+        """
+        target = unique_path(os.path.join(self.inbox, folder), os.path.basename(path))
+        try:
+            os.replace(path, target)
+        except OSError as exc:
+            logger.error("could not move %s to %s: %s", path, folder, exc)
+            return
+        self.scanner.forget(path)
+        if error is not None:
+            with open(target + '.error.txt', 'w') as f:
+                f.write(error + '\n')
+
+    def _save_status(self):
+        """Save the current metrics to the outbox, replacing the previous status file in one step."""
+        status_path = os.path.join(self.outbox, STATUS_FILE)
+        with open(status_path + PARTIAL_SUFFIX, 'w') as f:
+            json.dump(self.metrics.to_dict(), f, indent=2)
+        os.replace(status_path + PARTIAL_SUFFIX, status_path)
@@ -0,0 +1,195 @@
+"""XlsxWriter backend for report workbooks, writing every sheet in constant_memory mode.
+
+It produces the same layout as the openpyxl backend in report_writer. In constant_memory mode each
+row is flushed to a temporary file as soon as the next row is started, so memory stays flat, but
+every sheet has to be written from top to bottom.
+"""
+import math
+from datetime import datetime
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from report_writer import (BORDER_COLOR, BORDER_NONE, BORDER_THICK_BOTTOM, BORDER_THICK_LEFT, BORDER_THICK_RIGHT,
+                           BORDER_THICK_TOP, BORDER_TOTAL, CURRENCY_FORMAT, DETAIL_CURRENCY_COLS, DETAIL_NUMBER_COLS,
+                           FONT_BOLD, FONT_RED, FORMAT_CURRENCY, FORMAT_PERCENTAGE, INDEX_COLUMNS, PERCENTAGE_FORMAT,
+                           SPACER_ROW_HEIGHT, SUMMARY_FIRST_COL, SUMMARY_HEADER_ROW, SUMMARY_TITLE_RANGE,
+                           plan_summary_styles, summary_display_values)
+
+# XlsxWriter format properties matching the openpyxl fonts, fills and borders of report_writer
+TITLE_PROPERTIES = {'bold': True, 'underline': 1, 'font_size': 14}
+HEADER_PROPERTIES = {
+    'pattern': 1,
+    'bg_color': '#000099',
+    'font_color': '#FFFFFF',
+    'align': 'center',
+    'border': 1,
+    'border_color': '#' + BORDER_COLOR
+}
+RED_COLOR = '#FF0000'
+BLUE_COLOR = '#0000FF'
+BLACK_COLOR = '#000000'
+THIN_BORDER = 1
+THICK_BORDER = 5
+
+# openpyxl's default number format for datetimes, used for the signal date columns
+DATE_FORMAT = 'yyyy-mm-dd h:mm:ss'
+
+
+def _summary_properties(key):
+    """Return the XlsxWriter format properties for one Summary style plan key."""
+    number_code, font_code, border_code = key
+    properties = {}
+    if number_code == FORMAT_CURRENCY:
+        properties['num_format'] = CURRENCY_FORMAT
+    elif number_code == FORMAT_PERCENTAGE:
+        properties['num_format'] = PERCENTAGE_FORMAT
+    if font_code == FONT_RED:
+        properties['font_color'] = RED_COLOR
+    elif font_code == FONT_BOLD:
+        properties['bold'] = True
+    if border_code == BORDER_TOTAL:
+        properties.update(top=THIN_BORDER, top_color=BLACK_COLOR, bottom=THICK_BORDER, bottom_color=BLACK_COLOR)
+    elif border_code != BORDER_NONE:
+        for side, thick_flag in (('left', BORDER_THICK_LEFT), ('right', BORDER_THICK_RIGHT),
+                                 ('top', BORDER_THICK_TOP), ('bottom', BORDER_THICK_BOTTOM)):
+            thick = border_code & thick_flag
+            properties[side] = THICK_BORDER if thick else THIN_BORDER
+            properties[f'{side}_color'] = BLACK_COLOR if thick else '#' + BORDER_COLOR
+    return properties
+
+
+def _write_value(ws, row, col, value, cell_format):
+    """Write one value with the XlsxWriter method for its type; missing values become blank cells."""
+    if isinstance(value, str):
+        ws.write_string(row, col, value, cell_format)
+    elif value is None or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        ws.write_blank(row, col, None, cell_format)
+    elif isinstance(value, (bool, np.bool_)):
+        ws.write_boolean(row, col, bool(value), cell_format)
+    elif isinstance(value, (int, float, np.number)):
+        ws.write_number(row, col, value, cell_format)
+    elif isinstance(value, datetime):
+        ws.write_datetime(row, col, value, cell_format)
+    else:
+        ws.write(row, col, value, cell_format)
+
+
+class XlsxWriterReportWorkbook:
+    """Report workbook written by XlsxWriter in constant_memory mode."""
+
+    def __init__(self, excel_path):
+        try:
+            import xlsxwriter
+        except ImportError:
+            raise ImportError("The xlsxwriter writer backend requires the XlsxWriter package (pip install XlsxWriter)")
+        self.excel_path = excel_path
+        self.wb = xlsxwriter.Workbook(excel_path, {'constant_memory': True})
+        self.formats = {}
+        self.blank_format = self.wb.add_format()
+
+    def _format(self, **properties):
+        """Return the shared Format for a set of properties, or None when there are none."""
+        if not properties:
+            return None
+        key = tuple(sorted(properties.items()))
+        if key not in self.formats:
+            self.formats[key] = self.wb.add_format(properties)
+        return self.formats[key]
+
+    def add_sheet(self, title):
+        """Add an empty worksheet and return it."""
+        return self.wb.add_worksheet(title)
+
+    def write_summary(self, ws, summary_df, title):
+        """Write the styled Summary top to bottom: title, header, spacer, data, blank and 'Total' rows.
+
+        summary_df must already end with the blank row and the 'Total' row.
+        """
+        style_ids, keys = plan_summary_styles(summary_df)
+        formats = [self._format(**_summary_properties(key)) for key in keys]
+        first_col = SUMMARY_FIRST_COL - 1
+        ws.hide_gridlines(2)
+
+        # Add title row
+        ws.merge_range(SUMMARY_TITLE_RANGE, title, self._format(**TITLE_PROPERTIES))
+
+        # Header row with fill, font color, centered text and borders
+        header_format = self._format(**HEADER_PROPERTIES)
+        for col, col_name in enumerate(summary_df.columns.tolist(), first_col):
+            ws.write_string(SUMMARY_HEADER_ROW - 1, col, col_name, header_format)
+
+        # A row is only flushed with its height in constant_memory mode if it holds a cell
+        spacer_row = SUMMARY_HEADER_ROW
+        ws.set_row(spacer_row, SPACER_ROW_HEIGHT)
+        ws.write_blank(spacer_row, first_col, None, self.blank_format)
+
+        # Data, blank and 'Total' rows
+        first_data_row = spacer_row + 1
+        ws.set_row(first_data_row + len(summary_df) - 2, SPACER_ROW_HEIGHT)
+        values = summary_display_values(summary_df)
+        for row, (row_values, row_ids) in enumerate(zip(values.itertuples(index=False, name=None), style_ids),
+                                                    first_data_row):
+            for col, (value, style_id) in enumerate(zip(row_values, row_ids), first_col):
+                if value is not None or formats[style_id] is not None:
+                    _write_value(ws, row, col, value, formats[style_id])
+
+    def write_detail(self, ws, df, currency_cols=DETAIL_CURRENCY_COLS, numeric_cols=DETAIL_NUMBER_COLS):
+        """Write the detail rows, with the 'Active' rows in blue, and return their number.
+
+        df is a DataFrame or an iterable of DataFrame chunks sharing the same columns.
+        """
+        chunks = iter([df]) if hasattr(df, 'itertuples') else iter(df)
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            return 0
+        columns = first_chunk.columns.tolist()
+        for col, col_name in enumerate(columns):
+            ws.write_string(0, col, col_name)
+
+        # One format per column for inactive rows and one for active rows
+        plain_formats = []
+        active_formats = []
+        for col_name, dtype in first_chunk.dtypes.items():
+            properties = {}
+            if col_name in currency_cols:
+                properties['num_format'] = CURRENCY_FORMAT
+            elif col_name in numeric_cols:
+                properties['num_format'] = '0'
+            elif pd.api.types.is_datetime64_any_dtype(dtype):
+                properties['num_format'] = DATE_FORMAT
+            plain_formats.append(self._format(**properties))
+            active_formats.append(self._format(font_color=BLUE_COLOR, **properties))
+
+        device_active_index = columns.index('DeviceActive')
+        row = 1
+        for chunk in chain([first_chunk], chunks):
+            for values in chunk.itertuples(index=False, name=None):
+                formats = active_formats if values[device_active_index] == 'Active' else plain_formats
+                for col, (value, cell_format) in enumerate(zip(values, formats)):
+                    _write_value(ws, row, col, value, cell_format)
+                row += 1
+        return row - 1
+
+    def write_index(self, ws, entries):
+        """Write the index of a sharded report: one linked row per (label, rows, link) entry.
+
+        A link starting with '#' is a location in the same workbook; any other link is a file path.
+        """
+        header_format = self._format(**HEADER_PROPERTIES)
+        for col, col_name in enumerate(INDEX_COLUMNS):
+            ws.write_string(0, col, col_name, header_format)
+        for row, (label, rows, link) in enumerate(entries, 1):
+            url = 'internal:' + link[1:] if link.startswith('#') else 'external:' + link
+            ws.write_url(row, 0, url, string=label)
+            ws.write_number(row, 1, rows)
+            ws.write_string(row, 2, link.lstrip('#'))
+
+    def set_properties(self, properties):
+        """Add a custom document property, holding text, for every name and value in properties."""
+        for name, value in properties.items():
+            self.wb.set_custom_property(name, value)
+
+    def save(self):
+        self.wb.close()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules live flat in src/, as they are installed by setup.py's py_modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
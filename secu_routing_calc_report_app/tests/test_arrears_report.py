@@ -0,0 +1,62 @@
+"""Chunked reports against whole-file reports."""
+import pandas as pd
+import pytest
+
+from arrears_report import billing_dates, build_report, stream_report
+from extract_reader import DATE_COLUMNS, iter_extract_chunks, read_extract
+
+# pandas warns that the day-first format was guessed without dayfirst=True
+pytestmark = pytest.mark.filterwarnings('ignore:Parsing dates in')
+
+CHUNKSIZE = 4
+
+YEAR = billing_dates('April - September')[1].year
+
+# Dates fall in the year both billing windows end ({year}) and the year before. They are
+# day-first: each column's format is guessed from its first value in the first chunk ('13/...'
+# and '25/...' can only be day-first) and used for every later chunk, so the ambiguous
+# '05/06/{year}' in the third chunk is 5 June
+ROWS = [
+    ('13/04/{year}', '', '17300', 99.0, 'S010', 'Durban'),
+    ('01/04/{year}', '25/06/{year}', '17300', 99.0, 'S002', 'Durban'),
+    ('02/03/{year}', '10/09/{year}', '15300', 120.5, 'S002', 'Durban'),
+    ('15/04/{year}', '28/09/{year}', '17300', 99.0, 'S007', 'Cape Town'),
+    # S007 continues in the second chunk
+    ('20/04/{year}', '01/05/{year}', '15300', 120.5, 'S007', ''),
+    ('11/11/{previous}', '12/12/{previous}', '17300', 99.0, 'S010', 'Durban'),
+    ('03/04/{year}', '04/08/{year}', '17400', 80.0, 'S002', 'Durban'),
+    ('06/05/{year}', '07/07/{year}', '17300', 150.0, 'S100', 'Pretoria'),
+    ('31/03/{year}', '30/09/{year}', '15300', 120.5, 'S007', 'Cape Town'),
+    ('', '09/08/{year}', '17300', 99.0, 'S010', 'Durban'),
+    ('08/04/{year}', '05/06/{year}', '17300', 99.0, '', 'Durban'),
+    ('01/01/{year}', '02/04/{year}', '15300', 120.5, 'S100', 'Pretoria'),
+    ('12/04/{year}', '12/05/{year}', '17300', 99.0, 'S002', 'Durban'),
+]
+
+
+@pytest.fixture
+def extract(tmp_path):
+    path = tmp_path / 'extract.csv'
+    rows = [[value.format(year=YEAR, previous=YEAR - 1) if isinstance(value, str) else value for value in row]
+            for row in ROWS]
+    pd.DataFrame(rows, columns=['FirstSignalDate', 'LastSignalDate', 'ItemCode', 'Amount', 'SabreCode',
+                                'Branch']).to_csv(path, index=False)
+    return str(path)
+
+
+def test_chunks_parse_dates_as_the_whole_file_does(extract):
+    chunks = list(iter_extract_chunks(extract, CHUNKSIZE))
+    assert len(chunks) > 2
+    df = read_extract(extract)
+    for col in DATE_COLUMNS:
+        dates = pd.concat([chunk[col] for chunk in chunks], ignore_index=True)
+        pd.testing.assert_series_equal(dates, df[col], check_dtype=False)
+    assert df['LastSignalDate'][10] == pd.Timestamp(YEAR, 6, 5)
+
+
+@pytest.mark.parametrize('date_option', ['April - September', 'October - March'])
+def test_stream_report_matches_whole_file_summary(extract, tmp_path, date_option):
+    summary_df, _ = build_report(extract, date_option)
+    streamed = stream_report(extract, str(tmp_path / 'report.xlsx'), date_option, CHUNKSIZE)
+    assert (summary_df['TotalActive'] > 0).any()
+    pd.testing.assert_frame_equal(streamed, summary_df)
@@ -0,0 +1,137 @@
+"""BillingCache hits, misses, eviction and results against uncached runs."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import arrears_report  # noqa: E402
+import billing_cache  # noqa: E402
+from arrears_report import billing_dates, build_report  # noqa: E402
+from billing_cache import BillingCache  # noqa: E402
+
+PERIOD = 'April - September'
+
+
+def write_extract(path, n_rows=200, seed=0):
+    """Write a random extract of n_rows to path and return it as read back from the file."""
+    rng = np.random.default_rng(seed)
+    first = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 900, n_rows), unit='D')
+    last = first + pd.to_timedelta(rng.integers(0, 300, n_rows), unit='D')
+    df = pd.DataFrame({
+        'DeviceId': np.arange(n_rows),
+        'FirstSignalDate': first.strftime('%Y-%m-%d'),
+        'LastSignalDate': last.strftime('%Y-%m-%d'),
+        'ItemCode': rng.choice(['17300', '15300', '17400'], n_rows),
+        'Amount': rng.choice([99.0, 120.5, 150.0], n_rows),
+        'SabreCode': [f'S{code:03d}' for code in rng.integers(0, 40, n_rows)],
+        'Branch': [f'Branch {code}' for code in rng.integers(0, 5, n_rows)]
+    })
+    df.to_csv(path, index=False)
+    return df
+
+
+def count_classified(monkeypatch):
+    """Count the rows billing_cache classifies itself rather than taking from the cache."""
+    counted = []
+    classify_devices = billing_cache.classify_devices
+
+    def counting(df, *args, **kwargs):
+        counted.append(len(df))
+        return classify_devices(df, *args, **kwargs)
+
+    monkeypatch.setattr(billing_cache, 'classify_devices', counting)
+    return counted
+
+
+def test_same_content_and_window_is_a_hit(tmp_path, monkeypatch):
+    csv_file_path = str(tmp_path / 'extract.csv')
+    write_extract(csv_file_path)
+    cache = BillingCache(str(tmp_path / 'cache'))
+    first_summary, first_rows = build_report(csv_file_path, PERIOD, cache=cache)
+
+    # A copy of the extract under another name has the same content, so it is not read again
+    copy_path = str(tmp_path / 'copy.csv')
+    with open(csv_file_path, 'rb') as src, open(copy_path, 'wb') as dst:
+        dst.write(src.read())
+
+    def no_read(*args, **kwargs):
+        raise AssertionError('the extract was read on a cache hit')
+
+    monkeypatch.setattr(arrears_report, 'read_extract', no_read)
+    summary_df, df_filtered = build_report(copy_path, PERIOD, cache=cache)
+    pd.testing.assert_frame_equal(summary_df, first_summary)
+    pd.testing.assert_frame_equal(df_filtered, first_rows)
+
+
+def test_changed_amount_misses_only_its_partition(tmp_path, monkeypatch):
+    csv_file_path = str(tmp_path / 'extract.csv')
+    df = write_extract(csv_file_path)
+    cache = BillingCache(str(tmp_path / 'cache'))
+    start_date, end_date, cutoff_date = billing_dates(PERIOD)
+    key = cache.report_key(csv_file_path, start_date, end_date, cutoff_date)
+    build_report(csv_file_path, PERIOD, cache=cache)
+    assert cache.load_report(key) is not None
+
+    df.loc[7, 'Amount'] += 1
+    df.to_csv(csv_file_path, index=False)
+    assert cache.report_key(csv_file_path, start_date, end_date, cutoff_date) != key
+
+    counted = count_classified(monkeypatch)
+    build_report(csv_file_path, PERIOD, cache=cache)
+    assert counted == [(df['SabreCode'] == df.loc[7, 'SabreCode']).sum()]
+
+
+def test_changed_window_misses(tmp_path, monkeypatch):
+    csv_file_path = str(tmp_path / 'extract.csv')
+    write_extract(csv_file_path)
+    cache = BillingCache(str(tmp_path / 'cache'))
+    build_report(csv_file_path, PERIOD, cache=cache)
+
+    start_date, end_date, cutoff_date = billing_dates(PERIOD)
+    other_start, other_end, other_cutoff = billing_dates('October - March')
+    key = cache.report_key(csv_file_path, start_date, end_date, cutoff_date)
+    assert cache.report_key(csv_file_path, other_start, other_end, other_cutoff) != key
+    assert cache.report_key(csv_file_path, start_date, end_date + pd.Timedelta(days=1), cutoff_date) != key
+
+    counted = count_classified(monkeypatch)
+    build_report(csv_file_path, 'October - March', cache=cache)
+    assert sum(counted) == 200
+
+
+def test_eviction_removes_least_recently_used_items(tmp_path):
+    cache = BillingCache(str(tmp_path / 'cache'), max_bytes=10 ** 9)
+    frame = pd.DataFrame({'value': np.arange(1000)})
+    for number, key in enumerate(['old', 'middle', 'new']):
+        cache._store(key, {'rows': frame})
+        os.utime(cache._item_dir(key), (1000 + number, 1000 + number))
+    item_bytes = os.path.getsize(os.path.join(cache._item_dir('old'), 'rows.parquet'))
+
+    # Loading an item marks it as recently used
+    assert cache._load('old', ['rows']) is not None
+    cache.max_bytes = 2 * item_bytes
+    cache.evict()
+    assert sorted(os.listdir(cache.cache_dir)) == ['new', 'old']
+
+
+@pytest.mark.parametrize('period', ['April - September', 'October - March'])
+def test_cached_runs_match_an_uncached_run(tmp_path, period):
+    csv_file_path = str(tmp_path / 'extract.csv')
+    df = write_extract(csv_file_path, n_rows=500, seed=1)
+    cache = BillingCache(str(tmp_path / 'cache'), partitions=8)
+
+    def check():
+        summary_df, df_filtered = build_report(csv_file_path, period)
+        for _ in range(2):
+            cached_summary, cached_rows = build_report(csv_file_path, period, cache=cache)
+            pd.testing.assert_frame_equal(cached_summary, summary_df)
+            pd.testing.assert_frame_equal(cached_rows, df_filtered)
+
+    check()
+    # A corrected extract mixes cached and recomputed partitions
+    df.loc[[3, 250], 'LastSignalDate'] = '2025-08-30'
+    df.loc[100, 'Amount'] = 1.0
+    df.to_csv(csv_file_path, index=False)
+    check()
@@ -0,0 +1,86 @@
+"""Billing engine results, checked against the row-wise computation classify_devices replaced."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from billing_engine import (DATE_OPTIONS, billing_period, build_summary, classify_devices, option_period,
+                            resolve_billing_window)
+
+YEAR = 2025
+
+
+def legacy_classify(df, date_option, current_year=YEAR):
+    """The original apply-based DeviceActive, DaysActive, MonthsActive and Fee ex VAT computation."""
+    start_date, end_date = resolve_billing_window(date_option, current_year)
+    df['DeviceActive'] = 'Inactive'
+    df.loc[
+        (df['LastSignalDate'] > start_date) &
+        (df['LastSignalDate'] < end_date) &
+        ((df['LastSignalDate'] - df['FirstSignalDate']).dt.days > 10) &
+        (df['ItemCode'].isin(['17300', '15300'])),
+        'DeviceActive'
+    ] = 'Active'
+
+    df['DaysActive'] = 0
+    df.loc[
+        df['DeviceActive'] == 'Active',
+        'DaysActive'
+    ] = df.apply(
+        lambda row: (row['LastSignalDate'] - row['FirstSignalDate']).days
+        if row['FirstSignalDate'] > pd.Timestamp(f'{current_year}-03-30')
+        else (row['LastSignalDate'] - start_date).days, axis=1
+    )
+    df['MonthsActive'] = (df['DaysActive'] / 30).apply(lambda x: -(-x // 1))
+    df['Fee ex VAT'] = df['MonthsActive'] * df['Amount']
+
+
+def fixed_extract():
+    """A small extract covering both windows, the cutoff, missing dates and time-of-day values."""
+    rows = [
+        ('2024-09-01', '2024-12-15', '17300', 99.0),
+        ('2024-10-20', '2025-03-30 17:45:10', '15300', 120.5),
+        ('2025-03-29 23:59:59', '2025-03-30 08:00:00', '17300', 99.0),
+        ('2025-03-31 06:30:00', '2025-06-01 00:00:01', '17300', 99.0),
+        ('2025-03-31', '2025-04-10', '15300', 120.5),
+        ('2025-03-31', '2025-04-11 12:00:00', '15300', 120.5),
+        ('2025-04-02', '2025-09-29 23:00:00', '17300', None),
+        ('2025-01-01', '2025-09-30', '17300', 99.0),
+        ('2025-02-01', '2025-08-15', '17400', 80.0),
+        (None, '2025-07-01', '17300', 99.0),
+        ('2025-05-01', None, '15300', 120.5),
+        (None, None, '17300', 99.0),
+        ('2024-10-01 10:00:00', '2025-01-31 09:00:00', '15300', 120.5),
+        ('2023-05-05', '2025-02-28', '99000', 50.0),
+    ]
+    df = pd.DataFrame(rows, columns=['FirstSignalDate', 'LastSignalDate', 'ItemCode', 'Amount'])
+    for col in ['FirstSignalDate', 'LastSignalDate']:
+        df[col] = pd.to_datetime(df[col], format='ISO8601')
+    return df
+
+
+@pytest.mark.parametrize('date_option', DATE_OPTIONS)
+def test_classify_devices_matches_legacy_apply(date_option):
+    expected = fixed_extract()
+    legacy_classify(expected, date_option)
+
+    actual = fixed_extract()
+    start_date, end_date = resolve_billing_window(date_option, YEAR)
+    period = billing_period(start_date, end_date, cutoff_date=f'{YEAR}-03-30')
+    classify_devices(actual, period.start_date, period.end_date, period.cutoff_date)
+
+    assert (expected['DeviceActive'] == 'Active').any()
+    assert actual['DeviceActive'].tolist() == expected['DeviceActive'].tolist()
+    np.testing.assert_array_equal(actual['DaysActive'].to_numpy(), expected['DaysActive'].to_numpy(dtype=np.int64))
+    np.testing.assert_array_equal(actual['MonthsActive'].to_numpy(), expected['MonthsActive'].to_numpy(dtype=float))
+    np.testing.assert_array_equal(actual['Fee ex VAT'].to_numpy(), expected['Fee ex VAT'].to_numpy(dtype=float))
+
+
+def test_summary_sorts_numeric_sabre_codes_as_numbers():
+    df = fixed_extract().iloc[:4]
+    df['SabreCode'] = pd.Series(['10', '9', '100', '9'], dtype='category')
+    df['Branch'] = 'Durban'
+    period = option_period('October - March', YEAR)
+    classify_devices(df, period.start_date, period.end_date, period.cutoff_date)
+
+    summary_df = build_summary(df)
+    assert summary_df['SabreCode'].tolist()[:3] == ['9', '10', '100']
@@ -0,0 +1,75 @@
+"""DeviceStore save and load round trips."""
+import numpy as np
+import pandas as pd
+
+from billing_engine import build_summary, classify_devices, option_period
+from device_store import STORE_MAGIC, DeviceStore
+from tariff import DEFAULT_TARIFF, Tariff, TariffRule
+
+UNROUNDED_TARIFF = Tariff([
+    TariffRule('17300', '17300', 10, 30, 'none', 'base'),
+    TariffRule('15300', '15300', 10, 30, 'ceil', 'share')
+])
+
+
+def classified_extract(tariff):
+    """A small extract classified for April - September 2025 by tariff."""
+    df = pd.DataFrame({
+        'FirstSignalDate': pd.to_datetime(['2025-04-02', '2025-03-31', '2025-05-01', None, '2025-01-01']),
+        'LastSignalDate': pd.to_datetime(['2025-06-18', '2025-04-30', '2025-09-01', '2025-07-01', '2025-08-15']),
+        'ItemCode': ['17300', '17300', '15300', '17300', '17400'],
+        'Amount': [99.0, 99.0, 120.5, 99.0, 80.0],
+        'SabreCode': ['S001', 'S002', 'S001', 'S003', 'S002'],
+        'Branch': ['Durban', 'Durban', 'Cape Town', None, 'Cape Town'],
+        'Client': ['Ölfontein', 'b', None, 'd', 'Ölfontein']
+    })
+    period = option_period('April - September', 2025)
+    classify_devices(df, period.start_date, period.end_date, period.cutoff_date, tariff)
+    return df
+
+
+def test_round_trip_keeps_fractional_months(tmp_path):
+    df = classified_extract(UNROUNDED_TARIFF)
+    assert (df['MonthsActive'] % 1 != 0).any()
+
+    path = DeviceStore.from_frame(df).save(str(tmp_path / 'run.store'))
+    store = DeviceStore.load(path)
+    try:
+        devices = store.devices()
+        np.testing.assert_array_equal(devices['MonthsActive'].to_numpy(), df['MonthsActive'].to_numpy())
+        np.testing.assert_array_equal(devices['Fee ex VAT'].to_numpy(), df['Fee ex VAT'].to_numpy())
+        assert devices['DeviceActive'].tolist() == df['DeviceActive'].tolist()
+        assert devices['Client'].tolist() == df['Client'].tolist()
+    finally:
+        store.close()
+
+
+def test_round_trip_keeps_category_tables_out_of_the_header(tmp_path):
+    df = classified_extract(UNROUNDED_TARIFF)
+    path = DeviceStore.from_frame(df).save(str(tmp_path / 'run.store'))
+    with open(path, 'rb') as f:
+        f.read(len(STORE_MAGIC))
+        assert int.from_bytes(f.read(8), 'little') < 4096
+
+    store = DeviceStore.load(path)
+    buffer = store._buffer
+    devices = store.devices(sabre_code='S002')
+    assert devices.index.tolist() == [1, 4]
+    assert devices['Client'].tolist() == ['b', 'Ölfontein']
+    assert store.devices()['Branch'].fillna('').tolist() == ['Durban', 'Durban', 'Cape Town', '', 'Cape Town']
+    assert store.categories('Client') == ['b', 'd', 'Ölfontein']
+    store.close()
+    assert buffer.closed
+
+
+def test_sabre_code_totals_follow_the_summary_order():
+    df = pd.concat([classified_extract(DEFAULT_TARIFF)] * 2, ignore_index=True)
+    df = df[df['ItemCode'] != '17400'].reset_index(drop=True)
+    df['SabreCode'] = ['10', '100', '2', '3', '9', '10', '2', '9']
+
+    totals = DeviceStore.from_frame(df).totals('SabreCode')
+    summary_df = build_summary(df).iloc[:-2]
+    assert totals['SabreCode'].tolist() == ['2', '3', '9', '10', '100']
+    assert totals['SabreCode'].tolist() == summary_df['SabreCode'].tolist()
+    np.testing.assert_array_equal(totals['TotalActive'].to_numpy(), summary_df['TotalActive'].to_numpy())
+    np.testing.assert_array_equal(totals['Total_ex_VAT'].to_numpy(), summary_df['Total_ex_VAT'].to_numpy())
@@ -0,0 +1,137 @@
+"""Reconciliation joins and changes between two billing runs."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from arrears_report import billing_dates
+from reconcile import (CHANGE_ADDED, CHANGE_CHANGED, CHANGE_NOW_ACTIVE, CHANGE_REMOVED, _occurrences, join_rows,
+                       load_run, reconcile)
+
+YEAR = billing_dates('April - September')[1].year
+
+
+def reference_join(previous_keys, current_keys):
+    """Pair the rows of two runs by (key, occurrence of the key within its run), one key at a time."""
+    def numbered(keys):
+        seen = {}
+        rows = {}
+        for row, key in enumerate(keys):
+            rows[(key, seen.get(key, 0))] = row
+            seen[key] = seen.get(key, 0) + 1
+        return rows
+
+    previous, current = numbered(previous_keys), numbered(current_keys)
+    order = list(previous) + [key for key in current if key not in previous]
+    return [(previous.get(key, -1), current.get(key, -1)) for key in order]
+
+
+def run(rows):
+    """A classified run from (DeviceId, SabreCode, Branch, DeviceActive, DaysActive, Fee ex VAT) rows."""
+    return pd.DataFrame(rows, columns=['DeviceId', 'SabreCode', 'Branch', 'DeviceActive', 'DaysActive',
+                                       'Fee ex VAT'])
+
+
+def test_occurrences_count_earlier_equal_codes():
+    np.testing.assert_array_equal(_occurrences(np.array([5, 3, 5, 5, 3, -1, -1])), [0, 0, 1, 2, 1, 0, 1])
+    assert len(_occurrences(np.empty(0, dtype=np.int64))) == 0
+
+
+def test_join_rows_pairs_duplicates_by_occurrence():
+    # Device 1 of SabreCode 0 is listed three times before and once after, device 2 twice after;
+    # device 3 is only in the previous run, device 4 only in the current one
+    previous = [(1, 0), (2, 0), (1, 0), (3, 1), (1, 0), (1, 1)]
+    current = [(2, 0), (1, 1), (4, 0), (1, 0), (2, 0)]
+    previous_rows, current_rows = join_rows(
+        np.array([device for device, _ in previous]), np.array([device for device, _ in current]),
+        np.array([sabre for _, sabre in previous]), np.array([sabre for _, sabre in current]))
+    assert list(zip(previous_rows.tolist(), current_rows.tolist())) == reference_join(previous, current)
+
+
+def test_join_rows_matches_reference_on_random_keys():
+    rng = np.random.default_rng(0)
+    previous_devices, current_devices = rng.integers(-1, 30, 400), rng.integers(-1, 30, 350)
+    previous_sabre, current_sabre = rng.integers(-1, 4, 400), rng.integers(-1, 4, 350)
+    previous_rows, current_rows = join_rows(previous_devices, current_devices, previous_sabre, current_sabre)
+    assert list(zip(previous_rows.tolist(), current_rows.tolist())) == reference_join(
+        list(zip(previous_devices.tolist(), previous_sabre.tolist())),
+        list(zip(current_devices.tolist(), current_sabre.tolist())))
+
+
+def test_reconcile_lists_added_removed_and_changed_devices():
+    previous = run([
+        (1, 'S1', 'Durban', 'Active', 40, 198.0),
+        (1, 'S1', 'Durban', 'Active', 40, 198.0),
+        (2, 'S1', 'Durban', 'Inactive', 0, 0.0),
+        (3, 'S2', 'Pretoria', 'Active', 70, 297.0),
+        (5, 'S2', 'Pretoria', 'Active', 10, 99.0)
+    ])
+    current = run([
+        (1, 'S1', 'Durban', 'Active', 40, 198.0),
+        (2, 'S1', 'Durban', 'Active', 15, 99.0),
+        (3, 'S2', 'Pretoria', 'Active', 70, 240.0),
+        (4, 'S3', 'Cape Town', 'Active', 20, 120.5),
+        (5, 'S2', 'Pretoria', 'Active', 10, 99.0)
+    ])
+    result = reconcile(previous, current)
+
+    changes = result.device_changes.set_index('DeviceId')
+    assert changes['Change'].astype(str).to_dict() == {
+        1: CHANGE_REMOVED, 2: CHANGE_NOW_ACTIVE, 3: CHANGE_CHANGED, 4: CHANGE_ADDED}
+    assert changes.loc[3, 'Fee ex VAT Change'] == -57.0
+    assert changes.loc[4, 'Previous Fee ex VAT'] == 0.0
+
+    deltas = result.sabre_deltas.set_index('SabreCode')
+    assert deltas.index.tolist() == ['S1', 'S2', 'S3', 'Total']
+    assert deltas.loc['S1', 'TotalActive Change'] == 0
+    assert deltas.loc['S1', 'Total_ex_VAT Change'] == -99.0
+    assert deltas.loc['S3', 'Branch'] == 'Cape Town'
+    assert deltas.loc['Total', 'Total_ex_VAT Change'] == current['Fee ex VAT'].sum() - previous['Fee ex VAT'].sum()
+    # The device changes of every SabreCode add up to its Total_ex_VAT change
+    by_sabre = result.device_changes.groupby('SabreCode', observed=True)['Fee ex VAT Change'].sum()
+    for sabre_code, change in by_sabre.items():
+        assert deltas.loc[sabre_code, 'Total_ex_VAT Change'] == pytest.approx(change)
+
+
+def test_reconcile_joins_categoricals_with_different_categories():
+    previous = run([(1, 'S1', 'Durban', 'Active', 40, 198.0), (2, 'S2', 'Pretoria', 'Active', 30, 99.0)])
+    current = run([(2, 'S2', 'Pretoria', 'Active', 30, 99.0), (3, 'S3', 'Cape Town', 'Active', 20, 120.5)])
+    plain = reconcile(previous, current)
+    for df in (previous, current):
+        for col in ('DeviceId', 'SabreCode', 'Branch'):
+            df[col] = df[col].astype('category')
+    assert previous['SabreCode'].cat.categories.tolist() != current['SabreCode'].cat.categories.tolist()
+
+    categorical = reconcile(previous, current)
+    assert categorical.device_changes['Change'].astype(str).tolist() == [CHANGE_REMOVED, CHANGE_ADDED]
+    for name in ('device_changes', 'sabre_deltas'):
+        expected, actual = getattr(plain, name), getattr(categorical, name)
+        assert actual.astype(str).values.tolist() == expected.astype(str).values.tolist()
+
+
+def write_extract(path, amounts, sabre_codes):
+    """Write an extract of active devices, one per amount, to path."""
+    n_rows = len(amounts)
+    pd.DataFrame({
+        'DeviceId': np.arange(n_rows),
+        'FirstSignalDate': [f'{YEAR}-04-02'] * n_rows,
+        'LastSignalDate': [f'{YEAR}-06-18'] * n_rows,
+        'ItemCode': ['17300'] * n_rows,
+        'Amount': amounts,
+        'SabreCode': sabre_codes,
+        'Branch': ['Durban'] * n_rows
+    }).to_csv(path, index=False)
+
+
+def test_changed_amount_in_a_corrected_extract(tmp_path):
+    write_extract(tmp_path / 'previous.csv', [99.0, 99.0, 120.5], ['S1', 'S1', 'S2'])
+    write_extract(tmp_path / 'current.csv', [99.0, 150.0, 120.5], ['S1', 'S1', 'S9'])
+    previous = load_run(str(tmp_path / 'previous.csv'))
+    current = load_run(str(tmp_path / 'current.csv'))
+    result = reconcile(previous, current)
+
+    changes = result.device_changes
+    assert changes[['DeviceId', 'SabreCode', 'Change']].astype(str).values.tolist() == [
+        ['1', 'S1', CHANGE_CHANGED], ['2', 'S2', CHANGE_REMOVED], ['2', 'S9', CHANGE_ADDED]]
+    months = previous['MonthsActive'].iloc[0]
+    assert changes['Fee ex VAT Change'].tolist() == [months * 51.0, -months * 120.5, months * 120.5]
+    assert result.sabre_deltas['SabreCode'].tolist() == ['S1', 'S2', 'S9', 'Total']
@@ -0,0 +1,14 @@
+"""Shard plans of the detail rows."""
+import pandas as pd
+
+from report_shards import plan_shards
+
+
+def test_sabrecode_shards_follow_numeric_code_order():
+    codes = ['2', '10', '9', '100', '3'] * 3
+    df = pd.DataFrame({'SabreCode': pd.Series(codes, dtype='category')})
+
+    shards = plan_shards(df, 'sabrecode', max_rows=8)
+    assert [label for label, _ in shards] == ['2 to 3', '9 to 10', '100']
+    for (label, positions), expected in zip(shards, [['2', '3'], ['9', '10'], ['100']]):
+        assert sorted(set(df['SabreCode'].iloc[positions]), key=int) == expected
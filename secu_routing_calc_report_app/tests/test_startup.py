@@ -0,0 +1,30 @@
+"""The GUI module must start without loading the heavy data libraries."""
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+GUI_MODULE = 'Secu_Routing_calc_report_app'
+
+# Modules the GUI must only load on its background preload thread
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'PIL', 'pyarrow', 'xlsxwriter']
+
+
+def imported_modules(module):
+    """Import module in a fresh interpreter with -X importtime and return the names it imported."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get('PYTHONPATH')])))
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               check=True, stderr=subprocess.PIPE, text=True, env=env)
+    names = set()
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith('import time:') and 'cumulative' not in line:
+            names.add(line.rsplit('|', 1)[1].strip())
+    return names
+
+
+def test_gui_import_loads_no_heavy_modules():
+    names = imported_modules(GUI_MODULE)
+    assert GUI_MODULE in names
+    assert sorted({name.split('.')[0] for name in names} & set(HEAVY_MODULES)) == []
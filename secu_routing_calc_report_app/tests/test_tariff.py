@@ -0,0 +1,16 @@
+"""Tariff rule lookups."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from tariff import DEFAULT_TARIFF
+
+
+@pytest.mark.parametrize('item_codes', [
+    pd.Series(['17300', '15300', '17400', None, '17300']),
+    pd.Series(['17300', '15300', '17400', None, '17300'], dtype='category'),
+    pd.Series([17300, 15300, 17400, None, 17300], dtype='Int64'),
+    pd.Series([17300, 15300, 17400, None, 17300], dtype=object)
+])
+def test_rule_index_converts_item_codes_to_str(item_codes):
+    np.testing.assert_array_equal(DEFAULT_TARIFF.rule_index(item_codes), [0, 1, -1, -1, 0])
@@ -0,0 +1,54 @@
+"""Watch-folder output and archive names."""
+import asyncio
+import os
+
+import pandas as pd
+import pytest
+
+from watch_folder import PROCESSED_DIR, FolderWatcher, unique_path
+
+
+def write_extract(path):
+    """Write a two-row extract to path, as CSV or Parquet by its extension."""
+    df = pd.DataFrame({
+        'FirstSignalDate': ['2025-04-02', '2025-05-01'],
+        'LastSignalDate': ['2025-06-18', '2025-09-01'],
+        'ItemCode': ['17300', '15300'],
+        'Amount': [99.0, 120.5],
+        'SabreCode': ['S001', 'S002'],
+        'Branch': ['Durban', 'Cape Town']
+    })
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def watch_once(inbox, outbox):
+    watcher = FolderWatcher(str(inbox), str(outbox), workers=1, poll_seconds=0.05, settle_seconds=0)
+    asyncio.run(watcher.run(once=True))
+    return watcher.metrics
+
+
+def test_unique_path_numbers_taken_names(tmp_path):
+    (tmp_path / 'a.xlsx').touch()
+    assert unique_path(str(tmp_path), 'b.xlsx') == os.path.join(str(tmp_path), 'b.xlsx')
+    assert unique_path(str(tmp_path), 'a.xlsx') == os.path.join(str(tmp_path), 'a_2.xlsx')
+    assert unique_path(str(tmp_path), 'a.xlsx', {'a_2.xlsx'}) == os.path.join(str(tmp_path), 'a_3.xlsx')
+
+
+def test_extracts_with_one_stem_keep_every_report(tmp_path):
+    pytest.importorskip('pyarrow')
+    inbox, outbox = tmp_path / 'inbox', tmp_path / 'outbox'
+    inbox.mkdir()
+    write_extract(str(inbox / 'a.csv'))
+    write_extract(str(inbox / 'a.parquet'))
+    assert watch_once(inbox, outbox).counts['completed'] == 2
+
+    # The same extract dropped again is billed to a new report and archived next to the first
+    write_extract(str(inbox / 'a.csv'))
+    assert watch_once(inbox, outbox).counts['completed'] == 1
+
+    assert sorted(name for name in os.listdir(outbox) if name.endswith('.xlsx')) == [
+        'a.xlsx', 'a_2.xlsx', 'a_3.xlsx']
+    assert sorted(os.listdir(inbox / PROCESSED_DIR)) == ['a.csv', 'a.parquet', 'a_2.csv']